@@ -0,0 +1 @@
+"""Benchmarks dos estágios do pipeline do dashboard."""
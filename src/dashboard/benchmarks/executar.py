@@ -0,0 +1,475 @@
+"""Benchmark dos estágios do pipeline com volume de dados e número de pacientes.
+
+Cada estágio (detecção, explicação das anomalias, segmentação de atividades,
+conversão do payload da API, alertas, motor de regras, visão da enfermaria e
+gráficos) roda fora do Streamlit sobre dados sintéticos de ``psm.simulador``.
+Para cada tamanho é medido o melhor tempo de ``--repeticoes`` execuções e o
+pico de memória (``tracemalloc``, numa execução separada para não distorcer o
+tempo). O expoente de escala é a
+inclinação de log(tempo) x log(linhas): ~1 é linear, ~0 é constante.
+
+Os resultados são gravados em JSON e comparados com a execução anterior do
+mesmo arquivo; estágios mais lentos que ``--limiar`` vezes são regressões.
+
+Uso (a partir de ``src/dashboard``)::
+
+    python -m benchmarks.executar
+    python -m benchmarks.executar --linhas 1000 10000 --pacientes 1 10 --estagios tick_frota
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from psm.alertas import LIMITES_PADRAO, verificar_alertas
+from psm.cache import CachePacientes
+from psm.anomalias import explicar_anomalias
+from psm.atividades import processar_atividades
+from psm.conversao import converter_dados_api
+from psm.deteccao import (
+    COLUNAS_VITAIS,
+    DetectorAnomalias,
+    ajustar_modelos,
+    detectar_anomalias_lote,
+)
+from psm.enfermaria import PainelEnfermaria
+from psm.graficos import create_anomaly_chart, create_vital_chart
+from psm.historico import HistoricoPaciente
+from psm.regras import MotorAlertas
+from psm.simulador import gerar_sinais
+from psm.treino import AgendadorTreinos
+from psm.triagem import TriagemEstatistica
+from psm.vizinhanca import IndiceLOF
+
+SAIDA_PADRAO = Path(__file__).parent / "resultados" / "ultima.json"
+LINHAS_PADRAO = [1_000, 10_000, 100_000, 1_000_000]
+PACIENTES_PADRAO = [1, 10, 100, 500]
+INTERVALO = pd.Timedelta("10s")
+INICIO = pd.Timestamp("2024-01-01")
+LOTE_TICK = 8
+JANELA_TREINO = 5_000
+
+
+def dados_sinais(linhas, semente=0):
+    rng = np.random.default_rng(semente)
+    timestamps = pd.date_range(INICIO, periods=linhas, freq=INTERVALO)
+    return gerar_sinais(rng, timestamps)
+
+
+def dados_detectados(linhas, semente=0):
+    # Rótulos sorteados: os estágios seguintes não dependem do modelo
+    df = dados_sinais(linhas, semente)
+    rng = np.random.default_rng(semente + 1)
+    df["Anomalia_IF"] = np.where(rng.random(linhas) < 0.1, -1, 1)
+    df["Anomalia_LOF"] = np.where(rng.random(linhas) < 0.1, -1, 1)
+    return df
+
+
+def payload_api(linhas, semente=0):
+    """Payload no formato do HCGateway com ``linhas`` amostras de batimento."""
+    df = dados_sinais(linhas, semente)
+    iso = df["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%S.000Z").tolist()
+    bpm = df["batimento_cardiaco"].tolist()
+
+    # Registros de batimento agrupam 6 amostras (1 minuto), SpO2 a cada
+    # minuto e pressão a cada 15 minutos, como no relógio.
+    heart_rate = [
+        {
+            "start": iso[i],
+            "data": {
+                "samples": [
+                    {"time": iso[j], "beatsPerMinute": bpm[j]}
+                    for j in range(i, min(i + 6, linhas))
+                ]
+            },
+        }
+        for i in range(0, linhas, 6)
+    ]
+    oxigenio = df["oxigenio"].tolist()
+    oxygen = [
+        {"start": iso[i], "data": {"percentage": oxigenio[i]}}
+        for i in range(0, linhas, 6)
+    ]
+    sistolica = df["pressao_sistolica"].tolist()
+    diastolica = df["pressao_diastolica"].tolist()
+    pressure = [
+        {
+            "start": iso[i],
+            "data": {
+                "systolic": {"inMillimetersOfMercury": sistolica[i]},
+                "diastolic": {"inMillimetersOfMercury": diastolica[i]},
+            },
+        }
+        for i in range(0, linhas, 90)
+    ]
+    atividades = processar_atividades(df)
+    sessions = [
+        {
+            "start": inicio.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "end": fim.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+        }
+        for inicio, fim in zip(atividades["Início"], atividades["Fim"])
+    ]
+    return {
+        "heartRate": heart_rate,
+        "oxygenSaturation": oxygen,
+        "bloodPressure": pressure,
+        "exerciseSession": sessions,
+    }
+
+
+def preparar_detector(linhas):
+    detector = DetectorAnomalias()
+    detector.detectar(dados_sinais(linhas))
+    lote = dados_sinais(LOTE_TICK, semente=1)
+    return detector, lote
+
+
+def preparar_detector_camadas(linhas):
+    detector = DetectorAnomalias(triagem=TriagemEstatistica())
+    detector.detectar(dados_sinais(linhas))
+    lote = dados_sinais(LOTE_TICK, semente=1)
+    return detector, lote
+
+
+def preparar_indice_lof(linhas):
+    indice = IndiceLOF(capacidade=linhas).fit(
+        dados_sinais(linhas)[COLUNAS_VITAIS].to_numpy(dtype=float)
+    )
+    lote = dados_sinais(LOTE_TICK, semente=1)[COLUNAS_VITAIS].to_numpy(dtype=float)
+    return indice, lote
+
+
+def rodar_detector(detector, lote):
+    # Abaixo do limiar de retreino: mede só a pontuação do lote novo
+    detector.reiniciar_contagem()
+    detector.detectar(lote.copy())
+
+
+class Frota:
+    """P pacientes com histórico e detector aquecidos, avançando um tick."""
+
+    def __init__(self, pacientes, linhas_por_paciente=2_000):
+        self.pacientes = []
+        for paciente in range(pacientes):
+            historico = HistoricoPaciente()
+            detector = DetectorAnomalias()
+            df = detector.detectar(dados_sinais(linhas_por_paciente, paciente))
+            historico.adicionar(df)
+            self.pacientes.append((historico, detector))
+        self.rng = np.random.default_rng(pacientes)
+
+    def tick(self):
+        for historico, detector in self.pacientes:
+            inicio = historico.ultimo_timestamp + INTERVALO
+            timestamps = pd.date_range(inicio, periods=LOTE_TICK, freq=INTERVALO)
+            df = gerar_sinais(self.rng, timestamps)
+            detector.reiniciar_contagem()
+            historico.adicionar(detector.detectar(df))
+            verificar_alertas(historico.dataframe(), LIMITES_PADRAO)
+
+
+def janelas_treino(pacientes):
+    return (
+        [
+            dados_sinais(JANELA_TREINO, paciente)[COLUNAS_VITAIS].to_numpy(dtype=float)
+            for paciente in range(pacientes)
+        ],
+    )
+
+
+_agendador = None
+
+
+def treinar_em_processos(janelas):
+    # Um pool para todos os tamanhos; o primeiro uso inclui criar os processos
+    global _agendador
+    if _agendador is None:
+        _agendador = AgendadorTreinos()
+    for treino in [_agendador.ajustar(X) for X in janelas]:
+        treino.result()
+
+
+def preparar_cache(pacientes):
+    # Mais pacientes acompanhados que o limite do cache, como numa enfermaria
+    # com simulação e API por paciente
+    cache = CachePacientes(max_pacientes=max(pacientes // 2, 1))
+    chaves = [(paciente, "api") for paciente in range(pacientes)]
+    for chave in chaves:
+        cache.fixar(chave)
+        cache.estado(chave).obter("historico", HistoricoPaciente)
+    return cache, chaves
+
+
+def varrer_cache(cache, chaves):
+    """Um tick da ingestão: cada paciente acompanhado é lido do cache."""
+    for chave in chaves:
+        if cache.estado(chave).componente("historico") is None:
+            raise RuntimeError(f"paciente acompanhado expulso do cache: {chave}")
+
+
+def preparar_enfermaria(pacientes):
+    # Cada linha simulada é a última leitura de um paciente
+    painel = PainelEnfermaria()
+    df = dados_sinais(pacientes)
+    painel.atualizar_varios(
+        range(pacientes), df[painel.vitais].to_numpy(dtype=float), df["timestamp"]
+    )
+    painel.definir_limites(0, {"temperatura": {"min": 36, "max": 38}})
+    return (painel,)
+
+
+# nome -> (preparar(tamanho) -> args, rodar(*args), eixo, tamanho máximo)
+ESTAGIOS = {
+    "detectar_anomalias": (
+        lambda n: (dados_sinais(n),),
+        lambda df: detectar_anomalias_lote(df.copy()),
+        "linhas",
+        100_000,
+    ),
+    "detector_incremental": (
+        preparar_detector,
+        rodar_detector,
+        "linhas",
+        None,
+    ),
+    "detector_camadas": (
+        preparar_detector_camadas,
+        rodar_detector,
+        "linhas",
+        None,
+    ),
+    "pontuar_lof": (
+        preparar_indice_lof,
+        IndiceLOF.predict,
+        "linhas",
+        100_000,
+    ),
+    "processar_anomalias": (
+        lambda n: (dados_detectados(n),),
+        lambda df: explicar_anomalias(df, LIMITES_PADRAO),
+        "linhas",
+        None,
+    ),
+    "processar_atividades": (
+        lambda n: (dados_sinais(n),),
+        processar_atividades,
+        "linhas",
+        None,
+    ),
+    "conversao_api": (
+        lambda n: (payload_api(n),),
+        converter_dados_api,
+        "linhas",
+        1_000_000,
+    ),
+    "check_alertas": (
+        lambda n: (dados_sinais(n),),
+        lambda df: verificar_alertas(df, LIMITES_PADRAO),
+        "linhas",
+        None,
+    ),
+    "motor_alertas": (
+        lambda n: (dados_sinais(n),),
+        lambda df: MotorAlertas().processar("paciente", df),
+        "linhas",
+        None,
+    ),
+    "treino_serial": (
+        janelas_treino,
+        lambda janelas: [ajustar_modelos(X) for X in janelas],
+        "pacientes",
+        None,
+    ),
+    "treino_processos": (
+        janelas_treino,
+        treinar_em_processos,
+        "pacientes",
+        None,
+    ),
+    "varrer_cache": (
+        preparar_cache,
+        varrer_cache,
+        "pacientes",
+        None,
+    ),
+    "avaliar_enfermaria": (
+        preparar_enfermaria,
+        lambda painel: painel.avaliar(LIMITES_PADRAO),
+        "pacientes",
+        None,
+    ),
+    "create_vital_chart": (
+        lambda n: (dados_sinais(n), processar_atividades(dados_sinais(n))),
+        create_vital_chart,
+        "linhas",
+        100_000,
+    ),
+    "create_anomaly_chart": (
+        lambda n: (explicar_anomalias(dados_detectados(n), LIMITES_PADRAO),),
+        lambda df: create_anomaly_chart(df.copy()),
+        "linhas",
+        1_000_000,
+    ),
+    "tick_frota": (
+        lambda n: (Frota(n),),
+        Frota.tick,
+        "pacientes",
+        None,
+    ),
+}
+
+
+def medir(rodar, args, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        rodar(*args)
+        tempos.append(time.perf_counter() - inicio)
+
+    tracemalloc.start()
+    try:
+        rodar(*args)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(tempos), float(np.median(tempos)), pico
+
+
+def expoente_escala(tamanhos, tempos):
+    if len(tamanhos) < 2:
+        return None
+    inclinacao, _ = np.polyfit(np.log(tamanhos), np.log(tempos), 1)
+    return round(float(inclinacao), 3)
+
+
+def executar(estagios, linhas, pacientes, repeticoes):
+    resultados = []
+    escala = {}
+    for nome in estagios:
+        preparar, rodar, eixo, maximo = ESTAGIOS[nome]
+        tamanhos = [
+            n
+            for n in (pacientes if eixo == "pacientes" else linhas)
+            if maximo is None or n <= maximo
+        ]
+        medidos = []
+        for n in tamanhos:
+            args = preparar(n)
+            melhor, mediana, pico = medir(rodar, args, repeticoes)
+            resultados.append(
+                {
+                    "estagio": nome,
+                    eixo: n,
+                    "tempo_s": melhor,
+                    "tempo_mediana_s": mediana,
+                    "pico_memoria_mb": pico / 2**20,
+                }
+            )
+            medidos.append(melhor)
+            print(
+                f"{nome:<22} {eixo:>9}={n:<9} {melhor * 1e3:>11.2f} ms "
+                f"{pico / 2**20:>9.1f} MiB",
+                flush=True,
+            )
+        escala[nome] = expoente_escala(tamanhos, medidos)
+    return resultados, escala
+
+
+def comparar(anteriores, resultados, limiar):
+    """Regressões: mesmo estágio e tamanho, tempo > ``limiar`` x anterior."""
+
+    def chave(resultado):
+        return (
+            resultado["estagio"],
+            resultado.get("linhas"),
+            resultado.get("pacientes"),
+        )
+
+    base = {chave(r): r for r in anteriores}
+    regressoes = []
+    for resultado in resultados:
+        anterior = base.get(chave(resultado))
+        if anterior is None or anterior["tempo_s"] <= 0:
+            continue
+        razao = resultado["tempo_s"] / anterior["tempo_s"]
+        if razao > limiar:
+            regressoes.append({**resultado, "razao": razao})
+    return regressoes
+
+
+def metadados():
+    import plotly
+    import sklearn
+
+    return {
+        "data": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "plotly": plotly.__version__,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--estagios", nargs="+", choices=list(ESTAGIOS), default=list(ESTAGIOS)
+    )
+    parser.add_argument("--linhas", nargs="+", type=int, default=LINHAS_PADRAO)
+    parser.add_argument("--pacientes", nargs="+", type=int, default=PACIENTES_PADRAO)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--saida", type=Path, default=SAIDA_PADRAO)
+    parser.add_argument("--limiar", type=float, default=1.25)
+    parser.add_argument(
+        "--falhar-regressao",
+        action="store_true",
+        help="Código de saída 1 se houver regressões",
+    )
+    args = parser.parse_args(argv)
+
+    resultados, escala = executar(
+        args.estagios, args.linhas, args.pacientes, args.repeticoes
+    )
+    print("\nExpoente de escala (log-log):")
+    for nome, expoente in escala.items():
+        print(f"  {nome:<22} {expoente}")
+
+    regressoes = []
+    if args.saida.exists():
+        anteriores = json.loads(args.saida.read_text(encoding="utf-8"))
+        regressoes = comparar(anteriores["resultados"], resultados, args.limiar)
+        print(f"\nComparado com {anteriores['meta']['data']}:")
+        if not regressoes:
+            print("  sem regressões")
+        for regressao in regressoes:
+            tamanho = regressao.get("linhas", regressao.get("pacientes"))
+            print(
+                f"  REGRESSÃO {regressao['estagio']} ({tamanho}): "
+                f"{regressao['razao']:.2f}x mais lento"
+            )
+
+    args.saida.parent.mkdir(parents=True, exist_ok=True)
+    args.saida.write_text(
+        json.dumps(
+            {"meta": metadados(), "resultados": resultados, "escala": escala},
+            indent=2,
+            ensure_ascii=False,
+        ),
+        encoding="utf-8",
+    )
+    if regressoes and args.falhar_regressao:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
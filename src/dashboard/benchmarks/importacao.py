@@ -0,0 +1,118 @@
+"""Orçamento de importação do dashboard até o primeiro desenho da página.
+
+Num interpretador novo são executadas as importações do topo de
+``streamlit.py`` (tudo o que roda antes de ``st.set_page_config``), então o
+tempo medido é o custo fixo de cada cold start antes do primeiro desenho,
+sem o servidor do Streamlit. Também confere que as dependências pesadas
+carregadas só no primeiro uso (``PESADOS``) não entraram nesse caminho e lista
+os pacotes mais caros segundo ``python -X importtime``.
+
+Uso (a partir de ``src/dashboard``)::
+
+    python -m benchmarks.importacao
+    python -m benchmarks.importacao --orcamento 1.0 --repeticoes 5
+"""
+
+import argparse
+import ast
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+APP = Path(__file__).resolve().parent.parent / "streamlit.py"
+PESADOS = ["sklearn", "scipy", "plotly", "requests", "tornado"]
+ORCAMENTO_PADRAO = 1.5  # segundos
+
+
+def importacoes_iniciais(caminho=APP):
+    """Código das importações de ``caminho`` anteriores ao primeiro comando."""
+    arvore = ast.parse(caminho.read_text(encoding="utf-8"))
+    importacoes = []
+    for no in arvore.body:
+        if isinstance(no, (ast.Import, ast.ImportFrom)):
+            importacoes.append(ast.unparse(no))
+        elif not isinstance(no, ast.Expr) or not isinstance(no.value, ast.Constant):
+            break
+    return importacoes
+
+
+def medir(importacoes):
+    """Tempo das importações num processo novo e os módulos pesados carregados."""
+    # A pasta do app vai para o fim do sys.path: no início, streamlit.py
+    # esconderia o pacote streamlit
+    codigo = "\n".join(
+        [
+            "import json, sys, time",
+            f"sys.path.append({str(APP.parent)!r})",
+            "inicio = time.perf_counter()",
+            *importacoes,
+            "duracao = time.perf_counter() - inicio",
+            f"pesados = [m for m in {PESADOS!r} if m in sys.modules]",
+            "print(json.dumps({'segundos': duracao, 'pesados': pesados}))",
+        ]
+    )
+    with tempfile.TemporaryDirectory() as pasta:
+        processo = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", codigo],
+            cwd=pasta,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    resultado = json.loads(processo.stdout.strip().splitlines()[-1])
+    resultado["pacotes"] = _pacotes(processo.stderr)
+    return resultado
+
+
+def _pacotes(saida_importtime):
+    # Linhas "import time: self [us] | cumulative | imported package"; os
+    # pacotes de primeiro nível não têm recuo no nome
+    pacotes = {}
+    for linha in saida_importtime.splitlines():
+        partes = linha.split("|")
+        if len(partes) != 3 or not partes[1].strip().isdigit():
+            continue
+        nome = partes[2].rstrip()
+        if nome.startswith(" ") and not nome.startswith("  "):
+            pacotes[nome.strip()] = int(partes[1]) / 1e6
+    return pacotes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orcamento", type=float, default=ORCAMENTO_PADRAO)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--mostrar", type=int, default=10, help="Pacotes listados")
+    args = parser.parse_args(argv)
+
+    importacoes = importacoes_iniciais()
+    medicoes = [medir(importacoes) for _ in range(args.repeticoes)]
+    tempos = [m["segundos"] for m in medicoes]
+    melhor = min(medicoes, key=lambda m: m["segundos"])
+
+    print(
+        f"Importações até o primeiro desenho: {min(tempos) * 1e3:.0f} ms "
+        f"(mediana {statistics.median(tempos) * 1e3:.0f} ms, orçamento "
+        f"{args.orcamento * 1e3:.0f} ms)"
+    )
+    print("\nPacotes mais caros (cumulativo):")
+    for nome, segundos in sorted(
+        melhor["pacotes"].items(), key=lambda item: item[1], reverse=True
+    )[: args.mostrar]:
+        print(f"  {nome:<24} {segundos * 1e3:>9.1f} ms")
+
+    falhas = []
+    if min(tempos) > args.orcamento:
+        falhas.append("orçamento de importação excedido")
+    if melhor["pesados"]:
+        falhas.append(f"importados antes do uso: {', '.join(melhor['pesados'])}")
+    for falha in falhas:
+        print(f"\nFALHA: {falha}")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
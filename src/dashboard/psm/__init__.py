@@ -0,0 +1 @@
+"""Componentes do pipeline de dados do dashboard PSMv2."""
@@ -0,0 +1,306 @@
+"""Agregados multirresolução (rollups) dos sinais vitais de um paciente.
+
+Para cada resolução (1 min, 15 min, 1 h, 1 dia) e cada vital são mantidos o
+mínimo, o máximo, a soma e a contagem por intervalo, além do número de
+leituras, de anomalias (IsolationForest e LOF) e de leituras em atividade.
+Os lotes novos são reduzidos e mesclados só com a cauda dos agregados, então
+o custo de ``adicionar`` depende do lote, não do histórico.
+
+Os intervalos são alinhados em UTC quando os timestamps têm fuso.
+
+Uma consulta escolhe a resolução mais grossa que ainda preenche o gráfico
+(``pontos`` intervalos no período), então devolve um número limitado de
+linhas qualquer que seja o período pedido.
+"""
+
+import numpy as np
+import pandas as pd
+
+from psm.deteccao import COLUNAS_VITAIS
+
+RESOLUCOES = ["1min", "15min", "1h", "1D"]
+RETENCAO_PADRAO = {"1min": pd.Timedelta(days=30)}
+
+# Contadores por intervalo, além dos campos por vital
+CONTADORES = ["linhas", "anomalias_if", "anomalias_lof", "em_atividade"]
+
+
+class _Serie:
+    """Intervalos de uma resolução, ordenados pela chave (início em ns)."""
+
+    def __init__(self, passo, retencao=None):
+        self.passo = passo
+        self.retencao = pd.Timedelta(retencao) if retencao is not None else None
+        self.n = 0
+        self._inicio = 0
+        self.chaves = np.empty(0, dtype=np.int64)
+        self.campos = {
+            "minimo": np.empty((0, len(COLUNAS_VITAIS))),
+            "maximo": np.empty((0, len(COLUNAS_VITAIS))),
+            "soma": np.empty((0, len(COLUNAS_VITAIS))),
+            "contagem": np.empty((0, len(COLUNAS_VITAIS)), dtype=np.int64),
+            "contadores": np.empty((0, len(CONTADORES)), dtype=np.int64),
+        }
+
+    def __len__(self):
+        return self.n - self._inicio
+
+    @property
+    def nbytes(self):
+        return self.chaves.nbytes + sum(c.nbytes for c in self.campos.values())
+
+    def mesclar(self, chaves, campos):
+        """Mescla intervalos já reduzidos (``chaves`` ordenadas e únicas)."""
+        atuais = self.chaves[self._inicio : self.n]
+        # Só a cauda que se sobrepõe ao lote precisa ser reduzida de novo
+        p = self._inicio + int(np.searchsorted(atuais, chaves[0]))
+        if p < self.n:
+            chaves = np.concatenate([self.chaves[p : self.n], chaves])
+            campos = {
+                nome: np.concatenate([self.campos[nome][p : self.n], valores])
+                for nome, valores in campos.items()
+            }
+            ordem = np.argsort(chaves, kind="stable")
+            chaves, campos = _reduzir(
+                chaves[ordem], {nome: v[ordem] for nome, v in campos.items()}
+            )
+
+        self._reservar(p + len(chaves))
+        self.chaves[p : p + len(chaves)] = chaves
+        for nome, valores in campos.items():
+            self.campos[nome][p : p + len(chaves)] = valores
+        self.n = p + len(chaves)
+        self._aplicar_retencao()
+
+    def fatia(self, inicio_ns, fim_ns):
+        chaves = self.chaves[self._inicio : self.n]
+        i = self._inicio + int(np.searchsorted(chaves, inicio_ns, side="left"))
+        j = self._inicio + int(np.searchsorted(chaves, fim_ns, side="right"))
+        return self.chaves[i:j], {
+            nome: valores[i:j] for nome, valores in self.campos.items()
+        }
+
+    @property
+    def primeira_chave(self):
+        return self.chaves[self._inicio] if len(self) else None
+
+    def _reservar(self, tamanho):
+        if tamanho <= len(self.chaves):
+            return
+        capacidade = max(tamanho, 2 * len(self.chaves), 64)
+        self.chaves = _crescer(self.chaves, capacidade)
+        self.campos = {
+            nome: _crescer(valores, capacidade) for nome, valores in self.campos.items()
+        }
+
+    def _aplicar_retencao(self):
+        if self.retencao is None or not len(self):
+            return
+        limite = self.chaves[self.n - 1] - self.retencao.value
+        self._inicio += int(
+            np.searchsorted(self.chaves[self._inicio : self.n], limite, side="left")
+        )
+        # Compacta quando a parte descartada passa de metade do espaço
+        if self._inicio > len(self.chaves) // 2:
+            manter = slice(self._inicio, self.n)
+            tamanho = self.n - self._inicio
+            self.chaves[:tamanho] = self.chaves[manter]
+            for valores in self.campos.values():
+                valores[:tamanho] = valores[manter]
+            self._inicio, self.n = 0, tamanho
+
+
+class AgregadosPaciente:
+    def __init__(self, resolucoes=None, retencao=None):
+        resolucoes = resolucoes or RESOLUCOES
+        retencao = {**RETENCAO_PADRAO, **(retencao or {})}
+        self.tz = None
+        self.series = {
+            resolucao: _Serie(pd.Timedelta(resolucao).value, retencao.get(resolucao))
+            for resolucao in resolucoes
+        }
+
+    @property
+    def vazio(self):
+        return all(len(serie) == 0 for serie in self.series.values())
+
+    @property
+    def nbytes(self):
+        return sum(serie.nbytes for serie in self.series.values())
+
+    def adicionar(self, df):
+        """Soma as leituras de ``df`` (timestamp, vitais, atividade, anomalias)."""
+        if df.empty:
+            return
+        if self.tz is None and self.vazio:
+            self.tz = df["timestamp"].dt.tz
+
+        tempos = _para_ns(df["timestamp"])
+        valores = np.column_stack(
+            [
+                (
+                    df[vital].to_numpy(dtype=float)
+                    if vital in df.columns
+                    else np.full(len(df), np.nan)
+                )
+                for vital in COLUNAS_VITAIS
+            ]
+        )
+        presentes = ~np.isnan(valores)
+        contadores = np.column_stack(
+            [
+                np.ones(len(df), dtype=np.int64),
+                _marcados(df, "Anomalia_IF"),
+                _marcados(df, "Anomalia_LOF"),
+                (
+                    (df["atividade"].to_numpy() == 1).astype(np.int64)
+                    if "atividade" in df.columns
+                    else np.zeros(len(df), dtype=np.int64)
+                ),
+            ]
+        )
+        campos = {
+            "minimo": valores,
+            "maximo": valores,
+            "soma": np.where(presentes, valores, 0.0),
+            "contagem": presentes.astype(np.int64),
+            "contadores": contadores,
+        }
+
+        ordem = np.argsort(tempos, kind="stable")
+        tempos = tempos[ordem]
+        campos = {nome: valores[ordem] for nome, valores in campos.items()}
+        for serie in self.series.values():
+            chaves = tempos - tempos % serie.passo
+            serie.mesclar(*_reduzir(chaves, campos))
+
+    def escolher_resolucao(self, inicio, fim, pontos):
+        """Resolução mais grossa com pelo menos ``pontos`` intervalos no período.
+
+        Resoluções cuja retenção não alcança ``inicio`` são ignoradas.
+        """
+        inicio_ns, fim_ns = _limite_ns(inicio, self.tz), _limite_ns(fim, self.tz)
+        candidatas = [
+            resolucao
+            for resolucao, serie in self.series.items()
+            if serie.primeira_chave is None
+            or serie.retencao is None
+            or serie.primeira_chave <= inicio_ns
+        ]
+        candidatas = candidatas or list(self.series)
+        for resolucao in sorted(
+            candidatas, key=lambda r: self.series[r].passo, reverse=True
+        ):
+            if (fim_ns - inicio_ns) / self.series[resolucao].passo >= pontos:
+                return resolucao
+        return min(candidatas, key=lambda r: self.series[r].passo)
+
+    def chaves(self, resolucao, inicio, fim):
+        """Inícios (``Timestamp``) dos intervalos com dados no período."""
+        chaves, _ = self.series[resolucao].fatia(
+            _limite_ns(inicio, self.tz), _limite_ns(fim, self.tz)
+        )
+        return self._para_timestamp(chaves)
+
+    def consultar(self, inicio, fim, resolucao=None, pontos=600, extras=()):
+        """DataFrame com um intervalo por linha.
+
+        Cada vital tem a média (coluna com o nome do vital) e as colunas
+        ``<vital>_min``/``<vital>_max``. ``Anomalia_IF``/``Anomalia_LOF`` são
+        -1 quando o intervalo tem alguma anomalia do modelo, e ``atividade``
+        é 1 quando a maioria das leituras foi em atividade.
+
+        ``extras`` são outros ``AgregadosPaciente`` (ex.: leituras simuladas
+        mantidas à parte) somados a estes só na consulta.
+        """
+        resolucao = resolucao or self.escolher_resolucao(inicio, fim, pontos)
+        passo = self.series[resolucao].passo
+        tz = next((a.tz for a in (self, *extras) if a.tz is not None), self.tz)
+        inicio_ns = _limite_ns(inicio, tz)
+        inicio_ns -= inicio_ns % passo
+        fim_ns = _limite_ns(fim, tz)
+        chaves, campos = self.series[resolucao].fatia(inicio_ns, fim_ns)
+        fatias = [
+            outro.series[resolucao].fatia(inicio_ns, fim_ns)
+            for outro in extras
+            if resolucao in outro.series
+        ]
+        fatias = [(c, v) for c, v in fatias if len(c)]
+        if fatias:
+            chaves = np.concatenate([chaves, *(c for c, _ in fatias)])
+            campos = {
+                nome: np.concatenate([valores, *(v[nome] for _, v in fatias)])
+                for nome, valores in campos.items()
+            }
+            ordem = np.argsort(chaves, kind="stable")
+            chaves, campos = _reduzir(
+                chaves[ordem], {nome: v[ordem] for nome, v in campos.items()}
+            )
+
+        contagem = campos["contagem"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            medias = np.where(contagem > 0, campos["soma"] / contagem, np.nan)
+        contadores = campos["contadores"]
+
+        dados = {"timestamp": self._para_timestamp(chaves, tz)}
+        for i, vital in enumerate(COLUNAS_VITAIS):
+            dados[vital] = medias[:, i]
+        for i, vital in enumerate(COLUNAS_VITAIS):
+            dados[f"{vital}_min"] = campos["minimo"][:, i]
+            dados[f"{vital}_max"] = campos["maximo"][:, i]
+        for i, nome in enumerate(CONTADORES):
+            dados[nome] = contadores[:, i]
+        dados["atividade"] = (2 * contadores[:, 3] > contadores[:, 0]).astype(np.int64)
+        dados["Anomalia_IF"] = np.where(contadores[:, 1] > 0, -1, 1)
+        dados["Anomalia_LOF"] = np.where(contadores[:, 2] > 0, -1, 1)
+        df = pd.DataFrame(dados)
+        df.attrs["resolucao"] = resolucao
+        return df
+
+    def _para_timestamp(self, chaves, tz=None):
+        tz = tz if tz is not None else self.tz
+        serie = pd.Series(chaves.astype("datetime64[ns]"))
+        if tz is not None:
+            serie = serie.dt.tz_localize("UTC").dt.tz_convert(tz)
+        return serie
+
+
+def _reduzir(chaves, campos):
+    """Combina linhas com a mesma chave (``chaves`` ordenadas)."""
+    inicios = np.flatnonzero(np.diff(chaves, prepend=chaves[0] - 1))
+    if len(inicios) == len(chaves):
+        return chaves, campos
+    return chaves[inicios], {
+        "minimo": np.fmin.reduceat(campos["minimo"], inicios, axis=0),
+        "maximo": np.fmax.reduceat(campos["maximo"], inicios, axis=0),
+        "soma": np.add.reduceat(campos["soma"], inicios, axis=0),
+        "contagem": np.add.reduceat(campos["contagem"], inicios, axis=0),
+        "contadores": np.add.reduceat(campos["contadores"], inicios, axis=0),
+    }
+
+
+def _crescer(valores, capacidade):
+    novo = np.empty((capacidade, *valores.shape[1:]), dtype=valores.dtype)
+    novo[: len(valores)] = valores
+    return novo
+
+
+def _marcados(df, coluna):
+    if coluna not in df.columns:
+        return np.zeros(len(df), dtype=np.int64)
+    return (df[coluna].to_numpy() == -1).astype(np.int64)
+
+
+def _para_ns(serie):
+    if serie.dt.tz is not None:
+        serie = serie.dt.tz_convert("UTC").dt.tz_localize(None)
+    return serie.to_numpy("datetime64[ns]").view(np.int64)
+
+
+def _limite_ns(valor, tz):
+    valor = pd.Timestamp(valor)
+    if valor.tzinfo is None and tz is not None:
+        valor = valor.tz_localize(tz)
+    if valor.tzinfo is not None:
+        valor = valor.tz_convert("UTC").tz_localize(None)
+    return valor.value
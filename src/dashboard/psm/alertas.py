@@ -0,0 +1,92 @@
+"""Limites de sinais vitais e alertas sobre a leitura mais recente.
+
+``avaliar_limites`` compara de uma vez uma matriz de valores (pacientes ×
+vitais) com as matrizes de mínimos e máximos; ``verificar_alertas`` a usa
+para a última leitura de um paciente e ``psm.enfermaria`` para a enfermaria
+inteira.
+"""
+
+import numpy as np
+
+LIMITES_PADRAO = {
+    "temperatura": {
+        "min": 35,
+        "max": 37.5,
+        "msg_min": "Hipotermia",
+        "msg_max": "Febre",
+    },
+    "batimento_cardiaco": {
+        "min": 60,
+        "max": 120,
+        "msg_min": "Bradicardia",
+        "msg_max": "Batimento cardíaco elevado",
+    },
+    "pressao_sistolica": {
+        "min": 90,
+        "max": 140,
+        "msg_min": "Hipotensão",
+        "msg_max": "Hipertensão",
+    },
+    "pressao_diastolica": {
+        "min": 60,
+        "max": 90,
+        "msg_min": "Hipotensão",
+        "msg_max": "Hipertensão",
+    },
+    "glicose": {
+        "min": 70,
+        "max": 180,
+        "msg_min": "Hipoglicemia",
+        "msg_max": "Hiperglicemia",
+    },
+    "oxigenio": {
+        "min": 95,
+        "max": 100,
+        "msg_min": "Hipoxemia",
+        "msg_max": "Hiperóxia",
+    },
+}
+
+
+def vetores_limites(limites, vitais):
+    """(mínimos, máximos) de ``limites`` na ordem de ``vitais``; NaN se ausente."""
+    minimos = np.array(
+        [limites[v]["min"] if v in limites else np.nan for v in vitais], dtype=float
+    )
+    maximos = np.array(
+        [limites[v]["max"] if v in limites else np.nan for v in vitais], dtype=float
+    )
+    return minimos, maximos
+
+
+def avaliar_limites(valores, minimos, maximos):
+    """-1 abaixo do mínimo, 1 acima do máximo e 0 dentro (ou sem valor).
+
+    Aceita vetores ou matrizes pacientes × vitais (com broadcast dos limites).
+    """
+    valores = np.asarray(valores, dtype=float)
+    status = np.zeros(np.broadcast(valores, minimos, maximos).shape, dtype=np.int8)
+    status[valores < minimos] = -1
+    status[valores > maximos] = 1
+    return status
+
+
+def verificar_alertas(df, limites):
+    alertas = []
+    if df.empty:
+        return alertas
+    vitais = list(limites)
+    valores = np.array([df[v].iat[-1] for v in vitais], dtype=float)
+    status = avaliar_limites(valores, *vetores_limites(limites, vitais))
+
+    for parametro, valor, sinal in zip(vitais, valores, status):
+        if sinal != 0:
+            alertas.append(mensagem_alerta(parametro, valor, sinal, limites[parametro]))
+
+    return alertas
+
+
+def mensagem_alerta(parametro, valor, sinal, atributos):
+    if sinal < 0:
+        return f"{parametro.capitalize()} abaixo do limite: {valor:.2f} (Mín: {atributos['min']})"
+    return f"{parametro.capitalize()} acima do limite: {valor:.2f} (Máx: {atributos['max']})"
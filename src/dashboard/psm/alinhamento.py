@@ -0,0 +1,205 @@
+"""Alinhamento temporal de sinais vitais que chegam em taxas diferentes.
+
+Cada métrica (batimento do relógio, SpO2, pressão, temperatura do DHT11...)
+é projetada numa grade regular. O ponto ``t`` da grade recebe a última amostra
+em ``(t - frequencia, t]`` ("fresca") ou, se não houver, a última amostra
+anterior enquanto ela estiver dentro da tolerância da métrica e do limite de
+passos de forward-fill ("carregada"). Para cada vital há uma coluna
+``fresco_<vital>`` indicando a origem do valor.
+"""
+
+import numpy as np
+import pandas as pd
+
+from psm.deteccao import COLUNAS_VITAIS
+
+TOLERANCIAS_PADRAO = {
+    "batimento_cardiaco": pd.Timedelta(minutes=5),
+    "oxigenio": pd.Timedelta(minutes=30),
+    "pressao_sistolica": pd.Timedelta(hours=2),
+    "pressao_diastolica": pd.Timedelta(hours=2),
+    "temperatura": pd.Timedelta(minutes=2),
+    "glicose": pd.Timedelta(hours=1),
+}
+
+
+def coluna_fresco(vital):
+    return f"fresco_{vital}"
+
+
+class AlinhadorSinais:
+    """Projeta as métricas numa grade de ``frequencia``.
+
+    ``alinhar`` processa o histórico inteiro; ``atualizar`` recebe apenas os
+    lotes novos. Um ponto da grade só é emitido quando está completo: toda
+    métrica já tem amostra nele ou depois, ou a tolerância dela já venceu em
+    relação à amostra mais recente recebida. Amostras atrasadas (anteriores ao
+    último ponto emitido) fazem os pontos a partir delas serem emitidos de
+    novo; quem consome substitui as linhas pelo timestamp. As amostras dos
+    últimos ``retencao`` ficam guardadas para essa reprojeção.
+    """
+
+    def __init__(
+        self,
+        frequencia="1min",
+        tolerancias=None,
+        limite_ffill=None,
+        retencao=pd.Timedelta(days=3),
+    ):
+        self.frequencia = pd.Timedelta(frequencia)
+        self.tolerancias = {**TOLERANCIAS_PADRAO, **(tolerancias or {})}
+        self.limite_ffill = limite_ffill
+        self.retencao = pd.Timedelta(retencao)
+
+        self._amostras = {}
+        self._ultimo_emitido = None
+
+    def alinhar(self, metricas, inicio=None, fim=None):
+        """``metricas`` mapeia nome -> DataFrame com ``timestamp`` e colunas de vitais."""
+        amostras = {
+            vital: serie
+            for df in metricas.values()
+            if not df.empty
+            for vital, serie in _series_por_vital(df).items()
+        }
+        if not amostras:
+            return pd.DataFrame()
+
+        if inicio is None:
+            inicio = min(serie.index[0] for serie in amostras.values())
+        if fim is None:
+            fim = max(serie.index[-1] for serie in amostras.values())
+        grade = pd.date_range(
+            inicio.ceil(self.frequencia),
+            fim.ceil(self.frequencia),
+            freq=self.frequencia,
+        )
+        if len(grade) == 0:
+            return pd.DataFrame()
+
+        grade_ns = _para_ns(grade)
+        dados = {"timestamp": grade}
+        for vital in COLUNAS_VITAIS:
+            serie = amostras.get(vital)
+            if serie is None:
+                dados[vital] = np.full(len(grade), np.nan)
+                dados[coluna_fresco(vital)] = np.zeros(len(grade), dtype=bool)
+                continue
+            dados[vital], dados[coluna_fresco(vital)] = self._projetar(
+                grade_ns, _para_ns(serie.index), serie.to_numpy(dtype=float), vital
+            )
+
+        df = pd.DataFrame(dados)
+        return df[df[COLUNAS_VITAIS].notna().any(axis=1)].reset_index(drop=True)
+
+    def atualizar(self, metricas):
+        """Alinha os lotes novos, emitindo os pontos da grade já completos.
+
+        Inclui de novo os pontos já emitidos afetados por amostras atrasadas.
+        """
+        novas = {
+            nome: df.dropna(subset=["timestamp"])
+            for nome, df in metricas.items()
+            if not df.empty
+        }
+        novas = {nome: df for nome, df in novas.items() if not df.empty}
+        if not novas:
+            return pd.DataFrame()
+
+        mais_antiga = min(df["timestamp"].min() for df in novas.values())
+        for nome, df in novas.items():
+            anterior = self._amostras.get(nome)
+            if anterior is not None:
+                df = pd.concat([anterior, df])
+            self._amostras[nome] = df.sort_values(
+                "timestamp", kind="stable"
+            ).drop_duplicates("timestamp", keep="last")
+
+        fim = self._completo_ate().floor(self.frequencia)
+        if self._ultimo_emitido is None:
+            inicio = mais_antiga
+        else:
+            inicio = min(
+                self._ultimo_emitido + self.frequencia,
+                mais_antiga.ceil(self.frequencia),
+            )
+            fim = max(fim, self._ultimo_emitido)
+        self._descartar_antigas()
+
+        if fim < inicio:
+            return pd.DataFrame()
+
+        df = self.alinhar(self._amostras, inicio=inicio, fim=fim)
+        self._ultimo_emitido = fim
+        return df
+
+    def _completo_ate(self):
+        # Cada métrica segura a grade na sua última amostra até a tolerância
+        # dela vencer em relação à amostra mais recente de todas
+        ultimas = {
+            nome: df["timestamp"].iloc[-1] for nome, df in self._amostras.items()
+        }
+        agora = max(ultimas.values())
+        return min(
+            max(ultima, agora - self._tolerancia(self._amostras[nome]))
+            for nome, ultima in ultimas.items()
+        )
+
+    def _tolerancia(self, df):
+        tolerancia = max(
+            (
+                self.tolerancias.get(vital, self.frequencia)
+                for vital in COLUNAS_VITAIS
+                if vital in df.columns
+            ),
+            default=self.frequencia,
+        )
+        if self.limite_ffill is not None:
+            tolerancia = min(tolerancia, (self.limite_ffill + 1) * self.frequencia)
+        return tolerancia
+
+    def _descartar_antigas(self):
+        # A última amostra de cada métrica fica para continuar o forward-fill
+        for nome, df in self._amostras.items():
+            limite = df["timestamp"].iloc[-1] - self.retencao
+            manter = max(int(df["timestamp"].searchsorted(limite)), 0)
+            if manter:
+                self._amostras[nome] = df.iloc[min(manter, len(df) - 1) :]
+
+    def _projetar(self, grade_ns, tempos_ns, valores, vital):
+        ordem = np.argsort(tempos_ns, kind="stable")
+        tempos_ns = tempos_ns[ordem]
+        valores = valores[ordem]
+
+        # Última amostra com tempo <= ponto da grade
+        posicao = np.searchsorted(tempos_ns, grade_ns, side="right") - 1
+        existe = posicao >= 0
+        posicao = np.maximum(posicao, 0)
+        idade = grade_ns - tempos_ns[posicao]
+
+        frequencia = self.frequencia.value
+        idade_maxima = self.tolerancias.get(vital, self.frequencia).value
+        if self.limite_ffill is not None:
+            idade_maxima = min(idade_maxima, (self.limite_ffill + 1) * frequencia - 1)
+        fresco = existe & (idade < frequencia)
+        valido = existe & (fresco | (idade <= idade_maxima))
+        return np.where(valido, valores[posicao], np.nan), fresco
+
+
+def _series_por_vital(df):
+    df = df.dropna(subset=["timestamp"])
+    series = {}
+    for vital in COLUNAS_VITAIS:
+        if vital in df.columns:
+            serie = pd.Series(df[vital].to_numpy(dtype=float), index=df["timestamp"])
+            serie = serie.dropna().sort_index()
+            if not serie.empty:
+                series[vital] = serie
+    return series
+
+
+def _para_ns(valores):
+    valores = pd.DatetimeIndex(valores)
+    if valores.tz is not None:
+        valores = valores.tz_convert("UTC").tz_localize(None)
+    return valores.to_numpy("datetime64[ns]").view(np.int64)
@@ -0,0 +1,92 @@
+"""Tabela de explicação das anomalias, calculada de forma colunar."""
+
+import numpy as np
+import pandas as pd
+
+MOTIVO_MODELO = "Padrão anômalo detectado pelo modelo"
+
+_DOIS_DIGITOS = np.array([f"{i:02d}" for i in range(60)])
+
+
+def explicar_anomalias(df, limites):
+    """Versão vetorizada de ``processar_anomalias`` (mesmas colunas e textos)."""
+    if df.empty or "Anomalia_IF" not in df.columns or "Anomalia_LOF" not in df.columns:
+        return pd.DataFrame()
+
+    flag_if = df["Anomalia_IF"].to_numpy() == -1
+    flag_lof = df["Anomalia_LOF"].to_numpy() == -1
+    selecionadas = np.flatnonzero(flag_if | flag_lof)
+    if len(selecionadas) == 0:
+        return pd.DataFrame()
+
+    df = df.iloc[selecionadas]
+    flag_if = flag_if[selecionadas]
+    flag_lof = flag_lof[selecionadas]
+
+    # Estado de cada limite por linha: 0 = normal, 1 = acima, 2 = abaixo,
+    # combinado em um código base 3 para montar cada texto uma única vez.
+    parametros = list(limites)
+    valores = df[parametros].to_numpy(dtype=float)
+    maximos = np.array([limites[p]["max"] for p in parametros], dtype=float)
+    minimos = np.array([limites[p]["min"] for p in parametros], dtype=float)
+    acima = valores >= maximos
+    abaixo = ~acima & (valores <= minimos)
+    estados = acima.astype(np.int64) + 2 * abaixo.astype(np.int64)
+    codigos = estados @ (3 ** np.arange(len(parametros), dtype=np.int64))
+
+    codigos_unicos, inverso = np.unique(codigos, return_inverse=True)
+    textos = []
+    for codigo in codigos_unicos.tolist():
+        motivo = []
+        for parametro in parametros:
+            codigo, estado = divmod(codigo, 3)
+            if estado == 1:
+                motivo.append(limites[parametro]["msg_max"])
+            elif estado == 2:
+                motivo.append(limites[parametro]["msg_min"])
+        textos.append(", ".join(motivo) if motivo else MOTIVO_MODELO)
+    motivos = np.array(textos, dtype=object)[inverso.ravel()]
+
+    modelos = np.array(["", "IF", "LOF", "IF + LOF"], dtype=object)[
+        flag_if.astype(np.int64) + 2 * flag_lof.astype(np.int64)
+    ]
+
+    return pd.DataFrame(
+        {
+            "timestamp": df["timestamp"].to_numpy(),
+            "Data/Hora": _formatar_data_hora(df["timestamp"]),
+            "Batimento Cardíaco (BPM)": df["batimento_cardiaco"].to_numpy(),
+            "Temperatura (°C)": _formatar_1f(df["temperatura"]),
+            "Pressão Sistólica (mmHg)": _formatar_1f(df["pressao_sistolica"]),
+            "Pressão Diastólica (mmHg)": _formatar_1f(df["pressao_diastolica"]),
+            "Glicose (mg/dL)": _formatar_1f(df["glicose"]),
+            "Oxigênio (SpO2)": _formatar_1f(df["oxigenio"]),
+            "Modelo Detectado": modelos,
+            "Motivo": motivos,
+        }
+    )
+
+
+def _formatar_1f(serie):
+    # Sinais vitais repetem muito, então só os valores distintos são formatados.
+    unicos, inverso = np.unique(serie.to_numpy(dtype=float), return_inverse=True)
+    textos = np.array([f"{v:.1f}" for v in unicos.tolist()], dtype=object)
+    return textos[inverso.ravel()]
+
+
+def _formatar_data_hora(serie):
+    # Equivalente a strftime("%d/%m/%Y %H:%M:%S"): a data é formatada por dia
+    # distinto e a hora é montada por tabela.
+    if serie.dt.tz is not None:
+        serie = serie.dt.tz_localize(None)
+    segundos = serie.to_numpy().astype("datetime64[s]")
+    dias = segundos.astype("datetime64[D]")
+    dias_unicos, inverso = np.unique(dias, return_inverse=True)
+    datas = pd.DatetimeIndex(dias_unicos).strftime("%d/%m/%Y ").to_numpy(dtype=str)
+
+    horas, resto = np.divmod((segundos - dias).astype(np.int64), 3600)
+    minutos, segs = np.divmod(resto, 60)
+    texto = datas[inverso.ravel()]
+    for parte, separador in ((horas, ""), (minutos, ":"), (segs, ":")):
+        texto = np.strings.add(np.strings.add(texto, separador), _DOIS_DIGITOS[parte])
+    return texto.astype(object)
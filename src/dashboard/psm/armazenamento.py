@@ -0,0 +1,354 @@
+"""Armazenamento persistente dos sinais vitais em Parquet.
+
+Layout (partições no estilo Hive, nomes de paciente codificados em URI)::
+
+    <raiz>/paciente=<nome>/dia=AAAA-MM-DD/parte-<ns>-<id>.parquet
+
+Cada chamada a ``escrever`` cria um arquivo por dia do lote, ordenado pelo
+timestamp; ``compactar`` junta os arquivos pequenos de cada dia num só. A
+leitura de ``(paciente, inicio, fim)`` só abre as pastas dos dias do período,
+pula os arquivos cujo intervalo de ``timestamp`` (do rodapé, guardado por
+arquivo) não cruza o período e, dentro dos demais, descarta row groups pelas
+estatísticas; apenas as colunas pedidas são lidas. Dias são datas em UTC
+quando os timestamps têm fuso.
+
+O arquivo compactado lista nos metadados (``SUBSTITUI``) as partes que
+substitui; até elas serem apagadas, leitores de qualquer processo as pulam,
+então nenhuma leitura vê as mesmas linhas duas vezes.
+"""
+
+import functools
+import json
+import operator
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from psm.esquema import ESQUEMA_SINAIS
+
+# Tipos fixos para que arquivos de fontes diferentes tenham o mesmo schema.
+# O estado do dispositivo é gravado como texto (o Parquet já o codifica por
+# dicionário); arquivos antigos em float64/int64 são promovidos na leitura.
+TIPOS = {
+    nome: pa.string() if nome == "dispositivo_estado" else pa.from_numpy_dtype(tipo)
+    for nome, tipo in ESQUEMA_SINAIS.items()
+}
+
+SUBSTITUI = b"psm.substitui"
+
+# Rodapé resumido de um arquivo; os arquivos não mudam depois de gravados
+_InfoArquivo = namedtuple("_InfoArquivo", ["schema", "minimo", "maximo", "substitui"])
+
+
+class ArmazemParquet:
+    def __init__(self, raiz, linhas_por_grupo=16_384, max_infos=8192):
+        self.raiz = Path(raiz)
+        self.linhas_por_grupo = linhas_por_grupo
+        self.max_infos = max_infos
+        # Leituras não podem ver o arquivo compactado junto com as partes antigas
+        self._lock = threading.RLock()
+        # Rodapés por caminho (LRU): arquivos apagados por outro processo saem
+        # por idade
+        self._infos = OrderedDict()
+        self._lock_infos = threading.Lock()
+
+    def pacientes(self):
+        if not self.raiz.exists():
+            return []
+        return sorted(
+            unquote(pasta.name.split("=", 1)[1])
+            for pasta in self.raiz.glob("paciente=*")
+            if pasta.is_dir()
+        )
+
+    def dias(self, paciente):
+        pasta = self._pasta_paciente(paciente)
+        if not pasta.exists():
+            return []
+        return sorted(
+            pd.Timestamp(dia.name.split("=", 1)[1]).date()
+            for dia in pasta.glob("dia=*")
+            if dia.is_dir() and self._arquivos(dia)
+        )
+
+    def escrever(self, paciente, df):
+        """Grava ``df`` (com ``timestamp``) em um arquivo por dia."""
+        if df.empty:
+            return
+        tabela = _para_tabela(df.sort_values("timestamp", kind="stable"))
+        dias = _dias(df["timestamp"].sort_values(kind="stable"))
+        limites = np.flatnonzero(dias[1:] != dias[:-1]) + 1
+        for inicio, fim in zip(
+            np.concatenate([[0], limites]), np.concatenate([limites, [len(dias)]])
+        ):
+            pasta = self._pasta_dia(paciente, dias[inicio])
+            self._gravar(tabela.slice(inicio, fim - inicio), pasta)
+
+    def ler(self, paciente, inicio=None, fim=None, colunas=None, filtro=None):
+        """DataFrame ordenado com as leituras em ``[inicio, fim]``.
+
+        ``filtro`` é uma expressão ``pyarrow.dataset`` extra sobre as linhas.
+        """
+        return self._ler_dias(
+            paciente,
+            self._dias_no_periodo(paciente, inicio, fim),
+            inicio,
+            fim,
+            colunas,
+            filtro,
+        )
+
+    def ler_blocos(self, paciente, inicio=None, fim=None, colunas=None, filtro=None):
+        """Como ``ler``, mas um DataFrame por dia, para períodos longos.
+
+        Só um dia fica em memória de cada vez; dias sem leituras no período
+        são pulados.
+        """
+        for dia in self._dias_no_periodo(paciente, inicio, fim):
+            df = self._ler_dias(paciente, [dia], inicio, fim, colunas, filtro)
+            if not df.empty:
+                yield df
+
+    def _ler_dias(self, paciente, dias, inicio, fim, colunas, filtro, tentativas=3):
+        # O lock cobre só a listagem: se uma compactação apagar uma parte
+        # durante a leitura, a lista é refeita (o arquivo compactado já existe)
+        for tentativa in range(tentativas):
+            with self._lock:
+                arquivos = [
+                    arquivo
+                    for dia in dias
+                    for arquivo in self._arquivos(self._pasta_dia(paciente, dia))
+                ]
+            try:
+                infos = self._vigentes(arquivos)
+                infos = {
+                    arquivo: info
+                    for arquivo, info in infos.items()
+                    if _cruza(info, inicio, fim)
+                }
+                if not infos:
+                    return pd.DataFrame(columns=colunas)
+                tabela = self._ler_arquivos(infos, inicio, fim, colunas, filtro)
+                break
+            except FileNotFoundError:
+                if tentativa == tentativas - 1:
+                    raise
+
+        df = tabela.to_pandas()
+        if not df["timestamp"].is_monotonic_increasing:
+            df = df.sort_values("timestamp", kind="stable", ignore_index=True)
+        return df
+
+    def _ler_arquivos(self, infos, inicio, fim, colunas, filtro):
+        schema = pa.unify_schemas(
+            [info.schema for info in infos.values()], promote_options="permissive"
+        )
+        dataset = ds.dataset(list(infos), schema=schema, format="parquet")
+        tipo = schema.field("timestamp").type
+        condicoes = [filtro] if filtro is not None else []
+        if inicio is not None:
+            condicoes.append(ds.field("timestamp") >= _escalar(inicio, tipo))
+        if fim is not None:
+            condicoes.append(ds.field("timestamp") <= _escalar(fim, tipo))
+        filtro = functools.reduce(operator.and_, condicoes) if condicoes else None
+        if colunas is not None:
+            colunas = [
+                c for c in dict.fromkeys(["timestamp", *colunas]) if c in schema.names
+            ]
+        return dataset.to_table(columns=colunas, filter=filtro)
+
+    def _vigentes(self, arquivos):
+        """Rodapés de ``arquivos``, sem as partes já substituídas."""
+        infos = {str(arquivo): self._info(str(arquivo)) for arquivo in arquivos}
+        substituidas = {nome for info in infos.values() for nome in info.substitui}
+        return {
+            arquivo: info
+            for arquivo, info in infos.items()
+            if Path(arquivo).name not in substituidas
+        }
+
+    def _info(self, arquivo):
+        with self._lock_infos:
+            info = self._infos.get(arquivo)
+            if info is not None:
+                self._infos.move_to_end(arquivo)
+                return info
+
+        info = _ler_info(arquivo)
+        with self._lock_infos:
+            self._infos[arquivo] = info
+            while len(self._infos) > self.max_infos:
+                self._infos.popitem(last=False)
+        return info
+
+    def _esquecer(self, arquivo):
+        with self._lock_infos:
+            self._infos.pop(arquivo, None)
+
+    def ultimo_timestamp(self, paciente):
+        dias = self.dias(paciente)
+        if not dias:
+            return None
+        df = self.ler(paciente, *_limites_dia(dias[-1]), colunas=["timestamp"])
+        return df["timestamp"].iloc[-1] if not df.empty else None
+
+    def compactar(self, paciente=None, min_arquivos=2):
+        """Junta os arquivos de cada dia com pelo menos ``min_arquivos`` partes.
+
+        Arquivos criados durante a compactação ficam para a próxima.
+        """
+        pacientes = [paciente] if paciente is not None else self.pacientes()
+        compactados = 0
+        for nome in pacientes:
+            for dia in self.dias(nome):
+                pasta = self._pasta_dia(nome, dia)
+                arquivos = self._arquivos(pasta)
+                if len(arquivos) < min_arquivos:
+                    continue
+                # Partes que uma compactação interrompida já tinha juntado
+                # não entram de novo, mas são apagadas junto
+                infos = self._vigentes(arquivos)
+                schema = pa.unify_schemas(
+                    [info.schema for info in infos.values()],
+                    promote_options="permissive",
+                )
+                tabela = ds.dataset(
+                    list(infos), schema=schema, format="parquet"
+                ).to_table()
+                tabela = tabela.take(
+                    pc.sort_indices(tabela, [("timestamp", "ascending")])
+                )
+                metadados = dict(tabela.schema.metadata or {})
+                metadados[SUBSTITUI] = json.dumps([a.name for a in arquivos]).encode()
+                tabela = tabela.replace_schema_metadata(metadados)
+                with self._lock:
+                    self._gravar(tabela, pasta)
+                    for arquivo in arquivos:
+                        arquivo.unlink(missing_ok=True)
+                        self._esquecer(str(arquivo))
+                compactados += 1
+        return compactados
+
+    def _gravar(self, tabela, pasta):
+        pasta.mkdir(parents=True, exist_ok=True)
+        nome = f"parte-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        temporario = pasta / f".{nome}.tmp"
+        pq.write_table(tabela, temporario, row_group_size=self.linhas_por_grupo)
+        os.replace(temporario, pasta / nome)
+
+    def _pasta_paciente(self, paciente):
+        return self.raiz / f"paciente={quote(str(paciente), safe='')}"
+
+    def _pasta_dia(self, paciente, dia):
+        return self._pasta_paciente(paciente) / f"dia={dia.isoformat()}"
+
+    def _dias_no_periodo(self, paciente, inicio, fim):
+        primeiro = _dia(inicio) if inicio is not None else None
+        ultimo = _dia(fim) if fim is not None else None
+        return [
+            dia
+            for dia in self.dias(paciente)
+            if (primeiro is None or dia >= primeiro)
+            and (ultimo is None or dia <= ultimo)
+        ]
+
+    @staticmethod
+    def _arquivos(pasta):
+        return sorted(pasta.glob("parte-*.parquet"))
+
+
+def _ler_info(arquivo):
+    arquivo_parquet = pq.ParquetFile(arquivo)
+    try:
+        schema = arquivo_parquet.schema_arrow
+        metadados = arquivo_parquet.metadata
+        minimo = maximo = None
+        coluna = schema.get_field_index("timestamp")
+        if coluna >= 0 and metadados.num_row_groups:
+            estatisticas = [
+                metadados.row_group(i).column(coluna).statistics
+                for i in range(metadados.num_row_groups)
+            ]
+            if all(e is not None and e.has_min_max for e in estatisticas):
+                minimo = min(pd.Timestamp(e.min) for e in estatisticas)
+                maximo = max(pd.Timestamp(e.max) for e in estatisticas)
+        substitui = json.loads((metadados.metadata or {}).get(SUBSTITUI, b"[]"))
+    finally:
+        arquivo_parquet.close()
+    return _InfoArquivo(schema, minimo, maximo, frozenset(substitui))
+
+
+def _cruza(info, inicio, fim):
+    """Se o arquivo pode ter linhas em ``[inicio, fim]`` (sem estatísticas, sim)."""
+    # As estatísticas convertidas têm precisão de microssegundos
+    folga = pd.Timedelta(1, "us")
+    if inicio is not None and info.maximo is not None:
+        if info.maximo + folga < _comparavel(inicio, info.maximo):
+            return False
+    if fim is not None and info.minimo is not None:
+        if info.minimo - folga > _comparavel(fim, info.minimo):
+            return False
+    return True
+
+
+def _comparavel(valor, referencia):
+    # Mesma convenção de ``_escalar``: sem fuso de um lado, UTC do outro
+    valor = pd.Timestamp(valor)
+    if referencia.tzinfo is not None:
+        return valor.tz_localize("UTC") if valor.tzinfo is None else valor
+    if valor.tzinfo is not None:
+        return valor.tz_convert("UTC").tz_localize(None)
+    return valor
+
+
+def _para_tabela(df):
+    colunas = {}
+    for nome in df.columns:
+        serie = df[nome]
+        if nome in TIPOS:
+            tipo = TIPOS[nome]
+            colunas[nome] = pa.array(
+                serie.to_numpy(dtype=tipo.to_pandas_dtype()), type=tipo, from_pandas=True
+            )
+        else:
+            colunas[nome] = pa.Array.from_pandas(serie)
+    return pa.table(colunas)
+
+
+def _dias(timestamps):
+    if timestamps.dt.tz is not None:
+        timestamps = timestamps.dt.tz_convert("UTC")
+    return np.array(timestamps.dt.date)
+
+
+def _dia(valor):
+    valor = pd.Timestamp(valor)
+    if valor.tzinfo is not None:
+        valor = valor.tz_convert("UTC")
+    return valor.date()
+
+
+def _limites_dia(dia):
+    inicio = pd.Timestamp(dia)
+    return inicio, inicio + pd.Timedelta(days=1) - pd.Timedelta(1, "ns")
+
+
+def _escalar(valor, tipo):
+    valor = pd.Timestamp(valor)
+    if tipo.tz is not None:
+        valor = valor.tz_localize("UTC") if valor.tzinfo is None else valor
+        valor = valor.tz_convert("UTC")
+    elif valor.tzinfo is not None:
+        valor = valor.tz_convert("UTC").tz_localize(None)
+    return pa.scalar(valor, type=tipo)
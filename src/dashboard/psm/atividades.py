@@ -0,0 +1,69 @@
+"""Segmentação e simulação de atividade física com operações vetorizadas."""
+
+import numpy as np
+import pandas as pd
+
+from psm.conversao import COLUNAS_ATIVIDADES
+
+
+def processar_atividades(df):
+    """Tabela de segmentos de atividade a partir da coluna ``atividade``.
+
+    Um segmento começa na primeira linha com ``atividade == 1`` e termina na
+    primeira linha seguinte com ``atividade == 0`` (descartado se durar 0
+    minutos). Um segmento ainda aberto termina no último timestamp.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=COLUNAS_ATIVIDADES)
+
+    atividade = df["atividade"].to_numpy()
+    if np.isin(atividade, (0, 1)).all():
+        estado = atividade.astype(np.int8)
+    else:
+        # Valores diferentes de 0/1 mantêm o estado anterior
+        estado = (
+            df["atividade"]
+            .where(df["atividade"].isin([0, 1]))
+            .ffill()
+            .fillna(0)
+            .to_numpy(dtype=np.int8)
+        )
+    bordas = np.diff(estado, prepend=np.int8(0))
+    inicios = np.flatnonzero(bordas == 1)
+    fins = np.flatnonzero(bordas == -1)
+
+    aberto = len(fins) < len(inicios)
+    if aberto:
+        fins = np.append(fins, len(df) - 1)
+
+    timestamps = df["timestamp"].array
+    inicio_ts = timestamps[inicios]
+    fim_ts = timestamps[fins]
+    duracao = (fim_ts - inicio_ts).total_seconds() / 60
+
+    manter = np.asarray(duracao) > 0
+    if aberto:
+        manter[-1] = True
+
+    return pd.DataFrame(
+        {
+            "Tarefa": np.full(manter.sum(), "Atividade", dtype=object),
+            "Início": inicio_ts[manter],
+            "Fim": fim_ts[manter],
+            "Duração (min)": np.asarray(duracao)[manter],
+        }
+    )
+
+
+def self_generate_activity(length, transition_prob, rng=None):
+    """Cadeia de Markov de dois estados (repouso/atividade).
+
+    Cada sorteio abaixo de ``transition_prob`` troca o estado, então o estado
+    é a paridade da soma acumulada das transições.
+    """
+    rng = rng if rng is not None else np.random
+    if isinstance(rng, np.random.Generator):
+        sorteios = rng.random(length)
+    else:
+        sorteios = rng.rand(length)
+    return (np.cumsum(sorteios < transition_prob) & 1).astype(int)
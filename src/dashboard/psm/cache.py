@@ -0,0 +1,242 @@
+"""Cache de pacientes compartilhado por todas as sessões do dashboard.
+
+Cada paciente tem um ``EstadoPaciente`` com os componentes caros (histórico,
+detector, agregados, sincronização com a API...) e um retrato imutável dos
+dados publicado a cada atualização. Quem atualiza (a ingestão em segundo
+plano) segura o ``lock`` do paciente; as sessões só leem o último retrato,
+então o custo de um paciente não cresce com o número de pessoas
+acompanhando.
+
+O ``CachePacientes`` descarta pacientes sem acesso há mais de ``ttl`` e, por
+ordem de uso (LRU), os que excedem ``max_pacientes`` ou ``max_bytes``. A
+expulsão roda só quando entra um paciente novo ou a cada
+``intervalo_expulsao``, não a cada acesso; o tamanho de cada paciente é
+medido quando ele publica um retrato ou cria um componente e o cache mantém o
+total. Pacientes fixados (os que a ingestão acompanha) nunca são expulsos.
+"""
+
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+Retrato = namedtuple("Retrato", ["dados", "atividades", "versao", "atualizado_em"])
+
+
+class EstadoPaciente:
+    def __init__(self, chave, ao_medir=None):
+        self.chave = chave
+        self.lock = threading.RLock()
+        self.retrato = None
+        self.ultimo_acesso = time.monotonic()
+
+        self._ao_medir = ao_medir
+        self._nbytes = 0
+        self._componentes = {}
+        self._derivados = {}
+        self._lock_derivados = threading.Lock()
+        self._publicado = threading.Event()
+
+    @property
+    def versao(self):
+        return self.retrato.versao if self.retrato is not None else 0
+
+    @property
+    def nbytes(self):
+        """Tamanho medido na última publicação ou criação de componente."""
+        return self._nbytes
+
+    def medir(self):
+        total = sum(
+            getattr(componente, "nbytes", 0)
+            for componente in list(self._componentes.values())
+        )
+        retrato = self.retrato
+        if retrato is not None:
+            total += retrato.dados.memory_usage(index=False, deep=True).sum()
+        if self._ao_medir is not None:
+            self._ao_medir(self, int(total))
+        else:
+            self._nbytes = int(total)
+        return int(total)
+
+    @property
+    def linhas(self):
+        return len(self.retrato.dados) if self.retrato is not None else 0
+
+    def obter(self, nome, fabrica):
+        """Componente ``nome``, criado por ``fabrica()`` no primeiro uso."""
+        with self.lock:
+            if nome not in self._componentes:
+                self._componentes[nome] = fabrica()
+                self.medir()
+            return self._componentes[nome]
+
+    def componente(self, nome):
+        """Componente ``nome`` se já foi criado, sem criá-lo."""
+        with self.lock:
+            return self._componentes.get(nome)
+
+    def aguardar(self, timeout=None):
+        """Último retrato, esperando até ``timeout`` s pelo primeiro."""
+        self._publicado.wait(timeout)
+        return self.retrato
+
+    def publicar(self, dados, atividades):
+        """Publica cópias somente leitura de ``dados``/``atividades``."""
+        self.retrato = Retrato(
+            _congelar(dados), atividades.copy(), self.versao + 1, time.monotonic()
+        )
+        with self._lock_derivados:
+            self._derivados = {}
+        self.medir()
+        self._publicado.set()
+        return self.retrato
+
+    def derivado(self, versao, chave, funcao):
+        """Resultado de ``funcao()`` compartilhado enquanto ``versao`` for a atual.
+
+        Sessões com um retrato antigo calculam sem guardar.
+        """
+        if versao != self.versao:
+            return funcao()
+        with self._lock_derivados:
+            if chave in self._derivados:
+                return self._derivados[chave]
+        valor = funcao()
+        with self._lock_derivados:
+            if versao == self.versao:
+                self._derivados[chave] = valor
+        return valor
+
+
+class CachePacientes:
+    def __init__(
+        self,
+        ttl=None,
+        max_pacientes=None,
+        max_bytes=None,
+        intervalo_expulsao=timedelta(seconds=30),
+    ):
+        self.ttl = pd.Timedelta(ttl).total_seconds() if ttl is not None else None
+        self.max_pacientes = max_pacientes
+        self.max_bytes = max_bytes
+        self.intervalo_expulsao = pd.Timedelta(intervalo_expulsao).total_seconds()
+
+        self._estados = OrderedDict()
+        self._fixados = set()
+        self._nbytes = 0
+        self._expulso_em = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._estados)
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def memoria(self):
+        """Memória de cada paciente: total, linhas publicadas e bytes por linha."""
+        with self._lock:
+            estados = list(self._estados.items())
+        linhas = []
+        for chave, estado in estados:
+            total = estado.nbytes
+            linhas.append(
+                {
+                    "Paciente": str(chave),
+                    "Memória (KiB)": total / 1024,
+                    "Linhas": estado.linhas,
+                    "Bytes/linha": total / estado.linhas if estado.linhas else None,
+                }
+            )
+        return pd.DataFrame(
+            linhas, columns=["Paciente", "Memória (KiB)", "Linhas", "Bytes/linha"]
+        )
+
+    def estado(self, chave):
+        agora = time.monotonic()
+        with self._lock:
+            estado = self._estados.get(chave)
+            novo = estado is None
+            if novo:
+                estado = self._estados[chave] = EstadoPaciente(
+                    chave, ao_medir=self._registrar
+                )
+            self._estados.move_to_end(chave)
+            estado.ultimo_acesso = agora
+            if novo or agora - self._expulso_em >= self.intervalo_expulsao:
+                self._expulsar(manter=chave)
+                self._expulso_em = agora
+            return estado
+
+    def fixar(self, chave):
+        """Impede que ``chave`` seja expulsa (paciente acompanhado pela ingestão)."""
+        with self._lock:
+            self._fixados.add(chave)
+
+    def soltar(self, chave):
+        with self._lock:
+            self._fixados.discard(chave)
+
+    def remover(self, chave):
+        with self._lock:
+            self._descartar(chave)
+
+    def _registrar(self, estado, nbytes):
+        # Estados já expulsos (sessões com a referência) não entram no total
+        with self._lock:
+            if self._estados.get(estado.chave) is estado:
+                self._nbytes += nbytes - estado._nbytes
+            estado._nbytes = nbytes
+
+    def _expulsar(self, manter):
+        # Sessões que já têm o estado ou um retrato continuam com a referência
+        if self.ttl is not None:
+            limite = time.monotonic() - self.ttl
+            for chave in [
+                c
+                for c, e in self._estados.items()
+                if e.ultimo_acesso < limite and c != manter and c not in self._fixados
+            ]:
+                self._descartar(chave)
+
+        if self.max_pacientes is not None:
+            while len(self._estados) > max(self.max_pacientes, 1):
+                if self._remover_antigo(manter) is None:
+                    break
+
+        if self.max_bytes is not None:
+            while self._nbytes > self.max_bytes:
+                if self._remover_antigo(manter) is None:
+                    break
+
+    def _remover_antigo(self, manter):
+        chave = next(
+            (c for c in self._estados if c != manter and c not in self._fixados), None
+        )
+        if chave is not None:
+            self._descartar(chave)
+        return chave
+
+    def _descartar(self, chave):
+        estado = self._estados.pop(chave, None)
+        if estado is not None:
+            self._nbytes -= estado.nbytes
+
+
+def _congelar(df):
+    dados = {}
+    for nome in df.columns:
+        valores = df[nome].array
+        if isinstance(valores, pd.arrays.NumpyExtensionArray):
+            valores = np.array(valores.to_numpy(), copy=True)
+            valores.setflags(write=False)
+        else:
+            valores = valores.copy()
+        dados[nome] = valores
+    return pd.DataFrame(dados, index=pd.RangeIndex(len(df)), copy=False)
@@ -0,0 +1,133 @@
+"""Conversão dos payloads do Health Connect (HCGateway) em DataFrames tipados."""
+
+import numpy as np
+import pandas as pd
+
+from psm.alinhamento import AlinhadorSinais
+from psm.esquema import ESTADOS_DISPOSITIVO, aplicar_esquema
+
+COLUNAS_ATIVIDADES = ["Tarefa", "Início", "Fim", "Duração (min)"]
+
+
+def converter_dados_api(dados_api, alinhador=None, extras=None):
+    """Converte ``{metodo: [registros]}`` em ``(df_sinais, df_atividades)``.
+
+    As métricas são alinhadas numa grade regular pelo ``alinhador``
+    (incremental); sem ele o payload inteiro é alinhado de uma vez. ``extras``
+    recebe métricas de outras fontes, como a temperatura do DHT11.
+    """
+    metricas, df_atividades = converter_metricas(dados_api)
+    metricas.update(extras or {})
+
+    if alinhador is None:
+        combined_df = AlinhadorSinais().alinhar(metricas)
+    else:
+        combined_df = alinhador.atualizar(metricas)
+    if combined_df.empty:
+        return pd.DataFrame(), df_atividades
+
+    combined_df["atividade"] = marcar_atividade(
+        combined_df["timestamp"], df_atividades["Início"], df_atividades["Fim"]
+    )
+    combined_df["dispositivo_estado"] = pd.Categorical.from_codes(
+        np.zeros(len(combined_df), dtype=np.int8), dtype=ESTADOS_DISPOSITIVO
+    )
+    return aplicar_esquema(combined_df), df_atividades
+
+
+def converter_metricas(dados_api):
+    """Um DataFrame por métrica, cada um com o próprio ``timestamp``."""
+    bpm_raw = dados_api.get("heartRate") or []
+    amostras = [
+        amostra for registro in bpm_raw for amostra in registro["data"]["samples"]
+    ]
+    df_bpm = _serie(
+        [amostra["time"] for amostra in amostras],
+        batimento_cardiaco=[amostra["beatsPerMinute"] for amostra in amostras],
+    )
+
+    oxigenio_raw = dados_api.get("oxygenSaturation") or []
+    df_oxigenio = _serie(
+        [registro["start"] for registro in oxigenio_raw],
+        oxigenio=[registro["data"]["percentage"] for registro in oxigenio_raw],
+    )
+
+    pressao_raw = dados_api.get("bloodPressure") or []
+    df_pressao = _serie(
+        [registro["start"] for registro in pressao_raw],
+        pressao_sistolica=[
+            registro["data"]["systolic"]["inMillimetersOfMercury"]
+            for registro in pressao_raw
+        ],
+        pressao_diastolica=[
+            registro["data"]["diastolic"]["inMillimetersOfMercury"]
+            for registro in pressao_raw
+        ],
+    )
+
+    # Glicose e temperatura ainda não são coletadas pela API
+    metricas = {
+        "heartRate": df_bpm,
+        "oxygenSaturation": df_oxigenio,
+        "bloodPressure": df_pressao,
+    }
+    df_atividades = converter_atividades(dados_api.get("exerciseSession") or [])
+    return metricas, df_atividades
+
+
+def converter_atividades(exercicio_raw):
+    inicios = _timestamps([registro["start"] for registro in exercicio_raw])
+    fins = _timestamps([registro["end"] for registro in exercicio_raw])
+    return pd.DataFrame(
+        {
+            "Tarefa": "Atividade",
+            "Início": inicios,
+            "Fim": fins,
+            "Duração (min)": (fins - inicios).dt.total_seconds() / 60,
+        },
+        columns=COLUNAS_ATIVIDADES,
+    )
+
+
+def marcar_atividade(timestamps, inicios, fins):
+    """1 para timestamps dentro de alguma sessão ``[início, fim]``, 0 fora.
+
+    Junção por intervalos: as sessões são ordenadas pelo início e o fim
+    acumulado (máximo corrente) cobre sessões sobrepostas, então cada
+    timestamp é resolvido com uma única busca binária.
+    """
+    if len(inicios) == 0 or len(timestamps) == 0:
+        return np.zeros(len(timestamps), dtype=np.int64)
+
+    inicios = _para_ns(inicios)
+    fins = _para_ns(fins)
+    ordem = np.argsort(inicios, kind="stable")
+    inicios = inicios[ordem]
+    fim_acumulado = np.maximum.accumulate(fins[ordem])
+
+    valores = _para_ns(timestamps)
+    posicao = np.searchsorted(inicios, valores, side="right") - 1
+    dentro = (posicao >= 0) & (valores <= fim_acumulado[np.maximum(posicao, 0)])
+    return dentro.astype(np.int64)
+
+
+def _serie(timestamps, **colunas):
+    df = pd.DataFrame(
+        {
+            nome: np.asarray(valores, dtype=np.float64)
+            for nome, valores in colunas.items()
+        }
+    )
+    df.insert(0, "timestamp", _timestamps(timestamps))
+    return df
+
+
+def _timestamps(valores):
+    return pd.to_datetime(pd.Series(valores, dtype=object), format="ISO8601", utc=True)
+
+
+def _para_ns(valores):
+    valores = pd.Series(valores)
+    if valores.dt.tz is not None:
+        valores = valores.dt.tz_convert("UTC").dt.tz_localize(None)
+    return valores.to_numpy("datetime64[ns]").view(np.int64)
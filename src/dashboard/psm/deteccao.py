@@ -0,0 +1,284 @@
+"""Detecção incremental de anomalias por paciente.
+
+Os modelos ficam treinados entre os reruns do Streamlit: a cada tick apenas as
+amostras novas são pontuadas, e o retreino acontece por agenda (quantidade de
+amostras desde o último treino) ou quando a distribuição das amostras novas se
+afasta da usada no treino.
+
+Com um ``AgendadorTreinos`` (``psm.treino``) os ajustes rodam num pool de
+processos: o detector continua pontuando com os últimos modelos prontos
+enquanto o retreino não termina.
+
+Com uma ``TriagemEstatistica`` (``psm.triagem``) só as amostras marcadas
+pelos detectores estatísticos são pontuadas pelos modelos; as demais saem
+como normais.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from psm.vizinhanca import IndiceLOF
+
+COLUNAS_VITAIS = [
+    "batimento_cardiaco",
+    "temperatura",
+    "pressao_sistolica",
+    "pressao_diastolica",
+    "glicose",
+    "oxigenio",
+]
+
+
+Modelos = namedtuple(
+    "Modelos",
+    ["iso_forest", "lof", "anomalias_if", "anomalias_lof", "media", "desvio"],
+)
+
+
+def ajustar_modelos(X, capacidade=None):
+    """Ajusta IsolationForest e o índice do LOF sobre ``X`` já imputado."""
+    # O sklearn só é carregado no primeiro treino (custo de importação alto)
+    from sklearn.ensemble import IsolationForest
+
+    iso_forest = IsolationForest()
+    anomalias_if = iso_forest.fit_predict(X)
+
+    lof = IndiceLOF(capacidade=capacidade or len(X)).fit(X)
+    # Rótulos das próprias amostras de treino, equivalentes ao fit_predict
+    # do LOF sem novelty.
+    anomalias_lof = np.where(lof.negative_outlier_factor_ < lof.offset_, -1, 1)
+
+    desvio = X.std(axis=0)
+    return Modelos(
+        iso_forest,
+        lof,
+        anomalias_if,
+        anomalias_lof,
+        X.mean(axis=0),
+        np.where(desvio > 0, desvio, 1.0),
+    )
+
+
+def detectar_anomalias_lote(df):
+    """Ajusta IsolationForest e LOF sobre ``df`` inteiro (modo histórico)."""
+    if len(df) < 5:
+        df["Anomalia_IF"] = 1
+        df["Anomalia_LOF"] = 1
+        return df
+
+    modelos = ajustar_modelos(df[COLUNAS_VITAIS].to_numpy(dtype=float))
+    df["Anomalia_IF"] = modelos.anomalias_if
+    df["Anomalia_LOF"] = modelos.anomalias_lof
+
+    return df
+
+
+class DetectorAnomalias:
+    """Mantém IsolationForest e o índice do LOF treinados para um paciente.
+
+    O custo por tick depende só do tamanho do lote novo; o treino usa no
+    máximo ``janela_treino`` amostras recentes. Com ``agendador`` o treino é
+    assíncrono e, até o primeiro ficar pronto, as amostras saem como normais.
+    Com ``triagem`` os modelos só pontuam as candidatas da primeira camada.
+    """
+
+    def __init__(
+        self,
+        min_amostras=5,
+        janela_treino=5000,
+        retreino_amostras=500,
+        limiar_drift=2.0,
+        agendador=None,
+        triagem=None,
+    ):
+        self.min_amostras = min_amostras
+        self.janela_treino = janela_treino
+        self.retreino_amostras = retreino_amostras
+        self.limiar_drift = limiar_drift
+        self.agendador = agendador
+        self.triagem = triagem
+
+        self.iso_forest = None
+        self.lof = None
+        self.treinos = 0
+        self._janela = np.empty((0, len(COLUNAS_VITAIS)))
+        self._amostras_desde_treino = 0
+        self._media = None
+        self._desvio = None
+        self._treino = None
+        # Amostras que chegaram depois da cópia da janela enviada ao treino
+        self._desde_submissao = 0
+
+        self.pontuadas = 0
+        self.confirmadas = 0
+        self.perdidas = 0
+
+    @property
+    def treinado(self):
+        return self.iso_forest is not None
+
+    @property
+    def treinando(self):
+        return self._treino is not None
+
+    def detectar(self, df):
+        """Preenche ``Anomalia_IF``/``Anomalia_LOF`` apenas para as linhas de ``df``."""
+        if df.empty:
+            df["Anomalia_IF"] = np.array([], dtype=int)
+            df["Anomalia_LOF"] = np.array([], dtype=int)
+            return df
+
+        novos = df[COLUNAS_VITAIS].to_numpy(dtype=float)
+        self._janela = np.concatenate([self._janela, novos])[-self.janela_treino :]
+        candidatas = self.triagem.avaliar(novos) if self.triagem is not None else None
+        novos = self._imputar(novos)
+        self._amostras_desde_treino += len(novos)
+
+        if len(self._janela) < self.min_amostras:
+            df["Anomalia_IF"] = 1
+            df["Anomalia_LOF"] = 1
+            return df
+
+        if self.agendador is not None:
+            return self._detectar_assincrono(df, novos, candidatas)
+
+        if self._precisa_retreino(novos):
+            anomalias_if, anomalias_lof = self._treinar(self._imputar(self._janela))
+            # Lotes maiores que a janela: o excedente antigo é só pontuado
+            excedente = len(novos) - len(self._janela)
+            if excedente > 0:
+                anomalias_if = np.concatenate(
+                    [self.iso_forest.predict(novos[:excedente]), anomalias_if]
+                )
+                anomalias_lof = np.concatenate(
+                    [self.lof.predict(novos[:excedente]), anomalias_lof]
+                )
+            anomalias_if = anomalias_if[-len(novos) :]
+            anomalias_lof = anomalias_lof[-len(novos) :]
+            if self._filtrar(candidatas):
+                anomalias_if = np.where(candidatas, anomalias_if, 1)
+                anomalias_lof = np.where(candidatas, anomalias_lof, 1)
+            self._contabilizar(candidatas, anomalias_if, anomalias_lof)
+        else:
+            anomalias_if, anomalias_lof = self._pontuar(novos, candidatas)
+
+        df["Anomalia_IF"] = anomalias_if
+        df["Anomalia_LOF"] = anomalias_lof
+        return df
+
+    def reiniciar_contagem(self):
+        """Zera as amostras acumuladas para o retreino agendado.
+
+        O próximo retreino volta a esperar ``retreino_amostras`` amostras (o
+        retreino por drift continua valendo).
+        """
+        self._amostras_desde_treino = 0
+
+    def estatisticas(self):
+        """Taxas das duas camadas (a primeira só existe com ``triagem``).
+
+        ``perdidas`` são anomalias dos modelos fora das candidatas, medidas
+        apenas no modo completo.
+        """
+        estatisticas = self.triagem.taxas() if self.triagem is not None else {}
+        estatisticas["pontuadas"] = self.pontuadas
+        estatisticas["confirmadas"] = self.confirmadas / max(self.pontuadas, 1)
+        estatisticas["perdidas"] = self.perdidas
+        return estatisticas
+
+    def _detectar_assincrono(self, df, novos, candidatas):
+        if self._treino is not None and self._treino.done():
+            treino, self._treino = self._treino, None
+            self._instalar(treino.result())
+            self._repor(len(novos))
+        if self._treino is None and self._precisa_retreino(novos):
+            self._treino = self.agendador.ajustar(self._imputar(self._janela))
+            self._amostras_desde_treino = 0
+            self._desde_submissao = 0
+        elif self._treino is not None:
+            self._desde_submissao += len(novos)
+
+        if self.treinado:
+            df["Anomalia_IF"], df["Anomalia_LOF"] = self._pontuar(novos, candidatas)
+        else:
+            df["Anomalia_IF"] = 1
+            df["Anomalia_LOF"] = 1
+        return df
+
+    def _repor(self, n_novos):
+        # O índice novo foi montado com a janela do momento do envio; as
+        # amostras seguintes (fora o lote atual, que ``_pontuar`` adiciona)
+        # só tinham ido para o índice antigo
+        n = min(self._desde_submissao, len(self._janela) - n_novos)
+        self._desde_submissao = 0
+        if n > 0:
+            fim = len(self._janela) - n_novos
+            self.lof.adicionar(self._imputar(self._janela[fim - n : fim]))
+
+    def _filtrar(self, candidatas):
+        return candidatas is not None and self.triagem.modo == "camadas"
+
+    def _pontuar(self, novos, candidatas):
+        if not self._filtrar(candidatas):
+            anomalias_if = self.iso_forest.predict(novos)
+            anomalias_lof = self.lof.predict(novos)
+        else:
+            anomalias_if = np.ones(len(novos), dtype=int)
+            anomalias_lof = np.ones(len(novos), dtype=int)
+            if candidatas.any():
+                anomalias_if[candidatas] = self.iso_forest.predict(novos[candidatas])
+                anomalias_lof[candidatas] = self.lof.predict(novos[candidatas])
+        self._contabilizar(candidatas, anomalias_if, anomalias_lof)
+        # Entre um treino e outro o índice do LOF acompanha a janela
+        self.lof.adicionar(novos)
+        return anomalias_if, anomalias_lof
+
+    def _contabilizar(self, candidatas, anomalias_if, anomalias_lof):
+        anomalas = (anomalias_if == -1) | (anomalias_lof == -1)
+        if self._filtrar(candidatas):
+            self.pontuadas += int(candidatas.sum())
+            self.confirmadas += int(anomalas[candidatas].sum())
+            return
+        self.pontuadas += len(anomalas)
+        self.confirmadas += int(anomalas.sum())
+        if candidatas is not None:
+            self.perdidas += int(anomalas[~candidatas].sum())
+
+    def _imputar(self, X):
+        # Vitais ausentes (métrica sem amostra recente ou não coletada) são
+        # preenchidos com a média da janela, ou 0 se a coluna não tem dados.
+        if not np.isnan(X).any():
+            return X
+        contagem = np.sum(~np.isnan(self._janela), axis=0)
+        medias = np.where(
+            contagem > 0, np.nansum(self._janela, axis=0) / np.maximum(contagem, 1), 0.0
+        )
+        return np.where(np.isnan(X), medias, X)
+
+    def _precisa_retreino(self, novos):
+        if not self.treinado:
+            return True
+
+        # Enquanto a janela ainda é pequena o intervalo cresce junto com ela
+        # (retreino geométrico); depois segue a agenda fixa.
+        intervalo = min(self.retreino_amostras, len(self._janela) - len(novos))
+        if self._amostras_desde_treino >= max(intervalo, 1):
+            return True
+
+        deslocamento = np.abs(novos.mean(axis=0) - self._media) / self._desvio
+        return bool(np.nanmax(deslocamento) > self.limiar_drift)
+
+    def _treinar(self, X):
+        modelos = ajustar_modelos(X)
+        self._instalar(modelos)
+        self._amostras_desde_treino = 0
+        return modelos.anomalias_if, modelos.anomalias_lof
+
+    def _instalar(self, modelos):
+        self.iso_forest = modelos.iso_forest
+        self.lof = modelos.lof
+        self.lof.capacidade = self.janela_treino
+        self._media = modelos.media
+        self._desvio = modelos.desvio
+        self.treinos += 1
@@ -0,0 +1,204 @@
+"""Visão da enfermaria: a última leitura de cada paciente contra os limites.
+
+O ``PainelEnfermaria`` mantém uma matriz pacientes × vitais com os valores
+mais recentes (atualizada a cada retrato publicado pela ingestão) e as
+matrizes de mínimos e máximos específicos de cada paciente (NaN onde vale o
+limite padrão). ``avaliar`` compara a enfermaria inteira numa única operação
+numpy e devolve a grade de triagem ordenada pela gravidade, então o custo
+por atualização não depende de laços em Python sobre os pacientes.
+
+Limites específicos são por paciente: ``paciente_de(chave)`` diz a qual
+paciente pertence cada linha (simulação e API do mesmo paciente, por
+exemplo). Os limites de todos os pacientes (``padrao``) também ficam aqui,
+para que a grade e o motor de alertas usem os mesmos.
+"""
+
+import copy
+import threading
+
+import numpy as np
+import pandas as pd
+
+from psm.alertas import LIMITES_PADRAO, avaliar_limites, vetores_limites
+
+
+class PainelEnfermaria:
+    def __init__(self, vitais=None, paciente_de=None, capacidade=64, padrao=None):
+        self.vitais = list(vitais if vitais is not None else LIMITES_PADRAO)
+        self.paciente_de = paciente_de or (lambda chave: chave)
+        self.padrao = copy.deepcopy(padrao if padrao is not None else LIMITES_PADRAO)
+
+        self._chaves = []
+        self._linhas = {}
+        self._especificos = {}
+        self._lock = threading.Lock()
+        self._alocar(capacidade)
+
+    def __len__(self):
+        return len(self._chaves)
+
+    def atualizar(self, chave, dados):
+        """Guarda a última linha de ``dados``; ``None`` retira o paciente."""
+        if dados is None:
+            self.remover(chave)
+            return
+        if dados.empty:
+            return
+        valores = np.array(
+            [dados[v].iat[-1] if v in dados.columns else np.nan for v in self.vitais],
+            dtype=float,
+        )
+        self.atualizar_varios([chave], valores[None, :], [dados["timestamp"].iat[-1]])
+
+    def atualizar_varios(self, chaves, valores, timestamps):
+        """Substitui as linhas de ``chaves`` por ``valores`` (pacientes × vitais)."""
+        tempos = pd.DatetimeIndex(timestamps)
+        if tempos.tz is not None:
+            tempos = tempos.tz_convert("UTC").tz_localize(None)
+        with self._lock:
+            linhas = np.fromiter(
+                (self._linha(chave) for chave in chaves),
+                dtype=np.intp,
+                count=len(chaves),
+            )
+            self._valores[linhas] = valores
+            self._atualizado[linhas] = tempos.asi8
+
+    def remover(self, chave):
+        with self._lock:
+            linha = self._linhas.pop(chave, None)
+            if linha is None:
+                return
+            # A última linha ocupa o lugar da removida
+            ultima = len(self._chaves) - 1
+            if linha != ultima:
+                movida = self._chaves[ultima]
+                self._chaves[linha] = movida
+                self._linhas[movida] = linha
+                for matriz in self._matrizes():
+                    matriz[linha] = matriz[ultima]
+            self._chaves.pop()
+
+    def definir_padrao(self, limites):
+        """Limites de todos os pacientes (no formato de ``LIMITES_PADRAO``)."""
+        # Troca da referência: leitores em outras threads veem um ou outro
+        self.padrao = copy.deepcopy(limites)
+
+    def definir_limites(self, paciente, limites):
+        """Limites de ``paciente`` que substituem os padrão (``{vital: {"min", "max"}}``)."""
+        with self._lock:
+            self._especificos[paciente] = copy.deepcopy(limites)
+            self._reaplicar_limites(paciente)
+
+    def remover_limites(self, paciente):
+        with self._lock:
+            self._especificos.pop(paciente, None)
+            self._reaplicar_limites(paciente)
+
+    def tem_limites(self, paciente):
+        return bool(self._especificos.get(paciente))
+
+    def limites_paciente(self, paciente, padrao=None):
+        """``padrao`` (o da enfermaria se omitido) com os limites de ``paciente``."""
+        limites = copy.deepcopy(padrao if padrao is not None else self.padrao)
+        for vital, especifico in self._especificos.get(paciente, {}).items():
+            if vital in limites:
+                limites[vital].update(
+                    {k: especifico[k] for k in ("min", "max") if k in especifico}
+                )
+        return limites
+
+    def avaliar(self, padrao=None):
+        """Grade de triagem da enfermaria, mais grave primeiro.
+
+        Colunas: ``chave``, ``violacoes`` (vitais fora dos limites),
+        ``gravidade`` (soma das distâncias fora da faixa, em larguras da
+        faixa), ``atualizado_em``, os valores de cada vital e ``status_<vital>``
+        (-1 abaixo, 1 acima, 0 dentro).
+        """
+        with self._lock:
+            n = len(self._chaves)
+            chaves = list(self._chaves)
+            valores = self._valores[:n].copy()
+            minimos = self._minimos[:n].copy()
+            maximos = self._maximos[:n].copy()
+            atualizado = self._atualizado[:n].copy()
+
+        padrao_min, padrao_max = vetores_limites(
+            padrao if padrao is not None else self.padrao, self.vitais
+        )
+        minimos = np.where(np.isnan(minimos), padrao_min, minimos)
+        maximos = np.where(np.isnan(maximos), padrao_max, maximos)
+
+        status = avaliar_limites(valores, minimos, maximos)
+        faixa = np.abs(maximos - minimos)
+        # Faixa degenerada (mín == máx): distância na unidade do vital
+        faixa = np.where(faixa > 0, faixa, 1.0)
+        fora = (
+            np.where(
+                status > 0,
+                valores - maximos,
+                np.where(status < 0, minimos - valores, 0.0),
+            )
+            / faixa
+        )
+        gravidade = fora.sum(axis=1)
+        violacoes = (status != 0).sum(axis=1)
+        ordem = np.lexsort((-gravidade, -violacoes))
+
+        grade = pd.DataFrame(
+            {
+                "chave": pd.Series(chaves, dtype=object).iloc[ordem].to_numpy(),
+                "violacoes": violacoes[ordem],
+                "gravidade": gravidade[ordem],
+                "atualizado_em": pd.to_datetime(atualizado[ordem]),
+            }
+        )
+        for i, vital in enumerate(self.vitais):
+            grade[vital] = valores[ordem, i]
+        for i, vital in enumerate(self.vitais):
+            grade[f"status_{vital}"] = status[ordem, i]
+        return grade
+
+    def _linha(self, chave):
+        linha = self._linhas.get(chave)
+        if linha is not None:
+            return linha
+        linha = len(self._chaves)
+        if linha == len(self._valores):
+            self._alocar(max(2 * linha, 1))
+        self._chaves.append(chave)
+        self._linhas[chave] = linha
+        self._valores[linha] = np.nan
+        self._atualizado[linha] = 0
+        self._aplicar_limites(linha, self.paciente_de(chave))
+        return linha
+
+    def _reaplicar_limites(self, paciente):
+        for chave, linha in self._linhas.items():
+            if self.paciente_de(chave) == paciente:
+                self._aplicar_limites(linha, paciente)
+
+    def _aplicar_limites(self, linha, paciente):
+        especificos = self._especificos.get(paciente, {})
+        for i, vital in enumerate(self.vitais):
+            especifico = especificos.get(vital, {})
+            self._minimos[linha, i] = especifico.get("min", np.nan)
+            self._maximos[linha, i] = especifico.get("max", np.nan)
+
+    def _alocar(self, capacidade):
+        forma = (capacidade, len(self.vitais))
+        novas = (
+            np.full(forma, np.nan),
+            np.full(forma, np.nan),
+            np.full(forma, np.nan),
+            np.zeros(capacidade, dtype=np.int64),
+        )
+        if hasattr(self, "_valores"):
+            n = len(self._chaves)
+            for nova, atual in zip(novas, self._matrizes()):
+                nova[:n] = atual[:n]
+        self._valores, self._minimos, self._maximos, self._atualizado = novas
+
+    def _matrizes(self):
+        return (self._valores, self._minimos, self._maximos, self._atualizado)
@@ -0,0 +1,249 @@
+"""Exportação do histórico de pacientes em CSV ou Parquet, em blocos.
+
+``exportar`` lê o ``ArmazemParquet`` um dia de cada vez (``ler_blocos``) e
+devolve um gerador de ``bytes`` pronto para ser enviado numa resposta HTTP
+em partes ou gravado num arquivo: a memória usada é a de um dia de um
+paciente, qualquer que seja o período ou o número de pacientes.
+
+Com ``resolucao`` cada dia é reduzido pelos mesmos agregados do modo
+histórico (média, mínimo e máximo por vital e contadores por intervalo).
+Os intervalos são alinhados em UTC, como as partições diárias do armazém,
+então nenhum intervalo fica dividido entre dois blocos.
+
+Links de download abertos pelo navegador não levam o segredo do serviço:
+``assinar`` acrescenta aos parâmetros uma validade (``expira``) e um HMAC
+deles (``assinatura``), conferidos por ``verificar_assinatura``.
+
+Uso (a partir de ``src/dashboard``)::
+
+    python -m psm.exportacao --pacientes "Paciente 1 - Pós-Cirúrgico" --dias 90 \\
+        --formato parquet --saida historico.parquet
+"""
+
+import argparse
+import hashlib
+import hmac
+import io
+import sys
+import time
+from datetime import timedelta
+from urllib.parse import urlencode
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from psm.agregados import RESOLUCOES, AgregadosPaciente
+from psm.armazenamento import ArmazemParquet
+from psm.esquema import FUSO_LOCAL, aplicar_esquema, localizar
+
+FORMATOS = {
+    "csv": ("text/csv", ".csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+
+def exportar(
+    armazem,
+    pacientes,
+    inicio=None,
+    fim=None,
+    colunas=None,
+    formato="csv",
+    resolucao=None,
+):
+    """Gerador de ``bytes`` do histórico de ``pacientes`` em ``[inicio, fim]``.
+
+    A primeira coluna é ``paciente`` e a segunda ``timestamp``; ``colunas``
+    limita as demais (com ``resolucao``, ``<vital>`` seleciona também
+    ``<vital>_min``/``<vital>_max``). Períodos sem fuso são do horário local.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato}")
+    if resolucao is not None and resolucao not in RESOLUCOES:
+        raise ValueError(f"Resolução desconhecida: {resolucao}")
+    inicio, fim = _com_fuso(inicio), _com_fuso(fim)
+
+    blocos = (
+        df
+        for paciente in pacientes
+        for df in _blocos_paciente(
+            armazem, paciente, inicio, fim, colunas, resolucao
+        )
+    )
+    if formato == "csv":
+        return _csv(blocos)
+    return _parquet(blocos)
+
+
+def assinar(parametros, segredo, validade=timedelta(minutes=5)):
+    """Cópia de ``parametros`` com ``expira`` (epoch, s) e ``assinatura``."""
+    assinados = dict(parametros)
+    assinados["expira"] = str(int(time.time() + validade.total_seconds()))
+    assinados["assinatura"] = _hmac(assinados, segredo)
+    return assinados
+
+
+def verificar_assinatura(parametros, segredo):
+    """Se ``parametros`` (``str`` ou listas) têm assinatura válida e não expirada."""
+    assinatura = parametros.get("assinatura")
+    expira = parametros.get("expira")
+    if isinstance(assinatura, list):
+        assinatura = assinatura[-1] if assinatura else None
+    if isinstance(expira, list):
+        expira = expira[-1] if expira else None
+    if not assinatura or not expira or not expira.isdigit():
+        return False
+    if not hmac.compare_digest(assinatura, _hmac(parametros, segredo)):
+        return False
+    return int(expira) >= time.time()
+
+
+def _hmac(parametros, segredo):
+    # Forma canônica: pares (nome, valor) ordenados, sem a própria assinatura
+    pares = sorted(
+        (nome, valor)
+        for nome, valores in parametros.items()
+        if nome != "assinatura"
+        for valor in (valores if isinstance(valores, list) else [valores])
+    )
+    return hmac.new(
+        segredo.encode("utf-8"), urlencode(pares).encode("utf-8"), hashlib.sha256
+    ).hexdigest()
+
+
+def _blocos_paciente(armazem, paciente, inicio, fim, colunas, resolucao):
+    leitura = None if resolucao is not None else colunas
+    for df in armazem.ler_blocos(paciente, inicio, fim, colunas=leitura):
+        df = aplicar_esquema(df)
+        if resolucao is not None:
+            agregados = AgregadosPaciente(resolucoes=[resolucao])
+            agregados.adicionar(df)
+            df = agregados.consultar(
+                df["timestamp"].iat[0], df["timestamp"].iat[-1], resolucao=resolucao
+            )
+            df = aplicar_esquema(df[_selecionadas(df.columns, colunas)])
+        df.insert(0, "paciente", str(paciente))
+        yield df
+
+
+def _selecionadas(disponiveis, colunas):
+    if colunas is None:
+        return list(disponiveis)
+    pedidas = {"timestamp", *colunas}
+    return [
+        nome
+        for nome in disponiveis
+        if nome in pedidas or nome.rsplit("_", 1)[0] in pedidas
+    ]
+
+
+def _csv(blocos):
+    colunas = None
+    for df in blocos:
+        cabecalho = colunas is None
+        if cabecalho:
+            colunas = list(df.columns)
+        # Dias de arquivos antigos podem não ter alguma coluna
+        yield (
+            df.reindex(columns=colunas)
+            .to_csv(index=False, header=cabecalho)
+            .encode("utf-8")
+        )
+
+
+def _parquet(blocos):
+    saida = _Vazao()
+    escritor = None
+    for df in blocos:
+        if escritor is None:
+            tabela = pa.Table.from_pandas(df, preserve_index=False)
+            escritor = pq.ParquetWriter(pa.PythonFile(saida, mode="w"), tabela.schema)
+        else:
+            tabela = pa.Table.from_pandas(
+                df.reindex(columns=escritor.schema.names),
+                schema=escritor.schema,
+                preserve_index=False,
+            )
+        escritor.write_table(tabela)
+        yield saida.esvaziar()
+    if escritor is not None:
+        escritor.close()
+        yield saida.esvaziar()
+
+
+class _Vazao(io.RawIOBase):
+    """Destino só de escrita cujos bytes são retirados por ``esvaziar``.
+
+    ``tell`` conta tudo o que já foi escrito: o rodapé do Parquet guarda
+    posições absolutas no arquivo.
+    """
+
+    def __init__(self):
+        self._partes = []
+        self._posicao = 0
+
+    def writable(self):
+        return True
+
+    def write(self, dados):
+        dados = bytes(dados)
+        self._partes.append(dados)
+        self._posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self._posicao
+
+    def esvaziar(self):
+        dados = b"".join(self._partes)
+        self._partes = []
+        return dados
+
+
+def _com_fuso(valor):
+    if valor is None:
+        return None
+    valor = pd.Timestamp(valor)
+    return localizar(valor) if valor.tzinfo is None else valor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--destino", default="dados", help="Raiz do armazém")
+    parser.add_argument(
+        "--pacientes", nargs="+", help="Pacientes do armazém (padrão: todos)"
+    )
+    parser.add_argument("--inicio", help="Data/hora inicial (ISO 8601)")
+    parser.add_argument("--fim", help="Data/hora final (ISO 8601)")
+    parser.add_argument("--dias", type=float, help="Últimos N dias (sem --inicio)")
+    parser.add_argument("--colunas", nargs="+")
+    parser.add_argument("--formato", choices=list(FORMATOS), default="csv")
+    parser.add_argument("--resolucao", choices=RESOLUCOES)
+    parser.add_argument("--saida", help="Arquivo de saída (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    armazem = ArmazemParquet(args.destino)
+    inicio = args.inicio
+    if inicio is None and args.dias is not None:
+        inicio = pd.Timestamp.now(tz=FUSO_LOCAL) - pd.Timedelta(days=args.dias)
+    blocos = exportar(
+        armazem,
+        args.pacientes or armazem.pacientes(),
+        inicio,
+        args.fim,
+        colunas=args.colunas,
+        formato=args.formato,
+        resolucao=args.resolucao,
+    )
+    saida = open(args.saida, "wb") if args.saida else sys.stdout.buffer
+    try:
+        for bloco in blocos:
+            saida.write(bloco)
+    finally:
+        if args.saida:
+            saida.close()
+
+
+if __name__ == "__main__":
+    main()
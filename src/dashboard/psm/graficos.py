@@ -0,0 +1,259 @@
+"""Gráficos Plotly do dashboard."""
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from psm.reducao import agrupar_intervalos, reduzir
+
+COLOR_PALETTE = ["#3498DB", "#2ECC71", "#E74C3C", "#9B59B6", "#F1C40F"]
+
+
+# (coluna, nome, cor, linha, coluna do subplot)
+SERIES_VITAIS = [
+    ("temperatura", "Temperatura", COLOR_PALETTE[0], 1, 1),
+    ("batimento_cardiaco", "BPM", COLOR_PALETTE[1], 1, 2),
+    ("oxigenio", "SpO2", COLOR_PALETTE[2], 2, 1),
+    ("pressao_sistolica", "Sistólica", COLOR_PALETTE[3], 2, 2),
+    ("pressao_diastolica", "Diastólica", COLOR_PALETTE[0], 2, 2),
+    ("glicose", "Glicose", COLOR_PALETTE[2], 3, 1),
+]
+
+
+def create_vital_chart(df, df_atividades, largura=1200, metodo="minmax"):
+    """Sinais vitais em WebGL, com no máximo ``largura`` pontos por série.
+
+    ``largura`` é a largura do gráfico em pixels; cada subplot ocupa metade
+    dela e recebe até dois pontos (mínimo e máximo) por coluna de pixels.
+    """
+    fig = make_subplots(
+        rows=3,
+        cols=2,
+        subplot_titles=(
+            "Temperatura Corporal",
+            "Batimento Cardíaco",
+            "Oxigênio no Sangue",
+            "Pressão Arterial",
+            "Níveis de Glicose",
+            "Atividades Físicas",
+        ),
+        vertical_spacing=0.25,
+    )
+
+    if not df.empty:
+        timestamps = df["timestamp"]
+        tempos_ns = _para_ns(timestamps)
+        agregado = "linhas" in df.columns and (df["linhas"] > 1).any()
+        for coluna, nome, cor, linha, col in SERIES_VITAIS:
+            if agregado:
+                _adicionar_faixa(fig, df, tempos_ns, coluna, cor, linha, col, largura)
+            indices = reduzir(tempos_ns, df[coluna].to_numpy(), largura, metodo)
+            fig.add_trace(
+                go.Scattergl(
+                    x=timestamps.iloc[indices],
+                    y=df[coluna].iloc[indices],
+                    name=nome,
+                    line=dict(color=cor, width=2),
+                ),
+                row=linha,
+                col=col,
+            )
+
+    if not df_atividades.empty:
+        fig.add_trace(_trace_atividades(df_atividades, largura), row=3, col=2)
+    else:
+        fig.add_annotation(
+            text="Nenhuma atividade física registrada",
+            xref="paper",
+            yref="paper",
+            x=0.5,
+            y=0.5,
+            showarrow=False,
+            row=3,
+            col=2,
+        )
+
+    fig.update_layout(height=600, template="plotly_white", showlegend=False)
+    return fig
+
+
+def _adicionar_faixa(fig, df, tempos_ns, coluna, cor, linha, col, largura):
+    """Faixa mínimo-máximo de cada intervalo agregado, atrás da média."""
+    minimos = df[f"{coluna}_min"].to_numpy()
+    maximos = df[f"{coluna}_max"].to_numpy()
+    indices = np.union1d(
+        reduzir(tempos_ns, minimos, largura), reduzir(tempos_ns, maximos, largura)
+    )
+    for valores, preenchimento in ((maximos, "none"), (minimos, "tonexty")):
+        fig.add_trace(
+            go.Scattergl(
+                x=df["timestamp"].iloc[indices],
+                y=valores[indices],
+                mode="lines",
+                line=dict(color=cor, width=0),
+                fill=preenchimento,
+                fillcolor=_transparente(cor),
+                hoverinfo="skip",
+            ),
+            row=linha,
+            col=col,
+        )
+
+
+def _transparente(cor, alfa=0.2):
+    r, g, b = (int(cor[i : i + 2], 16) for i in (1, 3, 5))
+    return f"rgba({r}, {g}, {b}, {alfa})"
+
+
+def _trace_atividades(df_atividades, largura):
+    """Todas as sessões num único trace, separadas por ``None``.
+
+    Com mais sessões que pixels, sessões mais próximas que um pixel são
+    unidas num só segmento.
+    """
+    df_atividades = df_atividades.sort_values("Início", kind="stable")
+    segmentos = df_atividades.assign(Sessões=1)
+    if len(df_atividades) > largura:
+        inicios = _para_ns(df_atividades["Início"])
+        fins = _para_ns(df_atividades["Fim"])
+        folga = (fins.max() - inicios.min()) // max(largura // 2, 1)
+        grupos = agrupar_intervalos(inicios, fins, folga)
+        segmentos = segmentos.groupby(grupos).agg(
+            {
+                "Tarefa": "first",
+                "Início": "min",
+                "Fim": "max",
+                "Duração (min)": "sum",
+                "Sessões": "sum",
+            }
+        )
+
+    textos = [
+        f"Duração: {duracao:.1f} minutos<br>Início: {inicio}<br>Fim: {fim}"
+        + (f"<br>Sessões: {sessoes}" if sessoes > 1 else "")
+        for inicio, fim, duracao, sessoes in zip(
+            segmentos["Início"],
+            segmentos["Fim"],
+            segmentos["Duração (min)"],
+            segmentos["Sessões"],
+        )
+    ]
+
+    n = len(segmentos)
+    x = np.empty(3 * n, dtype=object)
+    x[0::3] = segmentos["Início"].to_numpy(dtype=object)
+    x[1::3] = segmentos["Fim"].to_numpy(dtype=object)
+    y = np.empty(3 * n, dtype=object)
+    y[0::3] = segmentos["Tarefa"].to_numpy(dtype=object)
+    y[1::3] = y[0::3]
+    texto = np.empty(3 * n, dtype=object)
+    texto[0::3] = textos
+    texto[1::3] = textos
+
+    return go.Scatter(
+        x=x,
+        y=y,
+        mode="lines",
+        line=dict(color=COLOR_PALETTE[1], width=20),
+        hoverinfo="text",
+        text=texto,
+        connectgaps=False,
+        name="",
+    )
+
+
+def _para_ns(valores):
+    valores = pd.Series(valores)
+    if valores.dt.tz is not None:
+        valores = valores.dt.tz_convert("UTC").dt.tz_localize(None)
+    return valores.to_numpy("datetime64[ns]").view(np.int64)
+
+
+def create_anomaly_chart(df):
+    fig = go.Figure()
+
+    if not df.empty and "Motivo" in df.columns:
+        # Convert timestamp to datetime if not already
+        df["Data/Hora"] = pd.to_datetime(df["Data/Hora"], dayfirst=True)
+
+        # Split and explode motives
+        df_exp = df.copy()
+        df_exp["Motivo"] = df_exp["Motivo"].str.split(", ")
+        df_exp = df_exp.explode("Motivo").reset_index(drop=True)
+
+        # Clean motives and handle empty values
+        df_exp["Motivo"] = (
+            df_exp["Motivo"].fillna("No Anomaly").replace("", "No Anomaly")
+        )
+
+        # Filter out non-anomaly entries if needed
+        df_exp = df_exp[df_exp["Motivo"] != "No Anomaly"]
+
+        # Create proper counts using EXPLODED dataframe
+        grouped = (
+            df_exp.groupby(["Data/Hora", "Motivo"])
+            .size()
+            .unstack(fill_value=0)
+            .reset_index()
+            .melt(id_vars="Data/Hora", value_name="count", var_name="motive")
+        )
+
+        # Create color mapping
+        motives = grouped["motive"].unique()
+        color_map = {
+            m: COLOR_PALETTE[i % len(COLOR_PALETTE)] for i, m in enumerate(motives)
+        }
+
+        # Add stacked bars
+        for motive in motives:
+            motive_df = grouped[grouped["motive"] == motive]
+            fig.add_trace(
+                go.Bar(
+                    x=motive_df["Data/Hora"],
+                    y=motive_df["count"],
+                    name=motive,
+                    marker_color=color_map[motive],
+                )
+            )
+
+        # Configure layout
+        fig.update_layout(
+            barmode="stack",
+            height=400,
+            template="plotly_white",
+            xaxis_title="Timestamp",
+            yaxis_title="Total Anomalies",
+            hovermode="x unified",
+            legend_title="Anomaly Motive",
+            xaxis=dict(type="date", tickformat="%Y-%m-%d %H:%M"),
+        )
+
+    return fig
+
+
+def create_anomaly_count_chart(df):
+    """Anomalias por intervalo a partir dos agregados (``anomalias_if``/``_lof``)."""
+    fig = go.Figure()
+    if df.empty:
+        return fig
+
+    for coluna, nome, cor in (
+        ("anomalias_if", "IsolationForest", COLOR_PALETTE[0]),
+        ("anomalias_lof", "LOF", COLOR_PALETTE[2]),
+    ):
+        fig.add_trace(
+            go.Bar(x=df["timestamp"], y=df[coluna], name=nome, marker_color=cor)
+        )
+
+    fig.update_layout(
+        barmode="stack",
+        height=400,
+        template="plotly_white",
+        xaxis_title="Timestamp",
+        yaxis_title="Total Anomalies",
+        hovermode="x unified",
+        legend_title="Modelo",
+        xaxis=dict(type="date", tickformat="%Y-%m-%d %H:%M"),
+    )
+    return fig
@@ -0,0 +1,134 @@
+"""Cliente HTTP para a API HCGateway.
+
+Mantém uma única sessão ``requests`` (pool de conexões keep-alive), guarda o
+token de acesso até perto da expiração e renova-o quando a API responde 401.
+As métricas são buscadas em paralelo por um pool de threads.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Usado quando o login não informa a expiração do token.
+VALIDADE_TOKEN_PADRAO = timedelta(hours=1)
+MARGEM_EXPIRACAO = timedelta(seconds=30)
+
+
+class ClienteHCGateway:
+    def __init__(
+        self,
+        base_url,
+        usuario,
+        senha,
+        timeout=(3.05, 10),
+        tentativas=3,
+        max_workers=8,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.usuario = usuario
+        self.senha = senha
+        self.timeout = timeout
+
+        retry = Retry(
+            total=tentativas,
+            backoff_factor=0.2,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"POST"}),
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_workers, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="hcgateway"
+        )
+        self._lock = threading.Lock()
+        self._token = None
+        self._expira_em = None
+
+    def token(self, invalido=None):
+        """Token atual; ``invalido`` força a renovação se ainda for o token em uso."""
+        with self._lock:
+            if (
+                self._token is None
+                or self._token == invalido
+                or datetime.now(timezone.utc) >= self._expira_em
+            ):
+                self._login()
+            return self._token
+
+    def buscar(self, metodo, consultas=None):
+        token = self.token()
+        resposta = self._post_fetch(metodo, token, consultas)
+        if resposta.status_code == 401:
+            # Token revogado ou expirado antes do previsto
+            resposta = self._post_fetch(metodo, self.token(invalido=token), consultas)
+        resposta.raise_for_status()
+        return resposta.json()
+
+    def buscar_varios(self, metodos, consultas=None, metricas=None):
+        """Busca várias métricas em paralelo; ``consultas`` pode ser um dict por método.
+
+        Com ``metricas`` (``psm.metricas.MetricasEtapas``) cada chamada é
+        medida como a etapa ``api.<metodo>``.
+        """
+        # Garante o login antes de disparar as threads
+        self.token()
+        futuros = {
+            metodo: self._executor.submit(
+                self._buscar_medido,
+                metodo,
+                consultas.get(metodo) if consultas else None,
+                metricas,
+            )
+            for metodo in metodos
+        }
+        return {metodo: futuro.result() for metodo, futuro in futuros.items()}
+
+    def fechar(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    def _buscar_medido(self, metodo, consultas, metricas):
+        if metricas is None:
+            return self.buscar(metodo, consultas)
+        with metricas.etapa(f"api.{metodo}") as etapa:
+            registros = self.buscar(metodo, consultas)
+            etapa.linhas = len(registros or [])
+        return registros
+
+    def _post_fetch(self, metodo, token, consultas):
+        return self.session.post(
+            f"{self.base_url}/api/v2/fetch/{metodo}",
+            headers={"Authorization": f"Bearer {token}"},
+            json={"queries": consultas or {}},
+            timeout=self.timeout,
+        )
+
+    def _login(self):
+        resposta = self.session.post(
+            f"{self.base_url}/api/v2/login",
+            json={"username": self.usuario, "password": self.senha},
+            timeout=self.timeout,
+        )
+        resposta.raise_for_status()
+        dados = resposta.json()
+
+        self._token = dados["token"]
+        expira_em = datetime.now(timezone.utc) + VALIDADE_TOKEN_PADRAO
+        if dados.get("expiry"):
+            try:
+                expira_em = datetime.fromisoformat(dados["expiry"])
+                if expira_em.tzinfo is None:
+                    expira_em = expira_em.replace(tzinfo=timezone.utc)
+            except (TypeError, ValueError):
+                pass
+        self._expira_em = expira_em - MARGEM_EXPIRACAO
@@ -0,0 +1,211 @@
+"""Histórico de sinais vitais por paciente com memória limitada.
+
+Cada coluna é um array numpy pré-alocado com o dobro da capacidade. As linhas
+novas são escritas no fim; quando o espaço acaba, as ``capacidade`` linhas mais
+recentes são movidas para o início (custo O(1) amortizado por linha). Assim a
+janela atual é sempre contígua e o DataFrame dos gráficos é montado sobre
+fatias dos arrays, sem cópia.
+"""
+
+import numpy as np
+import pandas as pd
+
+from psm.deteccao import COLUNAS_VITAIS
+from psm.esquema import ESQUEMA_SINAIS
+
+COLUNAS_HISTORICO = [
+    "timestamp",
+    *COLUNAS_VITAIS,
+    "atividade",
+    "Anomalia_IF",
+    "Anomalia_LOF",
+]
+
+_PADROES = {"atividade": 0, "Anomalia_IF": 1, "Anomalia_LOF": 1}
+
+
+class HistoricoPaciente:
+    """Janela deslizante das últimas ``capacidade`` leituras de um paciente.
+
+    ``retencao`` (``timedelta``) limita opcionalmente a janela por tempo em
+    relação à leitura mais recente.
+    """
+
+    def __init__(self, capacidade=50_000, retencao=None):
+        self.capacidade = capacidade
+        self.retencao = retencao
+        self.tz = None
+
+        self._colunas = {}
+        self._inicio = 0
+        self._fim = 0
+        self._atividades = pd.DataFrame()
+
+    def __len__(self):
+        return self._fim - self._inicio
+
+    @property
+    def vazio(self):
+        return len(self) == 0
+
+    @property
+    def nbytes(self):
+        return sum(coluna.nbytes for coluna in self._colunas.values())
+
+    @property
+    def ultimo_timestamp(self):
+        if self.vazio:
+            return None
+        return self._para_timestamp(
+            self._colunas["timestamp"][self._fim - 1 : self._fim]
+        )[0]
+
+    def adicionar(self, df, df_atividades=None):
+        if not df.empty:
+            self._adicionar_linhas(df)
+        if df_atividades is not None and not df_atividades.empty:
+            self._atividades = pd.concat([self._atividades, df_atividades]).reset_index(
+                drop=True
+            )
+        self._aplicar_retencao()
+
+    def dataframe(self):
+        """DataFrame da janela atual; as colunas são views dos arrays internos."""
+        if not self._colunas:
+            return pd.DataFrame()
+
+        janela = slice(self._inicio, self._fim)
+        dados = {nome: coluna[janela] for nome, coluna in self._colunas.items()}
+        dados["timestamp"] = self._para_timestamp(dados["timestamp"])
+        return pd.DataFrame(dados, copy=False)
+
+    def atividades(self):
+        return self._atividades
+
+    def marcar_atividades(self, df_atividades):
+        """Marca ``atividade = 1`` nas linhas da janela cobertas pelas sessões."""
+        if self.vazio or df_atividades.empty:
+            return
+
+        timestamps = self._colunas["timestamp"][self._inicio : self._fim]
+        atividade = self._colunas["atividade"][self._inicio : self._fim]
+        inicios = np.searchsorted(
+            timestamps, _para_utc_naive(df_atividades["Início"]), side="left"
+        )
+        fins = np.searchsorted(
+            timestamps, _para_utc_naive(df_atividades["Fim"]), side="right"
+        )
+        for inicio, fim in zip(inicios.tolist(), fins.tolist()):
+            atividade[inicio:fim] = 1
+
+    def _adicionar_linhas(self, df):
+        if not self._colunas:
+            self._alocar(df)
+
+        n = len(df)
+        if n > self.capacidade:
+            df = df.iloc[-self.capacidade :]
+            n = self.capacidade
+
+        if self._fim + n > len(self._colunas["timestamp"]):
+            self._compactar(self.capacidade - n)
+
+        destino = slice(self._fim, self._fim + n)
+        for nome, coluna in self._colunas.items():
+            if nome == "timestamp":
+                valores = _para_utc_naive(df["timestamp"])
+            elif nome in df.columns:
+                valores = df[nome].to_numpy()
+                if not np.can_cast(valores.dtype, coluna.dtype, casting="same_kind"):
+                    coluna = self._promover(nome, valores.dtype)
+            else:
+                valores = False if coluna.dtype == bool else _PADROES.get(nome, np.nan)
+                if isinstance(valores, float) and coluna.dtype.kind in "biu":
+                    coluna = self._promover(nome, np.float64)
+            coluna[destino] = valores
+        self._fim += n
+
+        # Amostras atrasadas (ex.: reconciliação com a API) chegam fora de
+        # ordem ou repetem timestamps já gravados (pontos da grade emitidos de
+        # novo pelo alinhador); só nesses casos a janela inteira é reordenada.
+        timestamps = self._colunas["timestamp"][
+            max(destino.start - 1, self._inicio) : self._fim
+        ]
+        if np.any(timestamps[1:] <= timestamps[:-1]):
+            self._ordenar()
+
+        if len(self) > self.capacidade:
+            self._inicio = self._fim - self.capacidade
+
+    def _alocar(self, df):
+        self.tz = df["timestamp"].dt.tz
+        tamanho = 2 * self.capacidade
+        # Colunas numéricas extras do lote (ex.: ``fresco_<vital>``) também são guardadas
+        extras = [
+            nome
+            for nome in df.columns
+            if nome not in COLUNAS_HISTORICO and df[nome].dtype.kind in "biuf"
+        ]
+        for nome in COLUNAS_HISTORICO + extras:
+            if nome == "timestamp":
+                dtype = np.dtype("datetime64[ns]")
+            elif nome in ESQUEMA_SINAIS:
+                dtype = ESQUEMA_SINAIS[nome]
+            else:
+                dtype = df[nome].to_numpy().dtype
+            self._colunas[nome] = np.empty(tamanho, dtype=dtype)
+
+    def _promover(self, nome, dtype):
+        coluna = self._colunas[nome]
+        self._colunas[nome] = coluna.astype(np.promote_types(coluna.dtype, dtype))
+        return self._colunas[nome]
+
+    def _ordenar(self):
+        # Em timestamps repetidos fica a linha escrita por último
+        janela = slice(self._inicio, self._fim)
+        timestamps = self._colunas["timestamp"][janela]
+        ordem = np.argsort(timestamps, kind="stable")
+        ordenados = timestamps[ordem]
+        ordem = ordem[np.append(ordenados[1:] != ordenados[:-1], True)]
+        inicio = self._fim - len(ordem)
+        for coluna in self._colunas.values():
+            coluna[inicio : self._fim] = coluna[janela][ordem]
+        self._inicio = inicio
+
+    def _compactar(self, manter):
+        # Move as linhas mais recentes para o início para liberar espaço no fim.
+        manter = min(manter, len(self))
+        origem = slice(self._fim - manter, self._fim)
+        for coluna in self._colunas.values():
+            coluna[:manter] = coluna[origem]
+        self._inicio = 0
+        self._fim = manter
+
+    def _aplicar_retencao(self):
+        if self.vazio:
+            return
+
+        if self.retencao is not None:
+            timestamps = self._colunas["timestamp"][self._inicio : self._fim]
+            limite = timestamps[-1] - np.timedelta64(self.retencao)
+            self._inicio += int(np.searchsorted(timestamps, limite, side="left"))
+
+        if not self._atividades.empty:
+            inicio_janela = self._para_timestamp(
+                self._colunas["timestamp"][self._inicio : self._inicio + 1]
+            )[0]
+            self._atividades = self._atividades[
+                self._atividades["Fim"] >= inicio_janela
+            ].reset_index(drop=True)
+
+    def _para_timestamp(self, valores):
+        serie = pd.Series(valores, copy=False)
+        if self.tz is not None:
+            serie = serie.dt.tz_localize("UTC").dt.tz_convert(self.tz)
+        return serie
+
+
+def _para_utc_naive(serie):
+    if serie.dt.tz is not None:
+        serie = serie.dt.tz_convert("UTC").dt.tz_localize(None)
+    return serie.to_numpy("datetime64[ns]")
@@ -0,0 +1,321 @@
+"""Ingestão em segundo plano, fora do ciclo de rerun do Streamlit.
+
+Uma thread (``ServicoIngestao``) atualiza no próprio ritmo todos os pacientes
+acompanhados: para cada um, o ``IngestorPaciente`` lê o lote novo da fonte
+(simulação ou API HCGateway), detecta anomalias, atualiza histórico e
+agregados, grava no armazém e publica um retrato no ``CachePacientes``. A
+interface só lê o último retrato, então o tempo de renderização não depende
+da latência da API.
+
+Nada aqui usa o Streamlit: erros ficam em ``ServicoIngestao.erros`` para a
+interface exibir.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from psm.atividades import processar_atividades
+from psm.conversao import converter_dados_api
+from psm.esquema import aplicar_esquema
+from psm.metricas import MetricasEtapas
+from psm.simulador import gerar_sinais
+
+
+class FonteSimulada:
+    """Lotes de 5 a 9 leituras a cada 10 s, continuando do último timestamp."""
+
+    # A simulação continua do que ficou gravado no armazém
+    retomar = True
+    marcar_atividades = False
+
+    def __init__(
+        self,
+        rng=None,
+        anomaly_ratio=0.3,
+        activity_transition_prob=0.2,
+        intervalo=timedelta(seconds=10),
+    ):
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.anomaly_ratio = anomaly_ratio
+        self.activity_transition_prob = activity_transition_prob
+        self.intervalo = intervalo
+        self._atividade = 0
+
+    def ler(self, ultimo_timestamp):
+        num_points = int(self.rng.integers(5, 10))
+        if ultimo_timestamp is not None:
+            inicio = ultimo_timestamp + self.intervalo
+        else:
+            inicio = datetime.now() - timedelta(days=1)
+        timestamps = pd.date_range(inicio, periods=num_points, freq=self.intervalo)
+
+        df = gerar_sinais(
+            self.rng,
+            timestamps,
+            self.anomaly_ratio,
+            self.activity_transition_prob,
+            estado=self._atividade,
+        )
+        self._atividade = int(df["atividade"].iloc[-1])
+        return df, processar_atividades(df)
+
+
+class FonteAPI:
+    """Leituras novas da API, alinhadas numa grade regular.
+
+    ``temperatura`` (um ``LeitorTelemetria``) acrescenta a temperatura do
+    DHT11 recebida pelo serviço de telemetria.
+    """
+
+    # Após reiniciar, a sincronização busca de novo a janela de reconciliação
+    retomar = False
+    marcar_atividades = True
+
+    def __init__(self, sincronizacao, alinhador, metricas=None, temperatura=None):
+        self.sincronizacao = sincronizacao
+        self.alinhador = alinhador
+        self.metricas = metricas or MetricasEtapas(habilitado=False)
+        self.temperatura = temperatura
+
+    def ler(self, ultimo_timestamp):
+        with self.metricas.etapa("api.sincronizar"):
+            dados_api = self.sincronizacao.sincronizar()
+        extras = None
+        if self.temperatura is not None:
+            with self.metricas.etapa("telemetria.ler"):
+                extras = {"temperatura": self.temperatura.novas()}
+        with self.metricas.etapa("conversao_api") as medicao:
+            df, df_atv = converter_dados_api(dados_api, self.alinhador, extras)
+            medicao.linhas = len(df)
+        return df, df_atv
+
+
+class IngestorPaciente:
+    """Pipeline de um paciente: fonte → detecção → histórico/agregados → armazém."""
+
+    def __init__(
+        self,
+        fonte,
+        historico,
+        detector,
+        agregados,
+        armazem=None,
+        nome=None,
+        intervalo_compactacao=None,
+        metricas=None,
+    ):
+        self.fonte = fonte
+        self.historico = historico
+        self.detector = detector
+        self.agregados = agregados
+        self.armazem = armazem
+        self.nome = nome
+        self.intervalo_compactacao = intervalo_compactacao
+        self.metricas = metricas or MetricasEtapas(habilitado=False)
+
+        self._iniciado = False
+        self._persistido = None
+        self._compactado_em = time.monotonic()
+
+    @property
+    def nbytes(self):
+        return self.historico.nbytes
+
+    def atualizar(self):
+        """Processa um lote da fonte e devolve (dados, atividades) da janela."""
+        if not self._iniciado:
+            self._iniciar()
+
+        historico = self.historico
+        ultimo = historico.ultimo_timestamp
+        df, df_atv = self.fonte.ler(ultimo)
+        if not df.empty:
+            with self.metricas.etapa("detectar_anomalias", len(df)):
+                df = aplicar_esquema(self.detector.detectar(df))
+
+        # Linhas já vistas (reprojetadas pelo alinhador) substituem as do
+        # histórico, mas não são somadas de novo nos agregados
+        historico.adicionar(df, df_atv)
+        if self.fonte.marcar_atividades:
+            historico.marcar_atividades(historico.atividades())
+        if ultimo is not None and not df.empty:
+            self.agregados.adicionar(df[df["timestamp"] > ultimo])
+        else:
+            self.agregados.adicionar(df)
+        self._persistir(df)
+        return historico.dataframe(), historico.atividades()
+
+    def _iniciar(self):
+        if self.armazem is not None:
+            self._persistido = self.armazem.ultimo_timestamp(self.nome)
+            if self.fonte.retomar and self._persistido is not None:
+                retencao = self.historico.retencao
+                with self.metricas.etapa("ler_armazem") as medicao:
+                    df = self.armazem.ler(
+                        self.nome,
+                        self._persistido - retencao if retencao else None,
+                        self._persistido,
+                    )
+                    medicao.linhas = len(df)
+                if not df.empty:
+                    df = aplicar_esquema(df)
+                    self.historico.adicionar(df, processar_atividades(df))
+        self._iniciado = True
+
+    def _persistir(self, df):
+        if self.armazem is None or df.empty:
+            return
+        # Após reiniciar, a sincronização com a API devolve leituras já gravadas
+        if self._persistido is not None:
+            df = df[df["timestamp"] > self._persistido]
+        if df.empty:
+            return
+
+        with self.metricas.etapa("armazenar", len(df)):
+            self.armazem.escrever(self.nome, df)
+        self._persistido = df["timestamp"].max()
+
+        if self.intervalo_compactacao is None:
+            return
+        agora = time.monotonic()
+        if (
+            agora - self._compactado_em
+            >= pd.Timedelta(self.intervalo_compactacao).total_seconds()
+        ):
+            with self.metricas.etapa("compactar_armazem"):
+                self.armazem.compactar(self.nome)
+            self._compactado_em = agora
+
+
+class ServicoIngestao:
+    """Thread que atualiza a cada ``intervalo`` os pacientes acompanhados.
+
+    ``acompanhar`` registra (ou renova) um paciente com a fábrica do seu
+    ``IngestorPaciente`` e o fixa no cache; pacientes sem renovação por
+    ``expiracao`` deixam de ser atualizados e podem ser expulsos.
+
+    Cada ``observador(chave, dados)`` recebe os dados de todo retrato
+    publicado, e ``dados`` None quando o paciente deixa de ser atualizado.
+    """
+
+    def __init__(
+        self, cache, intervalo, expiracao=None, metricas=None, observadores=()
+    ):
+        self.cache = cache
+        self.intervalo = pd.Timedelta(intervalo).total_seconds()
+        self.expiracao = (
+            pd.Timedelta(expiracao).total_seconds() if expiracao is not None else None
+        )
+        self.metricas = metricas or MetricasEtapas(habilitado=False)
+        self.observadores = list(observadores)
+        self.erros = {}
+
+        self._pacientes = {}
+        self._lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+
+    @property
+    def ativo(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def acompanhar(self, chave, fabrica):
+        """``fabrica(estado)`` cria o ``IngestorPaciente`` no primeiro ciclo."""
+        with self._lock:
+            paciente = self._pacientes.get(chave)
+            if paciente is None:
+                self._pacientes[chave] = {
+                    "fabrica": fabrica,
+                    "visto_em": time.monotonic(),
+                    "proximo": time.monotonic(),
+                }
+                # Pacientes acompanhados não saem do cache: a varredura cíclica
+                # da ingestão com mais chaves que o limite erraria sempre no LRU
+                self.cache.fixar(chave)
+                self._acordar.set()
+            else:
+                paciente["visto_em"] = time.monotonic()
+
+    def pacientes(self):
+        with self._lock:
+            return list(self._pacientes)
+
+    def iniciar(self):
+        if self.ativo:
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(
+            target=self._laco, name="psm-ingestao", daemon=True
+        )
+        self._thread.start()
+
+    def parar(self, timeout=None):
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def executar(self, agora=None):
+        """Atualiza os pacientes vencidos; devolve quando vence o próximo."""
+        agora = time.monotonic() if agora is None else agora
+        with self._lock:
+            self._expirar(agora)
+            vencidos = [
+                (chave, paciente)
+                for chave, paciente in self._pacientes.items()
+                if paciente["proximo"] <= agora
+            ]
+
+        for chave, paciente in vencidos:
+            self._atualizar(chave, paciente["fabrica"])
+            # Ritmo fixo; ciclos perdidos (paciente lento) não se acumulam:
+            # atrasado, o próximo ciclo é um intervalo depois de agora
+            agora = time.monotonic()
+            proximo = paciente["proximo"] + self.intervalo
+            paciente["proximo"] = proximo if proximo > agora else agora + self.intervalo
+
+        with self._lock:
+            return min(
+                (paciente["proximo"] for paciente in self._pacientes.values()),
+                default=time.monotonic() + self.intervalo,
+            )
+
+    def _atualizar(self, chave, fabrica):
+        estado = self.cache.estado(chave)
+        try:
+            with self.metricas.etapa("ingestao") as medicao:
+                ingestor = estado.obter("ingestor", lambda: fabrica(estado))
+                with estado.lock:
+                    retrato = estado.publicar(*ingestor.atualizar())
+                medicao.linhas = len(retrato.dados)
+            for observador in self.observadores:
+                observador(chave, retrato.dados)
+            self.erros.pop(chave, None)
+        except Exception as e:
+            self.erros[chave] = str(e)
+
+    def _expirar(self, agora):
+        if self.expiracao is None:
+            return
+        for chave in [
+            chave
+            for chave, paciente in self._pacientes.items()
+            if agora - paciente["visto_em"] > self.expiracao
+        ]:
+            del self._pacientes[chave]
+            self.cache.soltar(chave)
+            self.erros.pop(chave, None)
+            for observador in self.observadores:
+                observador(chave, None)
+
+    def _laco(self):
+        while not self._parar.is_set():
+            self._acordar.clear()
+            proximo = self.executar()
+            self._acordar.wait(max(proximo - time.monotonic(), 0))
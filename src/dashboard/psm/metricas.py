@@ -0,0 +1,180 @@
+"""Tempo por etapa do pipeline a cada rerun do dashboard.
+
+``MetricasEtapas.etapa`` é um gerenciador de contexto que mede a duração de
+um trecho (fetch, detecção, gráficos, chamadas à API...) e guarda as últimas
+``capacidade`` medições de cada etapa para calcular p50/p95. Desabilitado,
+devolve sempre o mesmo contexto vazio, sem ler o relógio.
+
+As medições podem ser exportadas em texto do Prometheus (arquivo lido por um
+coletor local, como o textfile collector do node_exporter) ou em JSONL.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+COLUNAS_RESUMO = ["Etapa", "Execuções", "p50 (ms)", "p95 (ms)", "Último (ms)", "Linhas"]
+
+
+class _EtapaInativa:
+    linhas = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_INATIVA = _EtapaInativa()
+
+
+class _Etapa:
+    __slots__ = ("metricas", "nome", "linhas", "_inicio")
+
+    def __init__(self, metricas, nome, linhas):
+        self.metricas = metricas
+        self.nome = nome
+        self.linhas = linhas
+
+    def __enter__(self):
+        self._inicio = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, tipo, *exc):
+        duracao = (time.perf_counter_ns() - self._inicio) / 1e9
+        self.metricas.registrar(self.nome, duracao, self.linhas, erro=tipo is not None)
+        return False
+
+
+class MetricasEtapas:
+    def __init__(self, habilitado=True, capacidade=200):
+        self.habilitado = habilitado
+        self.capacidade = capacidade
+
+        self._lock = threading.Lock()
+        self._duracoes = {}
+        self._linhas = {}
+        self._totais = {}
+        self._pendentes = []
+
+    def etapa(self, nome, linhas=None):
+        """Mede o bloco ``with``; ``linhas`` pode ser definido dentro dele."""
+        if not self.habilitado:
+            return _INATIVA
+        return _Etapa(self, nome, linhas)
+
+    def registrar(self, nome, duracao, linhas=None, erro=False):
+        with self._lock:
+            if nome not in self._duracoes:
+                self._duracoes[nome] = deque(maxlen=self.capacidade)
+                self._totais[nome] = [0, 0.0, 0]
+            self._duracoes[nome].append(duracao)
+            if linhas is not None:
+                self._linhas[nome] = int(linhas)
+            totais = self._totais[nome]
+            totais[0] += 1
+            totais[1] += duracao
+            totais[2] += int(erro)
+            self._pendentes.append(
+                {
+                    "ts": time.time(),
+                    "etapa": nome,
+                    "duracao_s": duracao,
+                    "linhas": linhas,
+                    "erro": erro,
+                }
+            )
+            # Sem exportação JSONL os pendentes não podem crescer sem limite
+            del self._pendentes[: -self.capacidade * 10]
+
+    def resumo(self):
+        """DataFrame com p50/p95 das últimas medições de cada etapa."""
+        with self._lock:
+            duracoes = {nome: np.array(d) for nome, d in self._duracoes.items()}
+            linhas = dict(self._linhas)
+        dados = [
+            (
+                nome,
+                len(valores),
+                np.percentile(valores, 50) * 1e3,
+                np.percentile(valores, 95) * 1e3,
+                valores[-1] * 1e3,
+                linhas.get(nome),
+            )
+            for nome, valores in duracoes.items()
+        ]
+        return pd.DataFrame(dados, columns=COLUNAS_RESUMO)
+
+    def exportar_prometheus(self, caminho):
+        """Escreve o formato texto do Prometheus de forma atômica."""
+        caminho = Path(caminho)
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        temporario = caminho.with_name(f".{caminho.name}.{os.getpid()}.tmp")
+        temporario.write_text(self.texto_prometheus(), encoding="utf-8")
+        os.replace(temporario, caminho)
+
+    def texto_prometheus(self):
+        with self._lock:
+            duracoes = {nome: np.array(d) for nome, d in self._duracoes.items()}
+            totais = {nome: list(t) for nome, t in self._totais.items()}
+            linhas = dict(self._linhas)
+
+        saida = [
+            "# HELP psm_etapa_duracao_segundos Duração das etapas do pipeline.",
+            "# TYPE psm_etapa_duracao_segundos summary",
+        ]
+        for nome, valores in duracoes.items():
+            rotulo = _rotulo(nome)
+            for quantil in (0.5, 0.95):
+                saida.append(
+                    f'psm_etapa_duracao_segundos{{etapa="{rotulo}",quantile="{quantil}"}} '
+                    f"{np.quantile(valores, quantil):.6f}"
+                )
+            execucoes, soma, _ = totais[nome]
+            saida.append(
+                f'psm_etapa_duracao_segundos_sum{{etapa="{rotulo}"}} {soma:.6f}'
+            )
+            saida.append(
+                f'psm_etapa_duracao_segundos_count{{etapa="{rotulo}"}} {execucoes}'
+            )
+        saida += [
+            "# HELP psm_etapa_erros_total Execuções de etapas que terminaram em erro.",
+            "# TYPE psm_etapa_erros_total counter",
+        ]
+        saida += [
+            f'psm_etapa_erros_total{{etapa="{_rotulo(nome)}"}} {total[2]}'
+            for nome, total in totais.items()
+        ]
+        saida += [
+            "# HELP psm_etapa_linhas Linhas processadas na última execução.",
+            "# TYPE psm_etapa_linhas gauge",
+        ]
+        saida += [
+            f'psm_etapa_linhas{{etapa="{_rotulo(nome)}"}} {valor}'
+            for nome, valor in linhas.items()
+        ]
+
+        return "\n".join(saida) + "\n"
+
+    def exportar_jsonl(self, caminho):
+        """Acrescenta as medições feitas desde a última exportação."""
+        with self._lock:
+            pendentes, self._pendentes = self._pendentes, []
+        if not pendentes:
+            return
+        caminho = Path(caminho)
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        with caminho.open("a", encoding="utf-8") as arquivo:
+            for medicao in pendentes:
+                arquivo.write(json.dumps(medicao, ensure_ascii=False) + "\n")
+
+
+def _rotulo(nome):
+    return nome.replace("\\", "\\\\").replace('"', '\\"')
@@ -0,0 +1,100 @@
+"""Redução do número de pontos de uma série antes de enviá-la ao navegador.
+
+As duas funções devolvem os índices (ordenados) dos pontos mantidos, então os
+valores exibidos são amostras reais:
+
+* ``indices_minmax`` divide a série em baldes de mesmo tamanho (um por coluna
+  de pixels) e mantém o mínimo e o máximo de cada um: picos isolados, como
+  as anomalias, nunca somem. Baldes só com NaN mantêm um NaN, preservando os
+  buracos da linha.
+* ``indices_lttb`` (Largest-Triangle-Three-Buckets) mantém em cada balde o
+  ponto que forma o maior triângulo com o ponto anterior e a média do balde
+  seguinte; preserva melhor a forma, mas pode descartar extremos.
+"""
+
+import numpy as np
+
+
+def reduzir(x, y, limite, metodo="minmax"):
+    """Índices de no máximo ``limite`` pontos de ``(x, y)``."""
+    n = len(y)
+    if limite is None or n <= limite:
+        return np.arange(n)
+    if metodo == "lttb":
+        return indices_lttb(x, y, limite)
+    if metodo == "minmax":
+        # Primeiro e último ponto entram além dos extremos de cada balde
+        return indices_minmax(y, max((limite - 2) // 2, 1))
+    raise ValueError(f"Método de redução desconhecido: {metodo}")
+
+
+def indices_minmax(y, baldes):
+    y = np.asarray(y, dtype=float)
+    n = len(y)
+    tamanho = -(-n // baldes)
+    linhas = -(-n // tamanho)
+    Y = np.full(linhas * tamanho, np.nan)
+    Y[:n] = y
+    Y = Y.reshape(linhas, tamanho)
+
+    nulos = np.isnan(Y)
+    minimos = np.argmin(np.where(nulos, np.inf, Y), axis=1)
+    maximos = np.argmax(np.where(nulos, -np.inf, Y), axis=1)
+    base = np.arange(linhas) * tamanho
+    indices = np.concatenate([[0, n - 1], base + minimos, base + maximos])
+    return np.unique(indices[indices < n])
+
+
+def indices_lttb(x, y, limite):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.view(np.int64)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # LTTB não lida com NaN: a redução é feita só sobre os pontos válidos
+    validos = np.flatnonzero(~np.isnan(y))
+    n = len(validos)
+    if n <= max(limite, 2):
+        return validos
+    x = x[validos] - x[validos[0]]
+    y = y[validos]
+
+    baldes = limite - 2
+    bordas = np.linspace(1, n - 1, baldes + 1).astype(np.int64)
+    contagem = np.diff(bordas)
+    medias_x = np.add.reduceat(x[:-1], bordas[:-1]) / contagem
+    medias_y = np.add.reduceat(y[:-1], bordas[:-1]) / contagem
+    # O "balde seguinte" do último é o ponto final
+    medias_x = np.append(medias_x[1:], x[-1])
+    medias_y = np.append(medias_y[1:], y[-1])
+
+    escolhidos = np.empty(limite, dtype=np.int64)
+    escolhidos[0] = 0
+    escolhidos[-1] = n - 1
+    anterior = 0
+    for balde in range(baldes):
+        inicio, fim = bordas[balde], bordas[balde + 1]
+        area = np.abs(
+            (x[anterior] - medias_x[balde]) * (y[inicio:fim] - y[anterior])
+            - (x[anterior] - x[inicio:fim]) * (medias_y[balde] - y[anterior])
+        )
+        anterior = inicio + int(np.argmax(area))
+        escolhidos[balde + 1] = anterior
+    return validos[escolhidos]
+
+
+def agrupar_intervalos(inicios, fins, folga):
+    """Grupo de cada intervalo, unindo os separados por até ``folga`` (em ns).
+
+    ``inicios`` deve estar ordenado; intervalos sobrepostos caem no mesmo grupo.
+    """
+    inicios = np.asarray(inicios, dtype=np.int64)
+    fins = np.asarray(fins, dtype=np.int64)
+    if len(inicios) == 0:
+        return np.array([], dtype=np.int64)
+
+    fim_acumulado = np.maximum.accumulate(fins)
+    novo = np.ones(len(inicios), dtype=bool)
+    novo[1:] = inicios[1:] - fim_acumulado[:-1] > folga
+    return np.cumsum(novo) - 1
@@ -0,0 +1,460 @@
+"""Motor de regras de alerta sobre o fluxo de leituras.
+
+O ``MotorAlertas`` avalia cada leitura nova contra os limites assim que a
+ingestão a publica (não só a última linha no momento da renderização), com
+custo constante por leitura e por vital:
+
+- histerese: um alerta disparado acima do máximo só é resolvido quando o
+  valor volta abaixo de ``max - histerese * (max - min)`` (e o simétrico
+  para o mínimo), então valores oscilando no limite não geram rajadas;
+- duração mínima: o valor precisa ficar fora da faixa por
+  ``duracao_minima`` (no tempo das leituras) antes de disparar;
+- repetição: o mesmo alerta (vital e lado) não é publicado de novo antes de
+  ``intervalo_repeticao``, mesmo que seja resolvido e volte.
+
+Alertas disparados e resolvidos vão para os destinos (``FilaAlertas`` em
+memória, ``PublicadorMQTT`` para um broker local, ou qualquer objeto com
+``publicar(alerta)``). Como o motor roda na thread de ingestão, ``publicar``
+não pode bloquear: o ``PublicadorMQTT`` só enfileira e envia numa thread
+própria. Cada alerta guarda a latência de ponta a ponta, do timestamp da
+leitura que o disparou até a publicação.
+"""
+
+import json
+import queue
+import select
+import socket
+import struct
+import threading
+import time
+import uuid
+from collections import deque, namedtuple
+from datetime import timedelta
+
+import pandas as pd
+
+from psm.alertas import LIMITES_PADRAO, mensagem_alerta
+from psm.esquema import localizar
+from psm.metricas import MetricasEtapas
+
+Alerta = namedtuple(
+    "Alerta",
+    [
+        "paciente",
+        "chave",
+        "vital",
+        "estado",  # "disparado" ou "resolvido"
+        "sinal",  # -1 abaixo do mínimo, 1 acima do máximo
+        "valor",
+        "limite",
+        "mensagem",
+        "timestamp",
+        "publicado_em",
+        "latencia",
+    ],
+)
+
+
+class _Regra:
+    """Estado de um vital de um paciente."""
+
+    __slots__ = ("ativo", "pendente", "desde", "publicado", "disparado_em", "alerta")
+
+    def __init__(self):
+        self.ativo = 0
+        self.pendente = 0
+        self.desde = 0
+        self.publicado = False
+        self.disparado_em = {}
+        self.alerta = None
+
+
+class MotorAlertas:
+    """Regras de alerta por paciente; ``observar`` é um observador da ingestão.
+
+    ``limites_de(paciente)`` devolve os limites (no formato de
+    ``LIMITES_PADRAO``) de cada paciente; ``paciente_de(chave)`` diz a qual
+    paciente pertence cada chave da ingestão.
+    """
+
+    def __init__(
+        self,
+        limites_de=None,
+        paciente_de=None,
+        histerese=0.05,
+        duracao_minima=timedelta(0),
+        intervalo_repeticao=timedelta(minutes=5),
+        destinos=(),
+        metricas=None,
+    ):
+        self.limites_de = limites_de or (lambda paciente: LIMITES_PADRAO)
+        self.paciente_de = paciente_de or (lambda chave: chave)
+        self.histerese = histerese
+        self.duracao_minima = pd.Timedelta(duracao_minima).value
+        self.intervalo_repeticao = pd.Timedelta(intervalo_repeticao).value
+        self.destinos = list(destinos)
+        self.metricas = metricas or MetricasEtapas(habilitado=False)
+        self.erro = None
+
+        self._regras = {}
+        self._ultimos = {}
+        self._lock = threading.Lock()
+
+    def observar(self, chave, dados):
+        """Processa as leituras de ``dados`` ainda não vistas para ``chave``.
+
+        Na primeira vez começa pela leitura mais recente (a janela inicial
+        pode trazer dias de histórico); ``dados`` None esquece o paciente.
+        """
+        if dados is None:
+            self.esquecer(chave)
+            return []
+        if dados.empty:
+            return []
+        ultimo = self._ultimos.get(chave)
+        if ultimo is None:
+            inicio = len(dados) - 1
+        else:
+            inicio = int(dados["timestamp"].searchsorted(ultimo, side="right"))
+        if inicio >= len(dados):
+            return []
+        self._ultimos[chave] = dados["timestamp"].iat[-1]
+        return self.processar(chave, dados.iloc[inicio:])
+
+    def processar(self, chave, df):
+        """Avalia as leituras de ``df`` (em ordem) e publica os alertas."""
+        paciente = self.paciente_de(chave)
+        limites = self.limites_de(paciente)
+        tempos = _epoca_ns(df["timestamp"])
+        alertas = []
+
+        with self._lock:
+            regras = self._regras.setdefault(chave, {})
+            for vital, atributos in limites.items():
+                if vital not in df.columns:
+                    continue
+                valores = df[vital].to_numpy(dtype=float)
+                minimo, maximo = atributos["min"], atributos["max"]
+                regra = regras.get(vital)
+                # Caminho comum: nada ativo ou pendente e o lote todo na faixa
+                if (regra is None or not (regra.ativo or regra.pendente)) and not (
+                    (valores < minimo) | (valores > maximo)
+                ).any():
+                    continue
+                if regra is None:
+                    regra = regras[vital] = _Regra()
+                contexto = (paciente, chave, vital, atributos, df["timestamp"])
+                banda = self.histerese * (maximo - minimo)
+                for i, (valor, t) in enumerate(zip(valores.tolist(), tempos.tolist())):
+                    alertas.extend(self._passo(regra, contexto, banda, valor, i, t))
+
+        return [self._publicar(alerta, t) for alerta, t in alertas]
+
+    def ativos(self, chave):
+        """Alertas publicados de ``chave`` que ainda não foram resolvidos."""
+        with self._lock:
+            return [
+                regra.alerta
+                for regra in self._regras.get(chave, {}).values()
+                if regra.ativo and regra.publicado
+            ]
+
+    def esquecer(self, chave):
+        with self._lock:
+            self._regras.pop(chave, None)
+            self._ultimos.pop(chave, None)
+
+    def _passo(self, regra, contexto, banda, valor, i, t):
+        atributos = contexto[3]
+        minimo, maximo = atributos["min"], atributos["max"]
+        sinal = 1 if valor > maximo else -1 if valor < minimo else 0
+        eventos = []
+
+        if regra.ativo:
+            if regra.ativo > 0:
+                liberado = valor <= maximo - banda
+            else:
+                liberado = valor >= minimo + banda
+            if not liberado:
+                return eventos
+            if regra.publicado:
+                alerta = _alerta(contexto, "resolvido", regra.ativo, valor, i)
+                eventos.append((alerta, t))
+            regra.ativo = 0
+            regra.publicado = False
+            regra.alerta = None
+
+        if sinal == 0:
+            regra.pendente = 0
+            return eventos
+        if regra.pendente != sinal:
+            regra.pendente = sinal
+            regra.desde = t
+        if t - regra.desde < self.duracao_minima:
+            return eventos
+
+        regra.ativo = sinal
+        regra.pendente = 0
+        anterior = regra.disparado_em.get(sinal)
+        # Deduplicação: o mesmo alerta resolvido e disparado de novo em pouco tempo
+        if anterior is not None and t - anterior < self.intervalo_repeticao:
+            return eventos
+        regra.disparado_em[sinal] = t
+        regra.publicado = True
+        regra.alerta = _alerta(contexto, "disparado", sinal, valor, i)
+        eventos.append((regra.alerta, t))
+        return eventos
+
+    def _publicar(self, alerta, t):
+        publicado_em = time.time()
+        alerta = alerta._replace(
+            publicado_em=publicado_em, latencia=float(publicado_em - t / 1e9)
+        )
+        for destino in self.destinos:
+            try:
+                destino.publicar(alerta)
+            except Exception as e:
+                self.erro = f"{type(destino).__name__}: {e}"
+        if alerta.estado == "disparado":
+            self.metricas.registrar("alerta.latencia", alerta.latencia, 1)
+        return alerta
+
+
+class FilaAlertas:
+    """Destino em memória com os últimos ``maximo`` alertas."""
+
+    def __init__(self, maximo=1000):
+        self._alertas = deque(maxlen=maximo)
+        self._publicados = 0
+        self._novo = threading.Condition()
+
+    def __len__(self):
+        return len(self._alertas)
+
+    def publicar(self, alerta):
+        with self._novo:
+            self._alertas.append(alerta)
+            self._publicados += 1
+            self._novo.notify_all()
+
+    def recentes(self, chave=None, n=None):
+        """Alertas mais recentes primeiro, só de ``chave`` se informada."""
+        with self._novo:
+            alertas = list(self._alertas)
+        alertas = [a for a in reversed(alertas) if chave is None or a.chave == chave]
+        return alertas[:n] if n is not None else alertas
+
+    def aguardar(self, timeout=None):
+        """Espera o próximo alerta publicado e o devolve (None no timeout)."""
+        with self._novo:
+            publicados = self._publicados
+            if not self._novo.wait_for(lambda: self._publicados > publicados, timeout):
+                return None
+            return self._alertas[-1]
+
+
+class PublicadorMQTT:
+    """Publica os alertas em JSON em ``<topico>/<paciente>`` (MQTT 3.1.1, QoS 0).
+
+    Cliente mínimo sem dependências. ``publicar`` só coloca o alerta numa fila
+    de até ``maximo_fila`` alertas (O(1), sem bloquear a ingestão); uma thread
+    envia, conectando no primeiro alerta. Com o broker fora do ar a thread
+    tenta de novo com espera exponencial até ``espera_maxima`` segundos e,
+    com a fila cheia, os alertas mais antigos são descartados.
+    """
+
+    def __init__(
+        self,
+        host="localhost",
+        porta=1883,
+        topico="psm/alertas",
+        timeout=5.0,
+        maximo_fila=1000,
+        espera_maxima=60.0,
+    ):
+        self.host = host
+        self.porta = porta
+        self.topico = topico.rstrip("/")
+        self.timeout = timeout
+        self.espera_maxima = espera_maxima
+        self.id_cliente = f"psm-{uuid.uuid4().hex[:12]}"
+        self.enviados = 0
+        self.descartados = 0
+        self.erro = None
+
+        self._fila = queue.Queue(maximo_fila)
+        self._socket = None
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._laco, name="psm-mqtt", daemon=True)
+        self._thread.start()
+
+    @property
+    def pendentes(self):
+        return self._fila.qsize()
+
+    def publicar(self, alerta):
+        while True:
+            try:
+                self._fila.put_nowait(alerta)
+                return
+            except queue.Full:
+                try:
+                    self._fila.get_nowait()
+                    self.descartados += 1
+                except queue.Empty:
+                    pass
+
+    def fechar(self, timeout=None):
+        self._parar.set()
+        self._fila.put(None)
+        self._thread.join(timeout)
+        if self._socket is not None:
+            try:
+                self._socket.sendall(b"\xe0\x00")
+            except OSError:
+                pass
+        self._fechar()
+
+    def _laco(self):
+        espera = 1.0
+        alerta = None
+        while not self._parar.is_set():
+            if alerta is None:
+                alerta = self._fila.get()
+                if alerta is None:
+                    break
+            try:
+                self._enviar(alerta)
+            except OSError as e:
+                self._fechar()
+                self.erro = str(e)
+                self._parar.wait(espera)
+                espera = min(2 * espera, self.espera_maxima)
+                continue
+            self.enviados += 1
+            self.erro = None
+            espera = 1.0
+            alerta = None
+
+    def _enviar(self, alerta):
+        pacote = _pacote(
+            0x30,
+            _texto(f"{self.topico}/{_topico(alerta.paciente)}"),
+            json.dumps(carga_alerta(alerta), ensure_ascii=False).encode("utf-8"),
+        )
+        self._conectar().sendall(pacote)
+
+    def _conectar(self):
+        if self._socket is not None and not _fechado(self._socket):
+            return self._socket
+        self._fechar()
+        conexao = socket.create_connection((self.host, self.porta), self.timeout)
+        try:
+            # Sessão limpa, sem keep-alive: o broker não derruba a conexão ociosa
+            conexao.sendall(
+                _pacote(
+                    0x10,
+                    _texto("MQTT") + bytes([4, 0x02]) + struct.pack("!H", 0),
+                    _texto(self.id_cliente),
+                )
+            )
+            resposta = _ler_exato(conexao, 4)
+            if resposta[0] != 0x20 or resposta[3] != 0:
+                raise ConnectionError(f"broker MQTT recusou a conexão ({resposta[3]})")
+        except BaseException:
+            conexao.close()
+            raise
+        self._socket = conexao
+        return conexao
+
+    def _fechar(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+def _alerta(contexto, estado, sinal, valor, i):
+    paciente, chave, vital, atributos, timestamps = contexto
+    if estado == "disparado":
+        motivo = atributos["msg_max"] if sinal > 0 else atributos["msg_min"]
+        mensagem = f"{motivo}: {mensagem_alerta(vital, valor, sinal, atributos)}"
+    else:
+        mensagem = f"{vital.capitalize()} normalizado: {valor:.2f}"
+    limite = atributos["max"] if sinal > 0 else atributos["min"]
+    return Alerta(
+        paciente,
+        chave,
+        vital,
+        estado,
+        sinal,
+        valor,
+        limite,
+        mensagem,
+        timestamps.iat[i],
+        None,
+        None,
+    )
+
+
+def carga_alerta(alerta):
+    """Alerta como dicionário serializável em JSON."""
+    return {
+        "paciente": str(alerta.paciente),
+        "vital": alerta.vital,
+        "estado": alerta.estado,
+        "mensagem": alerta.mensagem,
+        "valor": alerta.valor,
+        "limite": alerta.limite,
+        "timestamp": pd.Timestamp(alerta.timestamp).isoformat(),
+        "publicado_em": alerta.publicado_em,
+        "latencia_s": alerta.latencia,
+    }
+
+
+def _epoca_ns(timestamps):
+    tempos = pd.DatetimeIndex(timestamps)
+    if tempos.tz is None:
+        tempos = localizar(tempos)
+    return tempos.asi8
+
+
+def _topico(nome):
+    # Curingas e separadores não podem aparecer no nível do paciente
+    return "".join("_" if c in "/+#" else c for c in str(nome))
+
+
+def _texto(valor):
+    dados = valor.encode("utf-8")
+    return struct.pack("!H", len(dados)) + dados
+
+
+def _pacote(tipo, cabecalho, carga=b""):
+    tamanho = len(cabecalho) + len(carga)
+    codificado = bytearray()
+    while True:
+        tamanho, resto = divmod(tamanho, 128)
+        codificado.append(resto | (0x80 if tamanho else 0))
+        if not tamanho:
+            break
+    return bytes([tipo]) + bytes(codificado) + cabecalho + carga
+
+
+def _ler_exato(conexao, n):
+    dados = b""
+    while len(dados) < n:
+        parte = conexao.recv(n - len(dados))
+        if not parte:
+            raise ConnectionError("conexão fechada pelo broker")
+        dados += parte
+    return dados
+
+
+def _fechado(conexao):
+    # Com QoS 0 o broker não envia nada; dados legíveis aqui são o fim da conexão
+    legivel, _, _ = select.select([conexao], [], [], 0)
+    if not legivel:
+        return False
+    try:
+        return conexao.recv(1, socket.MSG_PEEK) == b""
+    except OSError:
+        return True
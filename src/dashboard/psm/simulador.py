@@ -0,0 +1,217 @@
+"""Simulador de sinais vitais para uma frota de pacientes.
+
+Gera os mesmos sinais de ``generate_random_data`` sem depender do Streamlit:
+cada paciente tem o próprio ``numpy.random.Generator`` (derivado de uma
+``SeedSequence``), os timestamps vêm de ``pd.date_range`` e os dados saem em
+blocos por um gerador, para N pacientes x M dias sem materializar tudo.
+
+Uso (a partir de ``src/dashboard``)::
+
+    python -m psm.simulador --pacientes 500 --dias 1 --saida parquet --destino sim/
+    python -m psm.simulador --pacientes 50 --saida http --destino http://127.0.0.1:8080/ingest
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from psm.armazenamento import ArmazemParquet
+from psm.esquema import ESTADOS_DISPOSITIVO, aplicar_esquema
+
+BASE_PARAMS = {
+    "temperatura": (36.5, 0.5),
+    "batimento_cardiaco": (80, 15),
+    "pressao_sistolica": (120, 10),
+    "pressao_diastolica": (80, 5),
+    "glicose": (100, 20),
+    "oxigenio": (98, 1),
+}
+
+
+def gerar_sinais(
+    rng, timestamps, anomaly_ratio=0.3, activity_transition_prob=0.2, estado=0
+):
+    """DataFrame de sinais para ``timestamps``; ``estado`` é a atividade anterior."""
+    num_points = len(timestamps)
+    num_anomaly = max(1, int(num_points * anomaly_ratio))
+    anomalia = np.zeros(num_points, dtype=bool)
+    anomalia[rng.choice(num_points, num_anomaly, replace=False)] = True
+
+    transicoes = rng.random(num_points) < activity_transition_prob
+    data = {
+        "timestamp": timestamps,
+        "temperatura": np.where(
+            anomalia,
+            rng.normal(39.5, 0.8, num_points),
+            rng.normal(36.5, 0.3, num_points),
+        ),
+        "batimento_cardiaco": np.where(
+            anomalia,
+            rng.normal(160, 20, num_points),
+            rng.normal(80, 5, num_points),
+        ).astype(int),
+        "atividade": ((np.cumsum(transicoes) + estado) & 1).astype(int),
+    }
+
+    for param in ["pressao_sistolica", "pressao_diastolica", "glicose", "oxigenio"]:
+        data[param] = rng.normal(
+            BASE_PARAMS[param][0], BASE_PARAMS[param][1], num_points
+        ).astype(int)
+
+    data["dispositivo_estado"] = pd.Categorical.from_codes(
+        np.zeros(num_points, dtype=np.int8), dtype=ESTADOS_DISPOSITIVO
+    )
+    return aplicar_esquema(pd.DataFrame(data))
+
+
+def simular_frota(
+    n_pacientes,
+    dias=1.0,
+    inicio=None,
+    intervalo="10s",
+    bloco="1h",
+    semente=None,
+    anomaly_ratio=0.3,
+    activity_transition_prob=0.2,
+):
+    """Gera ``(paciente_id, df)`` bloco a bloco, intercalando os pacientes."""
+    inicio = (
+        pd.Timestamp(inicio) if inicio is not None else pd.Timestamp.now().floor("D")
+    )
+    intervalo = pd.Timedelta(intervalo)
+    bloco = max(pd.Timedelta(bloco), intervalo)
+    fim = inicio + pd.Timedelta(days=dias)
+
+    sementes = np.random.SeedSequence(semente).spawn(n_pacientes)
+    rngs = [np.random.default_rng(s) for s in sementes]
+    estados = np.zeros(n_pacientes, dtype=int)
+
+    inicio_bloco = inicio
+    while inicio_bloco < fim:
+        fim_bloco = min(inicio_bloco + bloco, fim)
+        timestamps = pd.date_range(
+            inicio_bloco, fim_bloco, freq=intervalo, inclusive="left"
+        )
+        for paciente_id, rng in enumerate(rngs):
+            df = gerar_sinais(
+                rng,
+                timestamps,
+                anomaly_ratio,
+                activity_transition_prob,
+                estado=estados[paciente_id],
+            )
+            estados[paciente_id] = df["atividade"].iloc[-1]
+            yield paciente_id, df
+        inicio_bloco = fim_bloco
+
+
+class SaidaMemoria:
+    def __init__(self):
+        self.blocos = {}
+
+    def escrever(self, paciente_id, df):
+        self.blocos.setdefault(paciente_id, []).append(df)
+
+    def fechar(self):
+        pass
+
+    def dataframe(self, paciente_id):
+        return pd.concat(self.blocos[paciente_id], ignore_index=True)
+
+
+class SaidaParquet:
+    """Grava no ``ArmazemParquet`` em ``destino`` e compacta ao fechar."""
+
+    def __init__(self, destino):
+        self.armazem = ArmazemParquet(destino)
+
+    def escrever(self, paciente_id, df):
+        self.armazem.escrever(str(paciente_id), df)
+
+    def fechar(self):
+        self.armazem.compactar()
+
+
+class SaidaHTTP:
+    """Envia cada bloco como NDJSON para um endpoint de ingestão local."""
+
+    def __init__(self, url, timeout=10):
+        self.url = url
+        self.timeout = timeout
+        import requests
+
+        self.session = requests.Session()
+        self.session.headers.update({"Content-Type": "application/x-ndjson"})
+
+    def escrever(self, paciente_id, df):
+        corpo = df.assign(
+            patient_id=str(paciente_id),
+            timestamp=df["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        ).to_json(orient="records", lines=True)
+        resposta = self.session.post(self.url, data=corpo, timeout=self.timeout)
+        resposta.raise_for_status()
+
+    def fechar(self):
+        self.session.close()
+
+
+def executar(blocos, saida, taxa=None):
+    """Consome ``blocos`` escrevendo em ``saida``; ``taxa`` limita linhas/segundo."""
+    linhas = 0
+    inicio = time.perf_counter()
+    try:
+        for paciente_id, df in blocos:
+            saida.escrever(paciente_id, df)
+            linhas += len(df)
+            if taxa:
+                atraso = linhas / taxa - (time.perf_counter() - inicio)
+                if atraso > 0:
+                    time.sleep(atraso)
+    finally:
+        saida.fechar()
+    duracao = time.perf_counter() - inicio
+    return {
+        "linhas": linhas,
+        "segundos": duracao,
+        "linhas_por_segundo": linhas / duracao if duracao else float("inf"),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pacientes", type=int, default=500)
+    parser.add_argument("--dias", type=float, default=1.0)
+    parser.add_argument("--intervalo", default="10s")
+    parser.add_argument("--bloco", default="1h")
+    parser.add_argument("--semente", type=int, default=None)
+    parser.add_argument(
+        "--saida", choices=["memoria", "parquet", "http"], default="memoria"
+    )
+    parser.add_argument("--destino", help="Pasta (parquet) ou URL (http)")
+    parser.add_argument("--taxa", type=float, help="Linhas por segundo (sem limite)")
+    args = parser.parse_args(argv)
+
+    if args.saida == "parquet":
+        saida = SaidaParquet(args.destino or "simulacao")
+    elif args.saida == "http":
+        if not args.destino:
+            parser.error("--destino é obrigatório com --saida http")
+        saida = SaidaHTTP(args.destino)
+    else:
+        saida = SaidaMemoria()
+
+    blocos = simular_frota(
+        args.pacientes,
+        dias=args.dias,
+        intervalo=args.intervalo,
+        bloco=args.bloco,
+        semente=args.semente,
+    )
+    print(json.dumps(executar(blocos, saida, taxa=args.taxa)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Sincronização incremental com a API HCGateway.
+
+Para cada métrica guarda a marca d'água (maior ``start`` já recebido) e pede
+à API apenas os registros a partir dela. De tempos em tempos faz uma
+reconciliação sobre uma janela maior para recuperar amostras que chegaram
+atrasadas ao servidor. Registros já entregues são descartados pelo id.
+"""
+
+import json
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+CAMPO_TEMPO = "start"
+
+
+class SincronizacaoAPI:
+    def __init__(
+        self,
+        cliente,
+        metodos,
+        intervalo_reconciliacao=timedelta(minutes=15),
+        janela_reconciliacao=timedelta(days=3),
+        metricas=None,
+    ):
+        self.cliente = cliente
+        self.metodos = list(metodos)
+        self.intervalo_reconciliacao = intervalo_reconciliacao
+        self.janela_reconciliacao = janela_reconciliacao
+        self.metricas = metricas
+
+        # metodo -> (Timestamp, texto original do campo ``start``)
+        self.marcas = {}
+        # metodo -> {id do registro: start em ns}
+        self._vistos = {metodo: {} for metodo in self.metodos}
+        self._ultima_reconciliacao = None
+
+    def sincronizar(self, agora=None):
+        """Retorna ``{metodo: [registros novos]}`` desde a última chamada."""
+        agora = agora or datetime.now(timezone.utc)
+        reconciliar = (
+            self._ultima_reconciliacao is None
+            or agora - self._ultima_reconciliacao >= self.intervalo_reconciliacao
+        )
+
+        consultas = {}
+        for metodo in self.metodos:
+            marca = self.marcas.get(metodo)
+            if marca is None:
+                continue
+            if reconciliar:
+                if self.janela_reconciliacao is None:
+                    continue
+                inicio = (marca[0] - self.janela_reconciliacao).isoformat()
+            else:
+                inicio = marca[1]
+            consultas[metodo] = {CAMPO_TEMPO: {"$gte": inicio}}
+
+        brutos = self.cliente.buscar_varios(
+            self.metodos, consultas, metricas=self.metricas
+        )
+        novos = {
+            metodo: self._filtrar_novos(metodo, brutos.get(metodo) or [])
+            for metodo in self.metodos
+        }
+
+        if reconciliar:
+            self._ultima_reconciliacao = agora
+            self._esquecer_antigos()
+        return novos
+
+    def _filtrar_novos(self, metodo, registros):
+        vistos = self._vistos[metodo]
+        novos = []
+        for registro in registros:
+            chave = _chave_registro(registro)
+            if chave in vistos:
+                continue
+            inicio = pd.Timestamp(registro[CAMPO_TEMPO])
+            if inicio.tzinfo is None:
+                inicio = inicio.tz_localize("UTC")
+            vistos[chave] = inicio.value
+            novos.append(registro)
+
+            marca = self.marcas.get(metodo)
+            if marca is None or inicio > marca[0]:
+                self.marcas[metodo] = (inicio, registro[CAMPO_TEMPO])
+        return novos
+
+    def _esquecer_antigos(self):
+        # Ids anteriores à janela de reconciliação não voltam mais nas consultas
+        if self.janela_reconciliacao is None:
+            return
+        for metodo, vistos in self._vistos.items():
+            marca = self.marcas.get(metodo)
+            if marca is None:
+                continue
+            limite = (marca[0] - self.janela_reconciliacao).value
+            self._vistos[metodo] = {
+                chave: inicio for chave, inicio in vistos.items() if inicio >= limite
+            }
+
+
+def _chave_registro(registro):
+    for campo in ("_id", "id"):
+        if registro.get(campo):
+            return str(registro[campo])
+    return json.dumps(registro, sort_keys=True, default=str)
@@ -0,0 +1,644 @@
+"""Serviço local de ingestão da telemetria dos dispositivos (ESP32 + DHT11).
+
+``POST /temperature`` (ou ``/ingest``) aceita a leitura única que o
+``esp32_patient_device.ino`` envia (``{"patient_id": "1", "celsius": "36.50"}``)
+e lotes: um array JSON ou NDJSON (``application/x-ndjson``, uma leitura por
+linha). As conexões são keep-alive e atendidas pelo loop do Tornado, então
+milhares de dispositivos ficam conectados a um só processo.
+
+As leituras válidas entram num buffer; a cada ``intervalo_commit`` (ou ao
+juntar ``max_leituras``) o buffer de todos os dispositivos vira um único
+arquivo da partição ``PARTICAO`` do ``ArmazemParquet`` (group commit), e só
+então as requisições daquele lote são respondidas. ``GET /metricas`` expõe
+os contadores de vazão no formato do Prometheus e ``GET /estatisticas`` em
+JSON. ``GET /exportacao`` envia o histórico do armazém em partes, em CSV ou
+Parquet (``psm.exportacao``); ela só fica ativa com um token
+(``--token`` ou ``PSM_EXPORTACAO_TOKEN``), exige a lista de pacientes e
+aceita o token no cabeçalho ou um link assinado com ele (``assinar``).
+
+Leituras sem ``timestamp`` recebem o horário de chegada; timestamps sem fuso
+são tratados como UTC.
+
+Por padrão o serviço só atende em ``127.0.0.1``; para receber os
+dispositivos da rede use ``--endereco 0.0.0.0``.
+
+Uso (a partir de ``src/dashboard``; com milhares de dispositivos, aumente o
+limite de arquivos abertos com ``ulimit -n``)::
+
+    python -m psm.telemetria servidor --porta 8080 --destino dados
+    python -m psm.telemetria servidor --endereco 0.0.0.0 --token "$TOKEN"
+    python -m psm.telemetria frota --dispositivos 2000 --duracao 60 --lote 10
+"""
+
+import argparse
+import asyncio
+import hmac
+import json
+import math
+import os
+import time
+from collections import deque
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+import pyarrow.dataset as ds
+import tornado.iostream
+import tornado.web
+
+from psm.armazenamento import ArmazemParquet
+from psm.exportacao import FORMATOS, exportar, verificar_assinatura
+from psm.metricas import MetricasEtapas
+
+# Todas as leituras dos dispositivos ficam numa partição, com a coluna ``dispositivo``
+PARTICAO = "telemetria [dht11]"
+
+# Faixa de medição do DHT11
+FAIXA_TEMPERATURA = (0.0, 50.0)
+# Timestamps enviados pelos dispositivos podem estar um pouco adiantados
+TOLERANCIA_FUTURO = pd.Timedelta(minutes=5)
+
+CONTADORES = [
+    "requisicoes",
+    "bytes_recebidos",
+    "leituras_aceitas",
+    "leituras_rejeitadas",
+    "commits",
+    "leituras_gravadas",
+    "erros_commit",
+]
+
+
+def decodificar(corpo, tipo=""):
+    """Lista de registros de um corpo JSON (objeto ou array) ou NDJSON."""
+    texto = corpo.decode("utf-8")
+    try:
+        if "ndjson" in tipo or "jsonlines" in tipo:
+            raise json.JSONDecodeError("NDJSON", texto, 0)
+        dados = json.loads(texto)
+    except json.JSONDecodeError:
+        try:
+            dados = [json.loads(linha) for linha in texto.splitlines() if linha.strip()]
+        except json.JSONDecodeError as e:
+            raise ValueError(f"JSON inválido: {e}") from None
+    if isinstance(dados, dict):
+        dados = [dados]
+    if not isinstance(dados, list):
+        raise ValueError("Esperado um objeto, um array ou NDJSON")
+    return dados
+
+
+def validar(registros, agora=None):
+    """Separa as leituras válidas dos erros.
+
+    Devolve ``(dispositivos, tempos_ns, valores, erros)``; os tempos são em
+    ns desde a época, em UTC.
+    """
+    agora = pd.Timestamp.now(tz="UTC") if agora is None else pd.Timestamp(agora)
+    limite_ns = (agora + TOLERANCIA_FUTURO).value
+    minimo, maximo = FAIXA_TEMPERATURA
+
+    dispositivos, tempos, valores, erros = [], [], [], []
+    for posicao, registro in enumerate(registros):
+        try:
+            if not isinstance(registro, dict):
+                raise ValueError("leitura deve ser um objeto")
+            dispositivo = registro.get("patient_id", registro.get("dispositivo"))
+            if dispositivo is None or str(dispositivo).strip() == "":
+                raise ValueError("patient_id ausente")
+            valor = float(registro.get("celsius", registro.get("temperatura")))
+            if not (math.isfinite(valor) and minimo <= valor <= maximo):
+                raise ValueError(f"temperatura fora da faixa: {valor}")
+            tempo = _tempo_ns(registro.get("timestamp"), agora)
+            if tempo > limite_ns:
+                raise ValueError("timestamp no futuro")
+        except (TypeError, ValueError) as e:
+            erros.append(f"leitura {posicao}: {e}")
+            continue
+        dispositivos.append(str(dispositivo).strip())
+        tempos.append(tempo)
+        valores.append(valor)
+    return dispositivos, tempos, valores, erros
+
+
+def _tempo_ns(valor, agora):
+    if valor is None:
+        return agora.value
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        tempo = pd.Timestamp(valor, unit="s", tz="UTC")
+    else:
+        tempo = pd.Timestamp(valor)
+        if tempo is pd.NaT:
+            raise ValueError(f"timestamp inválido: {valor!r}")
+        tempo = (
+            tempo.tz_localize("UTC")
+            if tempo.tzinfo is None
+            else tempo.tz_convert("UTC")
+        )
+    return tempo.value
+
+
+class GravadorTelemetria:
+    """Buffer com group commit das leituras para o ``ArmazemParquet``.
+
+    Os métodos rodam no loop de eventos; a escrita no armazém vai para um
+    executor, e enquanto um commit grava o próximo lote já vai se formando.
+    """
+
+    def __init__(
+        self,
+        armazem,
+        particao=PARTICAO,
+        intervalo_commit=0.2,
+        max_leituras=20_000,
+        intervalo_compactacao=timedelta(minutes=1),
+        metricas=None,
+    ):
+        self.armazem = armazem
+        self.particao = particao
+        self.intervalo_commit = pd.Timedelta(intervalo_commit, unit="s").total_seconds()
+        self.max_leituras = max_leituras
+        self.intervalo_compactacao = pd.Timedelta(intervalo_compactacao).total_seconds()
+        self.metricas = metricas or MetricasEtapas()
+        self.contadores = dict.fromkeys(CONTADORES, 0)
+
+        self._pendentes = []
+        self._n_pendentes = 0
+        self._lote = None
+        self._cheio = None
+        self._compactado_em = time.monotonic()
+        # (instante, leituras aceitas) dos últimos segundos, para a vazão
+        self._janela = deque()
+
+    def adicionar(self, dispositivos, tempos, valores):
+        """Enfileira leituras validadas; devolve o Future do commit que as grava."""
+        if self._lote is None:
+            self._lote = asyncio.get_running_loop().create_future()
+        self._pendentes.append((dispositivos, tempos, valores))
+        self._n_pendentes += len(valores)
+        self.contadores["leituras_aceitas"] += len(valores)
+        self._janela.append((time.monotonic(), len(valores)))
+        if self._n_pendentes >= self.max_leituras and self._cheio is not None:
+            self._cheio.set()
+        return self._lote
+
+    async def executar(self):
+        """Laço de commits até ser cancelado; o que estiver pendente é gravado."""
+        self._cheio = asyncio.Event()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._cheio.wait(), self.intervalo_commit)
+                except asyncio.TimeoutError:
+                    pass
+                self._cheio.clear()
+                await self.commit()
+                if time.monotonic() - self._compactado_em >= self.intervalo_compactacao:
+                    await self.compactar()
+        finally:
+            await asyncio.shield(self.commit())
+
+    async def commit(self):
+        if not self._pendentes:
+            return 0
+        pendentes, lote = self._pendentes, self._lote
+        self._pendentes, self._lote, self._n_pendentes = [], None, 0
+
+        df = pd.DataFrame(
+            {
+                "timestamp": pd.to_datetime(
+                    np.concatenate([p[1] for p in pendentes]), utc=True
+                ),
+                "dispositivo": np.concatenate([p[0] for p in pendentes]).astype(object),
+                "temperatura": np.concatenate([p[2] for p in pendentes]),
+            }
+        )
+        try:
+            with self.metricas.etapa("telemetria.commit", len(df)):
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self.armazem.escrever, self.particao, df
+                )
+        except Exception as e:
+            self.contadores["erros_commit"] += 1
+            lote.set_exception(e)
+            return 0
+        self.contadores["commits"] += 1
+        self.contadores["leituras_gravadas"] += len(df)
+        lote.set_result(len(df))
+        return len(df)
+
+    async def compactar(self):
+        with self.metricas.etapa("telemetria.compactar"):
+            await asyncio.get_running_loop().run_in_executor(
+                None, self.armazem.compactar, self.particao
+            )
+        self._compactado_em = time.monotonic()
+
+    def vazao(self, janela=10.0):
+        """Leituras aceitas por segundo nos últimos ``janela`` segundos."""
+        limite = time.monotonic() - janela
+        while self._janela and self._janela[0][0] < limite:
+            self._janela.popleft()
+        return sum(n for _, n in self._janela) / janela
+
+    def estatisticas(self):
+        return {
+            **self.contadores,
+            "leituras_pendentes": self._n_pendentes,
+            "leituras_por_segundo": self.vazao(),
+        }
+
+    def texto_prometheus(self):
+        saida = []
+        for nome, valor in self.contadores.items():
+            saida += [
+                f"# TYPE psm_telemetria_{nome}_total counter",
+                f"psm_telemetria_{nome}_total {valor}",
+            ]
+        saida += [
+            "# HELP psm_telemetria_leituras_por_segundo Vazão nos últimos 10 s.",
+            "# TYPE psm_telemetria_leituras_por_segundo gauge",
+            f"psm_telemetria_leituras_por_segundo {self.vazao():.3f}",
+            "# TYPE psm_telemetria_leituras_pendentes gauge",
+            f"psm_telemetria_leituras_pendentes {self._n_pendentes}",
+        ]
+        return "\n".join(saida) + "\n" + self.metricas.texto_prometheus()
+
+
+class _Ingestao(tornado.web.RequestHandler):
+    def initialize(self, gravador):
+        self.gravador = gravador
+
+    async def post(self):
+        contadores = self.gravador.contadores
+        contadores["requisicoes"] += 1
+        contadores["bytes_recebidos"] += len(self.request.body)
+        try:
+            registros = decodificar(
+                self.request.body, self.request.headers.get("Content-Type", "")
+            )
+        except (UnicodeDecodeError, ValueError) as e:
+            self.set_status(400)
+            self.finish({"aceitas": 0, "rejeitadas": 0, "erros": [str(e)]})
+            return
+
+        dispositivos, tempos, valores, erros = validar(registros)
+        contadores["leituras_rejeitadas"] += len(erros)
+        if valores:
+            try:
+                await self.gravador.adicionar(dispositivos, tempos, valores)
+            except Exception as e:
+                self.set_status(503)
+                self.finish({"aceitas": 0, "rejeitadas": len(erros), "erros": [str(e)]})
+                return
+        else:
+            self.set_status(400)
+        self.finish(
+            {"aceitas": len(valores), "rejeitadas": len(erros), "erros": erros[:10]}
+        )
+
+
+class _Metricas(tornado.web.RequestHandler):
+    def initialize(self, gravador):
+        self.gravador = gravador
+
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(self.gravador.texto_prometheus())
+
+
+class _Estatisticas(tornado.web.RequestHandler):
+    def initialize(self, gravador):
+        self.gravador = gravador
+
+    def get(self):
+        self.finish(self.gravador.estatisticas())
+
+
+class _Exportacao(tornado.web.RequestHandler):
+    """``?paciente=...&inicio=...&fim=...&colunas=a,b&formato=csv&resolucao=1h``.
+
+    O token vai em ``Authorization: Bearer <token>``; links de download
+    abertos pelo navegador levam ``expira`` e ``assinatura`` (``assinar``)
+    em vez do token.
+    """
+
+    def initialize(self, gravador, token):
+        self.gravador = gravador
+        self.token = token
+
+    async def get(self):
+        if not self.token:
+            self.set_status(403)
+            self.finish({"erro": "exportação desabilitada (servidor sem token)"})
+            return
+        if not self._autorizado():
+            self.set_status(401)
+            self.set_header("WWW-Authenticate", "Bearer")
+            self.finish({"erro": "token inválido ou link expirado"})
+            return
+        pacientes = self.get_arguments("paciente")
+        if not pacientes:
+            self.set_status(400)
+            self.finish({"erro": "informe ao menos um paciente"})
+            return
+
+        armazem = self.gravador.armazem
+        colunas = self.get_argument("colunas", None)
+        formato = self.get_argument("formato", "csv")
+        try:
+            blocos = exportar(
+                armazem,
+                pacientes,
+                self.get_argument("inicio", None),
+                self.get_argument("fim", None),
+                colunas=colunas.split(",") if colunas else None,
+                formato=formato,
+                resolucao=self.get_argument("resolucao", None),
+            )
+        except ValueError as e:
+            self.set_status(400)
+            self.finish({"erro": str(e)})
+            return
+
+        tipo, extensao = FORMATOS[formato]
+        self.set_header("Content-Type", tipo)
+        self.set_header(
+            "Content-Disposition", f'attachment; filename="historico{extensao}"'
+        )
+        # Cada bloco (um dia de um paciente) é lido fora do loop de eventos
+        try:
+            while (bloco := await asyncio.to_thread(next, blocos, None)) is not None:
+                if bloco:
+                    self.write(bloco)
+                    await self.flush()
+        except tornado.iostream.StreamClosedError:
+            return
+        self.finish()
+
+    def _autorizado(self):
+        autorizacao = self.request.headers.get("Authorization", "")
+        if autorizacao.startswith("Bearer "):
+            return hmac.compare_digest(
+                autorizacao[len("Bearer ") :].strip().encode("utf-8"),
+                self.token.encode("utf-8"),
+            )
+        parametros = {
+            nome: [valor.decode("utf-8", "replace") for valor in valores]
+            for nome, valores in self.request.query_arguments.items()
+        }
+        return verificar_assinatura(parametros, self.token)
+
+
+def criar_aplicacao(gravador, token=None):
+    """``token`` habilita ``GET /exportacao``; sem ele a rota responde 403."""
+    argumentos = {"gravador": gravador}
+    return tornado.web.Application(
+        [
+            (r"/(?:temperature|ingest)", _Ingestao, argumentos),
+            (r"/metricas", _Metricas, argumentos),
+            (r"/estatisticas", _Estatisticas, argumentos),
+            (r"/exportacao", _Exportacao, {**argumentos, "token": token}),
+        ]
+    )
+
+
+async def servir(porta, gravador, endereco="127.0.0.1", ocioso=300, token=None):
+    """Atende até ser cancelado; ``ocioso`` fecha conexões keep-alive paradas (s)."""
+    servidor = criar_aplicacao(gravador, token).listen(
+        porta,
+        address=endereco,
+        idle_connection_timeout=ocioso,
+        max_body_size=16 * 1024**2,
+    )
+    commits = asyncio.create_task(gravador.executar())
+    try:
+        await asyncio.Event().wait()
+    finally:
+        servidor.stop()
+        commits.cancel()
+        await asyncio.gather(commits, return_exceptions=True)
+
+
+class LeitorTelemetria:
+    """Leituras novas de um dispositivo, no formato de ``converter_dados_api(extras=)``.
+
+    Lê incrementalmente a partir do último timestamp visto (na primeira vez,
+    os últimos ``janela``); leituras que chegam com timestamp anterior a ele
+    são ignoradas.
+    """
+
+    def __init__(
+        self, armazem, dispositivo, particao=PARTICAO, janela=timedelta(minutes=10)
+    ):
+        self.armazem = armazem
+        self.dispositivo = str(dispositivo)
+        self.particao = particao
+        self.janela = janela
+        self._ultimo = None
+
+    def novas(self):
+        inicio = (
+            self._ultimo
+            if self._ultimo is not None
+            else pd.Timestamp.now(tz="UTC") - self.janela
+        )
+        try:
+            df = self.armazem.ler(
+                self.particao,
+                inicio,
+                colunas=["temperatura"],
+                filtro=ds.field("dispositivo") == self.dispositivo,
+            )
+        except FileNotFoundError:
+            # Compactação em outro processo; as leituras vêm no próximo ciclo
+            df = pd.DataFrame()
+        if df.empty:
+            return pd.DataFrame(
+                {
+                    "timestamp": pd.Series(dtype="datetime64[ns, UTC]"),
+                    "temperatura": pd.Series(dtype=float),
+                }
+            )
+        if self._ultimo is not None:
+            df = df[df["timestamp"] > self._ultimo]
+        if not df.empty:
+            self._ultimo = df["timestamp"].iloc[-1]
+        return df[["timestamp", "temperatura"]].reset_index(drop=True)
+
+
+class _ConexaoHTTP:
+    """Cliente HTTP/1.1 mínimo com keep-alive, um por dispositivo simulado."""
+
+    def __init__(self, host, porta):
+        self.host = host
+        self.porta = porta
+        self._leitor = self._escritor = None
+
+    async def post(self, caminho, corpo, tipo):
+        if self._escritor is None:
+            self._leitor, self._escritor = await asyncio.open_connection(
+                self.host, self.porta
+            )
+        cabecalho = (
+            f"POST {caminho} HTTP/1.1\r\nHost: {self.host}:{self.porta}\r\n"
+            f"Content-Type: {tipo}\r\nContent-Length: {len(corpo)}\r\n\r\n"
+        )
+        self._escritor.write(cabecalho.encode("latin-1") + corpo)
+        await self._escritor.drain()
+
+        linha = await self._leitor.readline()
+        if not linha:
+            raise ConnectionError("conexão fechada pelo servidor")
+        status = int(linha.split()[1])
+        tamanho, fechar = 0, False
+        while (linha := await self._leitor.readline()) not in (b"\r\n", b""):
+            nome, _, valor = linha.decode("latin-1").partition(":")
+            nome = nome.strip().lower()
+            if nome == "content-length":
+                tamanho = int(valor)
+            elif nome == "connection" and valor.strip().lower() == "close":
+                fechar = True
+        await self._leitor.readexactly(tamanho)
+        if fechar:
+            await self.fechar()
+        return status
+
+    async def fechar(self):
+        if self._escritor is not None:
+            self._escritor.close()
+            try:
+                await self._escritor.wait_closed()
+            except OSError:
+                pass
+        self._leitor = self._escritor = None
+
+
+async def simular_dispositivos(
+    url, dispositivos=100, duracao=10.0, intervalo=5.0, lote=1, semente=None
+):
+    """Frota de dispositivos enviando temperatura a cada ``intervalo`` s.
+
+    Com ``lote == 1`` cada leitura vai numa requisição, como no ESP32 (sem
+    timestamp); com ``lote > 1`` o dispositivo acumula leituras com
+    timestamp e envia NDJSON. Devolve o resumo de vazão e latência.
+    """
+    partes = urlsplit(url)
+    caminho = partes.path or "/temperature"
+    rngs = [
+        np.random.default_rng(s)
+        for s in np.random.SeedSequence(semente).spawn(dispositivos)
+    ]
+    resumo = {"requisicoes": 0, "leituras": 0, "erros": 0}
+    latencias = []
+    loop = asyncio.get_running_loop()
+    fim = loop.time() + duracao
+
+    async def dispositivo(numero, rng):
+        conexao = _ConexaoHTTP(partes.hostname, partes.port or 80)
+        buffer = []
+        # Dispositivos ligados em instantes diferentes
+        await asyncio.sleep(rng.uniform(0, min(intervalo, duracao)))
+        while loop.time() < fim:
+            leitura = {
+                "patient_id": str(numero),
+                "celsius": f"{rng.normal(36.5, 0.3):.2f}",
+            }
+            if lote > 1:
+                leitura["timestamp"] = pd.Timestamp.now(tz="UTC").isoformat()
+            buffer.append(leitura)
+            if len(buffer) >= lote:
+                if lote == 1:
+                    corpo, tipo = json.dumps(buffer[0]).encode(), "application/json"
+                else:
+                    corpo = "".join(json.dumps(r) + "\n" for r in buffer).encode()
+                    tipo = "application/x-ndjson"
+                inicio = time.perf_counter()
+                try:
+                    status = await conexao.post(caminho, corpo, tipo)
+                except (OSError, ValueError, asyncio.IncompleteReadError):
+                    status = None
+                    await conexao.fechar()
+                latencias.append(time.perf_counter() - inicio)
+                resumo["requisicoes"] += 1
+                if status == 200:
+                    resumo["leituras"] += len(buffer)
+                else:
+                    resumo["erros"] += 1
+                buffer = []
+            await asyncio.sleep(intervalo)
+        await conexao.fechar()
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(dispositivo(i, rng) for i, rng in enumerate(rngs)))
+    segundos = time.perf_counter() - inicio
+    return {
+        "dispositivos": dispositivos,
+        **resumo,
+        "segundos": segundos,
+        "leituras_por_segundo": resumo["leituras"] / segundos,
+        "latencia_p50_ms": (
+            float(np.percentile(latencias, 50) * 1e3) if latencias else None
+        ),
+        "latencia_p95_ms": (
+            float(np.percentile(latencias, 95) * 1e3) if latencias else None
+        ),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    servidor = comandos.add_parser("servidor", help="Serviço de ingestão")
+    servidor.add_argument("--porta", type=int, default=8080)
+    servidor.add_argument(
+        "--endereco", default="127.0.0.1", help="0.0.0.0 para atender a rede"
+    )
+    servidor.add_argument("--destino", default="dados", help="Raiz do armazém")
+    servidor.add_argument("--intervalo-commit", type=float, default=0.2)
+    servidor.add_argument("--max-leituras", type=int, default=20_000)
+    servidor.add_argument(
+        "--token",
+        default=os.environ.get("PSM_EXPORTACAO_TOKEN"),
+        help="Token de GET /exportacao (padrão: $PSM_EXPORTACAO_TOKEN)",
+    )
+
+    frota = comandos.add_parser("frota", help="Frota simulada de dispositivos")
+    frota.add_argument("--url", default="http://127.0.0.1:8080/temperature")
+    frota.add_argument("--dispositivos", type=int, default=100)
+    frota.add_argument("--duracao", type=float, default=30.0)
+    frota.add_argument("--intervalo", type=float, default=5.0)
+    frota.add_argument("--lote", type=int, default=1)
+    frota.add_argument("--semente", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.comando == "servidor":
+        gravador = GravadorTelemetria(
+            ArmazemParquet(args.destino),
+            intervalo_commit=args.intervalo_commit,
+            max_leituras=args.max_leituras,
+        )
+        try:
+            asyncio.run(
+                servir(args.porta, gravador, endereco=args.endereco, token=args.token)
+            )
+        except KeyboardInterrupt:
+            pass
+    else:
+        resumo = asyncio.run(
+            simular_dispositivos(
+                args.url,
+                dispositivos=args.dispositivos,
+                duracao=args.duracao,
+                intervalo=args.intervalo,
+                lote=args.lote,
+                semente=args.semente,
+            )
+        )
+        print(json.dumps(resumo))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Treino dos detectores de anomalias num pool de processos.
+
+O ``AgendadorTreinos`` envia os ajustes de IsolationForest e LOF de todos os
+pacientes para um ``ProcessPoolExecutor`` com um processo por núcleo
+disponível, então treinos de pacientes diferentes rodam em paralelo e não
+disputam o GIL com a ingestão nem com a interface. A janela de treino vai
+para o processo por memória compartilhada (``multiprocessing.shared_memory``)
+e os rótulos das amostras de treino voltam no mesmo bloco; só os modelos
+ajustados voltam serializados.
+
+``ajustar`` devolve um ``Future`` com os ``Modelos``; quem pediu (o
+``DetectorAnomalias``) segue com os modelos anteriores até ele ficar pronto.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from psm.deteccao import COLUNAS_VITAIS, ajustar_modelos
+
+
+def nucleos_disponiveis():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class AgendadorTreinos:
+    """Pool de ``processos`` (padrão: núcleos disponíveis) para os ajustes.
+
+    Os processos são criados com ``spawn``: ``fork`` não é seguro num
+    processo com as threads do Streamlit e da ingestão.
+    """
+
+    def __init__(self, processos=None, contexto="spawn"):
+        self.processos = processos or nucleos_disponiveis()
+        self._executor = ProcessPoolExecutor(
+            self.processos, mp_context=multiprocessing.get_context(contexto)
+        )
+        self._pendentes = 0
+        self._concluidos = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pendentes(self):
+        return self._pendentes
+
+    @property
+    def concluidos(self):
+        return self._concluidos
+
+    def ajustar(self, X):
+        """``Future`` com os ``Modelos`` ajustados sobre ``X`` (amostras × vitais)."""
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        n = len(X)
+        bloco = SharedMemory(create=True, size=X.nbytes + 2 * n)
+        np.ndarray(X.shape, dtype=np.float64, buffer=bloco.buf)[:] = X
+        with self._lock:
+            self._pendentes += 1
+
+        resultado = Future()
+        resultado.set_running_or_notify_cancel()
+
+        def concluir(tarefa):
+            try:
+                modelos = tarefa.result()
+                rotulos = np.ndarray(
+                    (2, n), dtype=np.int8, buffer=bloco.buf, offset=X.nbytes
+                ).astype(int)
+                modelos = modelos._replace(
+                    anomalias_if=rotulos[0], anomalias_lof=rotulos[1]
+                )
+                erro = None
+            except BaseException as e:
+                erro = e
+            finally:
+                bloco.close()
+                bloco.unlink()
+                with self._lock:
+                    self._pendentes -= 1
+                    self._concluidos += 1
+            if erro is None:
+                resultado.set_result(modelos)
+            else:
+                resultado.set_exception(erro)
+
+        try:
+            tarefa = self._executor.submit(_ajustar, bloco.name, X.shape)
+        except BaseException:
+            bloco.close()
+            bloco.unlink()
+            with self._lock:
+                self._pendentes -= 1
+            raise
+        tarefa.add_done_callback(concluir)
+        return resultado
+
+    def detectar_lotes(self, lotes):
+        """``detectar_anomalias_lote`` de cada DataFrame, ajustados em paralelo."""
+        treinos = [
+            (
+                self.ajustar(df[COLUNAS_VITAIS].to_numpy(dtype=float))
+                if len(df) >= 5
+                else None
+            )
+            for df in lotes
+        ]
+        for df, treino in zip(lotes, treinos):
+            if treino is None:
+                df["Anomalia_IF"] = 1
+                df["Anomalia_LOF"] = 1
+            else:
+                modelos = treino.result()
+                df["Anomalia_IF"] = modelos.anomalias_if
+                df["Anomalia_LOF"] = modelos.anomalias_lof
+        return lotes
+
+    def encerrar(self, esperar=True):
+        self._executor.shutdown(wait=esperar, cancel_futures=not esperar)
+
+
+def _ajustar(nome, forma):
+    # Executado nos processos do pool
+    bloco = SharedMemory(name=nome)
+    try:
+        # Cópia local: o LOF guarda as amostras de treino no modelo
+        X = np.ndarray(forma, dtype=np.float64, buffer=bloco.buf).copy()
+        modelos = ajustar_modelos(X)
+        rotulos = np.ndarray(
+            (2, forma[0]), dtype=np.int8, buffer=bloco.buf, offset=X.nbytes
+        )
+        rotulos[0] = modelos.anomalias_if
+        rotulos[1] = modelos.anomalias_lof
+        del rotulos
+        return modelos._replace(anomalias_if=None, anomalias_lof=None)
+    finally:
+        bloco.close()
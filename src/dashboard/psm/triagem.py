@@ -0,0 +1,196 @@
+"""Primeira camada da detecção: detectores estatísticos por vital.
+
+A ``TriagemEstatistica`` mantém, para cada vital de um paciente, média e
+variância com média móvel exponencial (um z-score "rolante" com estado
+constante no lugar de uma janela de amostras), a EWMA do z-score e as somas
+do CUSUM bilateral. Cada lote é avaliado de uma vez, com operações colunares
+sobre amostras × vitais, e só as linhas marcadas por algum detector (mais
+``contexto`` amostras em volta) seguem para IsolationForest e LOF.
+
+Sem reinício após o alarme, o CUSUM continua marcando enquanto o desvio
+persiste; como a média se adapta ao novo patamar, o z-score volta para
+perto de zero e as somas descem sozinhas.
+
+Modo e limiares ficam numa ``ConfiguracaoTriagem`` compartilhada pelos
+detectores, lida a cada lote, então mudanças feitas na interface valem no
+tick seguinte da ingestão.
+"""
+
+import numpy as np
+import pandas as pd
+
+from psm.deteccao import COLUNAS_VITAIS
+
+MODOS_DETECCAO = {
+    "camadas": "Em camadas (estatística → modelos)",
+    "completo": "Modelos em todas as amostras",
+}
+
+DETECTORES = ["zscore", "ewma", "cusum"]
+
+
+class ConfiguracaoTriagem:
+    """Parâmetros ajustáveis em tempo de execução.
+
+    No modo ``"completo"`` a triagem continua sendo avaliada (para manter o
+    estado e as taxas), mas todas as amostras vão para os modelos.
+    """
+
+    def __init__(
+        self, modo="camadas", limiar_z=3.0, limiar_ewma=3.0, cusum_h=5.0, contexto=2
+    ):
+        self.modo = modo
+        self.limiar_z = limiar_z
+        self.limiar_ewma = limiar_ewma
+        self.cusum_h = cusum_h
+        self.contexto = contexto
+
+    def atualizar(self, **parametros):
+        for nome, valor in parametros.items():
+            if not hasattr(self, nome):
+                raise AttributeError(nome)
+            if nome == "modo" and valor not in MODOS_DETECCAO:
+                raise ValueError(f"Modo de detecção desconhecido: {valor}")
+            setattr(self, nome, valor)
+
+
+class TriagemEstatistica:
+    """Estado O(1) por vital: ``avaliar`` devolve as linhas candidatas do lote.
+
+    ``janela`` é o alcance equivalente da média exponencial; cada vital só
+    dispara depois de ``aquecimento`` amostras, e até lá suas linhas são
+    candidatas.
+    """
+
+    def __init__(
+        self,
+        configuracao=None,
+        vitais=len(COLUNAS_VITAIS),
+        janela=120,
+        lambda_ewma=0.2,
+        cusum_k=0.5,
+        aquecimento=30,
+    ):
+        self.configuracao = configuracao or ConfiguracaoTriagem()
+        self.alpha = 2 / (janela + 1)
+        self.lambda_ewma = lambda_ewma
+        self.cusum_k = cusum_k
+        self.aquecimento = aquecimento
+
+        self._n = np.zeros(vitais, dtype=np.int64)
+        self._media = np.zeros(vitais)
+        self._variancia = np.zeros(vitais)
+        self._ewma = np.zeros(vitais)
+        self._cusum_pos = np.zeros(vitais)
+        self._cusum_neg = np.zeros(vitais)
+        self._restante = 0
+
+        self.amostras = 0
+        self.candidatas = 0
+        self.disparos = dict.fromkeys(DETECTORES, 0)
+
+    @property
+    def modo(self):
+        return self.configuracao.modo
+
+    def avaliar(self, X):
+        """Máscara das linhas de ``X`` (amostras × vitais, NaN = ausente) candidatas."""
+        configuracao = self.configuracao
+        n = len(X)
+        if n == 0:
+            return np.zeros(0, dtype=bool)
+
+        validos = ~np.isnan(X)
+        iniciado = self._n > 0
+        medias = _ewm(np.where(iniciado, self._media, np.nan), X, self.alpha)
+        desvios = X - medias[:-1]
+        variancias = _ewm(
+            np.where(iniciado, self._variancia, np.nan),
+            (1 - self.alpha) * desvios**2,
+            self.alpha,
+        )
+
+        vistas = self._n + np.cumsum(validos, axis=0) - validos
+        aquecido = validos & (vistas >= self.aquecimento)
+        desvio_padrao = np.sqrt(variancias[:-1])
+        z = np.full(X.shape, np.nan)
+        np.divide(desvios, desvio_padrao, out=z, where=aquecido & (desvio_padrao > 0))
+        com_z = ~np.isnan(z)
+
+        ewmas = _ewm(self._ewma, z, self.lambda_ewma)[1:]
+        limite_ewma = configuracao.limiar_ewma * np.sqrt(
+            self.lambda_ewma / (2 - self.lambda_ewma)
+        )
+        cusum_pos = _cusum(self._cusum_pos, np.where(com_z, z - self.cusum_k, 0.0))
+        cusum_neg = _cusum(self._cusum_neg, np.where(com_z, -z - self.cusum_k, 0.0))
+
+        disparos = {
+            "zscore": (np.abs(np.nan_to_num(z)) > configuracao.limiar_z).any(axis=1),
+            "ewma": (com_z & (np.abs(ewmas) > limite_ewma)).any(axis=1),
+            "cusum": (
+                com_z
+                & ((cusum_pos > configuracao.cusum_h) | (cusum_neg > configuracao.cusum_h))
+            ).any(axis=1),
+        }
+        marcadas = (validos & ~aquecido).any(axis=1)
+        for nome, linhas in disparos.items():
+            marcadas |= linhas
+            self.disparos[nome] += int(linhas.sum())
+
+        candidatas = self._expandir(marcadas, int(configuracao.contexto))
+
+        self._n += validos.sum(axis=0)
+        self._media = np.nan_to_num(medias[-1])
+        self._variancia = np.nan_to_num(variancias[-1])
+        self._ewma = ewmas[-1]
+        self._cusum_pos = cusum_pos[-1]
+        self._cusum_neg = cusum_neg[-1]
+        self.amostras += n
+        self.candidatas += int(candidatas.sum())
+        return candidatas
+
+    def taxas(self):
+        """Fração das amostras marcadas por cada detector e candidatas no total."""
+        total = max(self.amostras, 1)
+        return {
+            "amostras": self.amostras,
+            "candidatas": self.candidatas / total,
+            **{nome: contagem / total for nome, contagem in self.disparos.items()},
+        }
+
+    def _expandir(self, marcadas, contexto):
+        # Janela de ``contexto`` amostras em volta de cada marcada, incluindo
+        # o início do lote seguinte
+        candidatas = marcadas.copy()
+        if contexto > 0 and marcadas.any():
+            janela = np.convolve(
+                marcadas.astype(np.int64), np.ones(2 * contexto + 1, dtype=np.int64)
+            )
+            candidatas |= janela[contexto : contexto + len(marcadas)] > 0
+        candidatas[: self._restante] = True
+
+        if marcadas.any():
+            ultima = int(np.flatnonzero(marcadas)[-1])
+            self._restante = max(contexto - (len(marcadas) - 1 - ultima), 0)
+        else:
+            self._restante = max(self._restante - len(marcadas), 0)
+        return candidatas
+
+
+def _ewm(inicial, X, alpha):
+    # Média exponencial continuando de ``inicial`` (NaN = ainda sem amostras);
+    # amostras NaN não atualizam a média
+    return (
+        pd.DataFrame(np.vstack([inicial, X]))
+        .ewm(alpha=alpha, adjust=False, ignore_na=True)
+        .mean()
+        .to_numpy()
+    )
+
+
+def _cusum(inicial, passos):
+    # S_t = max(0, S_{t-1} + y_t) em forma fechada (recursão de Lindley):
+    # S_t = C_t - min(-S_0, min_{s<=t} C_s), com C a soma acumulada de y
+    acumulado = np.cumsum(passos, axis=0)
+    minimos = np.minimum(np.minimum.accumulate(acumulado, axis=0), -inicial)
+    return acumulado - minimos
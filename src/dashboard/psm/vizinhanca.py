@@ -0,0 +1,101 @@
+"""Índice de vizinhos persistente para pontuar amostras novas com LOF.
+
+O ``IndiceLOF`` guarda uma KD-tree sobre os vitais padronizados (média e
+desvio da janela indexada) junto com a distância ao k-ésimo vizinho e a
+densidade local (lrd) de cada ponto indexado. Pontuar uma amostra nova é uma
+consulta de k vizinhos na árvore, O(log n), sem reajustar nada.
+
+Amostras novas entram por ``adicionar``: ficam pendentes e, a cada
+``reconstruir_a_cada`` amostras, a árvore é reconstruída com as pendentes
+e sem as que saíram da janela de ``capacidade`` pontos, então a memória é
+limitada e o custo da reconstrução é amortizado entre os lotes. Até lá as
+pendentes não são vizinhas de ninguém.
+
+Segue a interface do ``LocalOutlierFactor(novelty=True)`` usada pelo
+detector (``fit``, ``predict``, ``score_samples``,
+``negative_outlier_factor_`` e ``offset_``).
+"""
+
+import numpy as np
+
+
+class IndiceLOF:
+    # Mesmo corte do LocalOutlierFactor com contamination="auto"
+    offset_ = -1.5
+
+    def __init__(
+        self, n_vizinhos=20, capacidade=5000, reconstruir_a_cada=100, leaf_size=40
+    ):
+        self.n_vizinhos = n_vizinhos
+        self.capacidade = capacidade
+        self.reconstruir_a_cada = reconstruir_a_cada
+        self.leaf_size = leaf_size
+        self.reconstrucoes = 0
+
+        self._pontos = None
+        self._pendentes = []
+        self._n_pendentes = 0
+
+    @property
+    def nbytes(self):
+        if self._pontos is None:
+            return 0
+        # Pontos originais, padronizados (na árvore) e os vetores por ponto
+        return int(2 * self._pontos.nbytes + 3 * len(self._pontos) * 8)
+
+    def fit(self, X):
+        self._pontos = np.array(X, dtype=float)[-self.capacidade :]
+        self._pendentes = []
+        self._n_pendentes = 0
+        self._construir()
+        return self
+
+    def adicionar(self, X):
+        """Acrescenta amostras à janela; reconstrói o índice quando vence o lote."""
+        if len(X) == 0:
+            return
+        self._pendentes.append(np.asarray(X, dtype=float))
+        self._n_pendentes += len(X)
+        if self._n_pendentes >= self.reconstruir_a_cada:
+            self._pontos = np.concatenate([self._pontos, *self._pendentes])[
+                -self.capacidade :
+            ]
+            self._pendentes = []
+            self._n_pendentes = 0
+            self._construir()
+
+    def score_samples(self, X):
+        """Oposto do LOF de cada linha de ``X`` (menor = mais anômalo)."""
+        distancias, vizinhos = self._arvore.query(self._padronizar(X), k=self._k)
+        lrd = self._densidade(distancias, vizinhos)
+        return -(self._lrd[vizinhos].mean(axis=1) / lrd)
+
+    def predict(self, X):
+        return np.where(self.score_samples(X) < self.offset_, -1, 1)
+
+    def _padronizar(self, X):
+        return (np.asarray(X, dtype=float) - self._media) / self._desvio
+
+    def _construir(self):
+        from sklearn.neighbors import KDTree
+
+        X = self._pontos
+        desvio = X.std(axis=0)
+        self._media = X.mean(axis=0)
+        self._desvio = np.where(desvio > 0, desvio, 1.0)
+        self._k = max(min(self.n_vizinhos, len(X) - 1), 1)
+
+        Z = self._padronizar(X)
+        self._arvore = KDTree(Z, leaf_size=self.leaf_size)
+        # O vizinho mais próximo de cada ponto indexado é ele mesmo
+        distancias, vizinhos = self._arvore.query(Z, k=min(self._k + 1, len(X)))
+        distancias, vizinhos = distancias[:, 1:], vizinhos[:, 1:]
+        self._distancia_k = distancias[:, -1]
+        self._lrd = self._densidade(distancias, vizinhos)
+        self.negative_outlier_factor_ = -(self._lrd[vizinhos].mean(axis=1) / self._lrd)
+        self.reconstrucoes += 1
+
+    def _densidade(self, distancias, vizinhos):
+        # Densidade local: inverso da distância de alcance média
+        alcance = np.maximum(distancias, self._distancia_k[vizinhos])
+        return 1.0 / (alcance.mean(axis=1) + 1e-10)
@@ -1,19 +1,50 @@
-import requests
+import json
+import os
+import sys
+from urllib.parse import urlencode
 import streamlit as st
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import time
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from sklearn.ensemble import IsolationForest
-from sklearn.neighbors import LocalOutlierFactor
-from functools import reduce
 
+from psm.agregados import RESOLUCOES, AgregadosPaciente
+from psm.alertas import verificar_alertas
+from psm.alinhamento import AlinhadorSinais
+from psm.armazenamento import ArmazemParquet
+from psm.anomalias import explicar_anomalias
+from psm.atividades import processar_atividades
+from psm.cache import CachePacientes
+from psm.deteccao import DetectorAnomalias
+from psm.enfermaria import PainelEnfermaria
+from psm.esquema import localizar
+from psm.exportacao import FORMATOS, assinar
+from psm.historico import COLUNAS_HISTORICO, HistoricoPaciente
+from psm.ingestao import FonteAPI, FonteSimulada, IngestorPaciente, ServicoIngestao
+from psm.metricas import MetricasEtapas
+from psm.regras import FilaAlertas, MotorAlertas, PublicadorMQTT
+from psm.simulador import gerar_sinais
+from psm.sincronizacao import SincronizacaoAPI
+from psm.treino import AgendadorTreinos
+from psm.triagem import MODOS_DETECCAO, ConfiguracaoTriagem, TriagemEstatistica
+
+# plotly (psm.graficos), requests (psm.hcgateway), tornado (psm.telemetria) e
+# sklearn (dentro de psm.deteccao) são importados só no primeiro uso, para o
+# primeiro desenho da página não esperar por eles; orçamento medido com
+# python -m benchmarks.importacao
 import warnings
 
 warnings.filterwarnings("ignore", category=UserWarning)
 
+# Este arquivo se chama streamlit.py: com a pasta dele no início do sys.path,
+# os processos do pool de treino importariam o script no lugar do pacote
+# streamlit. No fim da lista o pacote psm continua importável.
+PASTA_APP = os.path.dirname(os.path.abspath(__file__))
+if any(os.path.abspath(p or os.curdir) == PASTA_APP for p in sys.path[:-1]):
+    sys.path[:] = [
+        p for p in sys.path if os.path.abspath(p or os.curdir) != PASTA_APP
+    ] + [PASTA_APP]
+
 # Configurações da página
 st.set_page_config(
     page_title="PSMv2 - Monitoramento",
@@ -42,448 +73,452 @@ MEDICOS = [
     "Dra. Costa - Clínica Geral",
     "Dr. Oliveira - Cirurgia",
 ]
-COLOR_PALETTE = ["#3498DB", "#2ECC71", "#E74C3C", "#9B59B6", "#F1C40F"]
+
+# API HCGateway
+API_URL = "https://api-maloca.ed-henrique.com"
+API_USUARIO = "Gabriel"
+API_SENHA = "1234"
+API_METODOS = ["heartRate", "oxygenSaturation", "bloodPressure", "exerciseSession"]
+API_INTERVALO_RECONCILIACAO = timedelta(minutes=15)
+
+# Dispositivo (ESP32 + DHT11) de cada paciente: a temperatura recebida pelo
+# serviço de telemetria (python -m psm.telemetria servidor) entra nos dados da API
+DISPOSITIVOS_PADRAO = {"Paciente 1 - Pós-Cirúrgico": "1"}
+
+# Alinhamento das métricas da API numa grade regular
+ALINHAMENTO_FREQUENCIA = "1min"
+ALINHAMENTO_LIMITE_FFILL = 30
+
+# Detecção incremental (tempo real)
+DETECCAO_JANELA_TREINO = 5000
+DETECCAO_RETREINO_AMOSTRAS = 500
+DETECCAO_LIMIAR_DRIFT = 2.0
+DETECCAO_PROCESSOS = None  # pool de treino; None: um processo por núcleo
+
+# Primeira camada da detecção (z-score, EWMA e CUSUM por vital): só as
+# amostras marcadas vão para IsolationForest/LOF. Ajustável em Configurações.
+TRIAGEM_MODO = "camadas"  # ou "completo"
+TRIAGEM_LIMIAR_Z = 3.0
+TRIAGEM_LIMIAR_EWMA = 3.0
+TRIAGEM_CUSUM_H = 5.0
+TRIAGEM_CONTEXTO = 2  # amostras em volta de cada marcada
+TRIAGEM_JANELA = 120
+
+# Histórico em memória por paciente (tempo real)
+HISTORICO_CAPACIDADE = 50_000
+HISTORICO_RETENCAO = timedelta(days=3)
+
+# Armazenamento persistente (Parquet por paciente e dia)
+ARMAZEM_DIRETORIO = "dados"
+ARMAZEM_INTERVALO_COMPACTACAO = timedelta(minutes=5)
+
+# Exportação do histórico: o arquivo é enviado em partes direto do armazém
+# pelo serviço de telemetria (python -m psm.telemetria servidor --token ...),
+# nunca montado em memória pelo painel; sem a URL a exportação fica desativada.
+# O token fica no painel: cada link leva só uma assinatura que expira
+EXPORTACAO_URL = None  # ex.: "http://localhost:8080/exportacao"
+EXPORTACAO_TOKEN = os.environ.get("PSM_EXPORTACAO_TOKEN")
+EXPORTACAO_VALIDADE_LINK = timedelta(minutes=5)
+EXPORTACAO_DIAS_PADRAO = 7
+
+# Agregados (1 min, 15 min, 1 h, 1 dia) usados no modo histórico
+AGREGADOS_RETENCAO_1MIN = timedelta(days=30)
+
+# Gráficos: pontos enviados por série proporcionais à largura em pixels
+GRAFICO_LARGURA = 1400
+GRAFICO_REDUCAO = "minmax"  # ou "lttb"
+
+# Estado por paciente compartilhado entre sessões (histórico, detector, agregados...).
+# Os limites só expulsam pacientes que a ingestão não acompanha mais
+CACHE_TTL = timedelta(minutes=30)
+CACHE_MAX_PACIENTES = 100
+CACHE_MAX_BYTES = 1024**3
+
+# Ingestão em segundo plano: a interface só relê o último retrato
+ATUALIZACAO_INTERVALO = timedelta(seconds=5)
+INGESTAO_EXPIRACAO = timedelta(minutes=30)  # pacientes sem ninguém acompanhando
+INGESTAO_ESPERA_INICIAL = 10  # segundos esperando o primeiro retrato
+
+# Motor de alertas: cada leitura nova é avaliada na ingestão e os alertas
+# disparados/resolvidos são publicados (fila em memória e, se houver, MQTT)
+ALERTAS_HISTERESE = 0.05  # fração da faixa normal
+ALERTAS_DURACAO_MINIMA = timedelta(seconds=10)
+ALERTAS_INTERVALO_REPETICAO = timedelta(minutes=5)
+ALERTAS_RECENTES = 1000
+ALERTAS_MQTT_HOST = None  # ex.: "localhost" com um broker Mosquitto local
+ALERTAS_MQTT_PORTA = 1883
+ALERTAS_MQTT_TOPICO = "psm/alertas"
+
+# Tempo por etapa (painel na barra lateral e exportação para coleta local)
+METRICAS_HABILITADAS = True
+METRICAS_PROMETHEUS = "metricas/psm.prom"
+METRICAS_PROMETHEUS_INGESTAO = "metricas/psm_ingestao.prom"
+METRICAS_JSONL = None
 
 # Inicialização da sessão
 if "PACIENTES" not in st.session_state:
     st.session_state.PACIENTES = ["Paciente 1 - Pós-Cirúrgico"]
 
-if "dados_acumulados" not in st.session_state:
-    st.session_state.dados_acumulados = {}
-
-if "limites" not in st.session_state:
-    st.session_state.limites = {
-        "temperatura": {
-            "min": 35,
-            "max": 37.5,
-            "msg_min": "Hipotermia",
-            "msg_max": "Febre",
-        },
-        "batimento_cardiaco": {
-            "min": 60,
-            "max": 120,
-            "msg_min": "Bradicardia",
-            "msg_max": "Batimento cardíaco elevado",
-        },
-        "pressao_sistolica": {
-            "min": 90,
-            "max": 140,
-            "msg_min": "Hipotensão",
-            "msg_max": "Hipertensão",
-        },
-        "pressao_diastolica": {
-            "min": 60,
-            "max": 90,
-            "msg_min": "Hipotensão",
-            "msg_max": "Hipertensão",
-        },
-        "glicose": {
-            "min": 70,
-            "max": 180,
-            "msg_min": "Hipoglicemia",
-            "msg_max": "Hiperglicemia",
-        },
-        "oxigenio": {
-            "min": 95,
-            "max": 100,
-            "msg_min": "Hipoxemia",
-            "msg_max": "Hiperóxia",
-        },
-    }
+if "DISPOSITIVOS" not in st.session_state:
+    st.session_state.DISPOSITIVOS = dict(DISPOSITIVOS_PADRAO)
 
+if "metricas" not in st.session_state:
+    st.session_state.metricas = MetricasEtapas(habilitado=METRICAS_HABILITADAS)
 
-def detectar_anomalias(df):
-    try:
-        if len(df) < 5:
-            df["Anomalia_IF"] = 1
-            df["Anomalia_LOF"] = 1
-            return df
-
-        iso_forest = IsolationForest()
-        anomalias_if = iso_forest.fit_predict(
-            df[
-                [
-                    "batimento_cardiaco",
-                    "temperatura",
-                    "pressao_sistolica",
-                    "pressao_diastolica",
-                    "glicose",
-                    "oxigenio",
-                ]
-            ]
-        )
 
-        lof = LocalOutlierFactor()
-        anomalias_lof = lof.fit_predict(
-            df[
-                [
-                    "batimento_cardiaco",
-                    "temperatura",
-                    "pressao_sistolica",
-                    "pressao_diastolica",
-                    "glicose",
-                    "oxigenio",
-                ]
-            ]
-        )
+def etapa(nome, linhas=None):
+    return st.session_state.metricas.etapa(nome, linhas)
 
-        df["Anomalia_IF"] = anomalias_if
-        df["Anomalia_LOF"] = anomalias_lof
 
-        return df
+def detectar_anomalias(lotes):
+    try:
+        with etapa("detectar_anomalias", sum(len(df) for df in lotes)):
+            return get_agendador_treinos().detectar_lotes(lotes)
     except Exception as e:
         st.error(f"Erro na detecção de anomalias: {str(e)}")
-        return df
+        return lotes
 
 
-def processar_anomalias(df):
-    anomalias = []
-
-    if not df.empty and "Anomalia_IF" in df.columns and "Anomalia_LOF" in df.columns:
-        for idx, row in df.iterrows():
-            motivo = []
-            if row["Anomalia_IF"] == -1 or row["Anomalia_LOF"] == -1:
-                for limite, atributos in st.session_state.limites.items():
-                    if row[limite] >= atributos["max"]:
-                        motivo.append(atributos["msg_max"])
-                    elif row[limite] <= atributos["min"]:
-                        motivo.append(atributos["msg_min"])
-
-                if not motivo:
-                    motivo.append("Padrão anômalo detectado pelo modelo")
-
-                modelos_detectados = []
-                if row["Anomalia_IF"] == -1:
-                    modelos_detectados.append("IF")
-                if row["Anomalia_LOF"] == -1:
-                    modelos_detectados.append("LOF")
-
-                anomalias.append(
-                    {
-                        "timestamp": row["timestamp"],
-                        "Data/Hora": row["timestamp"].strftime("%d/%m/%Y %H:%M:%S"),
-                        "Batimento Cardíaco (BPM)": row["batimento_cardiaco"],
-                        "Temperatura (°C)": f"{row['temperatura']:.1f}",
-                        "Pressão Sistólica (mmHg)": f"{row['pressao_sistolica']:.1f}",
-                        "Pressão Diastólica (mmHg)": f"{row['pressao_diastolica']:.1f}",
-                        "Glicose (mg/dL)": f"{row['glicose']:.1f}",
-                        "Oxigênio (SpO2)": f"{row['oxigenio']:.1f}",
-                        "Modelo Detectado": " + ".join(modelos_detectados),
-                        "Motivo": ", ".join(motivo),
-                    }
-                )
+@st.cache_resource
+def get_agendador_treinos():
+    return AgendadorTreinos(DETECCAO_PROCESSOS)
 
-    return pd.DataFrame(anomalias)
 
+@st.cache_resource
+def get_configuracao_triagem():
+    return ConfiguracaoTriagem(
+        modo=TRIAGEM_MODO,
+        limiar_z=TRIAGEM_LIMIAR_Z,
+        limiar_ewma=TRIAGEM_LIMIAR_EWMA,
+        cusum_h=TRIAGEM_CUSUM_H,
+        contexto=TRIAGEM_CONTEXTO,
+    )
 
-def generate_random_data(real_time=True, start=None, end=None):
-    try:
-        np.random.seed(int(time.time()))
-        anomaly_ratio = 0.3
-        activity_transition_prob = 0.2
-        base_params = {
-            "temperatura": (36.5, 0.5),
-            "batimento_cardiaco": (80, 15),
-            "pressao_sistolica": (120, 10),
-            "pressao_diastolica": (80, 5),
-            "glicose": (100, 20),
-            "oxigenio": (98, 1),
-        }
 
-        if real_time:
-            if start:
-                now = start
-            else:
-                now = datetime.now() - timedelta(days=1)
-
-            num_points = np.random.randint(5, 10)
-
-            if paciente in st.session_state.dados_acumulados:
-                ultimo_ts = st.session_state.dados_acumulados[paciente][0][
-                    "timestamp"
-                ].iloc[-1]
-                timestamps = [
-                    ultimo_ts + timedelta(seconds=10 * (i + 1))
-                    for i in range(num_points)
-                ]
-            else:
-                timestamps = [
-                    now + timedelta(seconds=10 * i) for i in range(num_points)
-                ]
-        else:
-            start_dt = datetime.combine(start[0], start[1])
-            end_dt = datetime.combine(end[0], end[1])
+@st.cache_resource
+def get_cache():
+    return CachePacientes(
+        ttl=CACHE_TTL, max_pacientes=CACHE_MAX_PACIENTES, max_bytes=CACHE_MAX_BYTES
+    )
+
+
+def get_estado(paciente):
+    return get_cache().estado(paciente)
+
+
+@st.cache_resource
+def get_armazem():
+    return ArmazemParquet(ARMAZEM_DIRETORIO)
+
+
+def paciente_de(chave):
+    return chave[0] if isinstance(chave, tuple) else chave
+
+
+def nome_armazem(chave):
+    if isinstance(chave, tuple):
+        return f"{chave[0]} [{chave[1]}]"
+    return chave
 
-            if end_dt < start_dt:
-                st.error("Data final deve ser após a data inicial.")
-                return pd.DataFrame(), pd.DataFrame()
 
-            delta = end_dt - start_dt
-            total_seconds = delta.total_seconds()
-            num_points = max(int(total_seconds // 60), 1)
-            timestamps = [start_dt + timedelta(minutes=i) for i in range(num_points)]
+def get_agregados(paciente):
+    return get_estado(paciente).obter("agregados", criar_agregados)
 
-        num_anomaly = max(1, int(num_points * anomaly_ratio))
-        anomaly_indices = np.random.choice(num_points, num_anomaly, replace=False)
 
-        data = {
-            "timestamp": timestamps,
-            "temperatura": np.where(
-                np.isin(np.arange(num_points), anomaly_indices),
-                np.random.normal(39.5, 0.8, num_points),
-                np.random.normal(36.5, 0.3, num_points),
+def get_agregados_simulados(paciente):
+    """Agregados das horas simuladas no modo histórico, guardados na sessão."""
+    simulados = st.session_state.setdefault("agregados_simulados", {})
+    if paciente not in simulados:
+        simulados[paciente] = criar_agregados()
+    return simulados[paciente]
+
+
+def criar_agregados():
+    return AgregadosPaciente(retencao={"1min": AGREGADOS_RETENCAO_1MIN})
+
+
+@st.cache_resource
+def get_enfermaria():
+    return PainelEnfermaria(paciente_de=paciente_de)
+
+
+@st.cache_resource
+def get_metricas_ingestao():
+    return MetricasEtapas(habilitado=METRICAS_HABILITADAS)
+
+
+@st.cache_resource
+def get_fila_alertas():
+    return FilaAlertas(ALERTAS_RECENTES)
+
+
+@st.cache_resource
+def get_motor_alertas():
+    destinos = [get_fila_alertas()]
+    if ALERTAS_MQTT_HOST:
+        destinos.append(
+            PublicadorMQTT(ALERTAS_MQTT_HOST, ALERTAS_MQTT_PORTA, ALERTAS_MQTT_TOPICO)
+        )
+    enfermaria = get_enfermaria()
+    # Sem sessão na thread de ingestão: os limites de todos os pacientes e os
+    # específicos vêm da enfermaria, compartilhada com a grade e as sessões
+    return MotorAlertas(
+        limites_de=lambda p: enfermaria.limites_paciente(p, enfermaria.padrao),
+        paciente_de=paciente_de,
+        histerese=ALERTAS_HISTERESE,
+        duracao_minima=ALERTAS_DURACAO_MINIMA,
+        intervalo_repeticao=ALERTAS_INTERVALO_REPETICAO,
+        destinos=destinos,
+        metricas=get_metricas_ingestao(),
+    )
+
+
+@st.cache_resource
+def get_ingestao():
+    servico = ServicoIngestao(
+        get_cache(),
+        ATUALIZACAO_INTERVALO,
+        expiracao=INGESTAO_EXPIRACAO,
+        metricas=get_metricas_ingestao(),
+        observadores=[get_enfermaria().atualizar, get_motor_alertas().observar],
+    )
+    servico.iniciar()
+    return servico
+
+
+def fabrica_ingestor(chave):
+    """Fábrica do ``IngestorPaciente`` de ``chave``, chamada na thread de ingestão."""
+    armazem = get_armazem()
+    metricas = get_ingestao().metricas
+    agendador = get_agendador_treinos()
+    configuracao_triagem = get_configuracao_triagem()
+    cliente = get_cliente_api() if isinstance(chave, tuple) else None
+    dispositivo = (
+        st.session_state.DISPOSITIVOS.get(chave[0])
+        if isinstance(chave, tuple)
+        else None
+    )
+
+    def criar(estado):
+        if cliente is not None:
+            from psm.telemetria import LeitorTelemetria
+
+            fonte = FonteAPI(
+                SincronizacaoAPI(
+                    cliente,
+                    API_METODOS,
+                    intervalo_reconciliacao=API_INTERVALO_RECONCILIACAO,
+                    janela_reconciliacao=HISTORICO_RETENCAO,
+                    metricas=metricas,
+                ),
+                AlinhadorSinais(
+                    frequencia=ALINHAMENTO_FREQUENCIA,
+                    limite_ffill=ALINHAMENTO_LIMITE_FFILL,
+                    retencao=HISTORICO_RETENCAO,
+                ),
+                metricas=metricas,
+                temperatura=(
+                    LeitorTelemetria(armazem, dispositivo) if dispositivo else None
+                ),
+            )
+        else:
+            fonte = FonteSimulada()
+        return IngestorPaciente(
+            fonte,
+            HistoricoPaciente(
+                capacidade=HISTORICO_CAPACIDADE, retencao=HISTORICO_RETENCAO
             ),
-            "batimento_cardiaco": np.where(
-                np.isin(np.arange(num_points), anomaly_indices),
-                np.random.normal(160, 20, num_points),
-                np.random.normal(80, 5, num_points),
-            ).astype(int),
-            "atividade": self_generate_activity(num_points, activity_transition_prob),
-        }
+            DetectorAnomalias(
+                janela_treino=DETECCAO_JANELA_TREINO,
+                retreino_amostras=DETECCAO_RETREINO_AMOSTRAS,
+                limiar_drift=DETECCAO_LIMIAR_DRIFT,
+                agendador=agendador,
+                triagem=TriagemEstatistica(
+                    configuracao_triagem, janela=TRIAGEM_JANELA
+                ),
+            ),
+            estado.obter("agregados", criar_agregados),
+            armazem=armazem,
+            nome=nome_armazem(chave),
+            intervalo_compactacao=ARMAZEM_INTERVALO_COMPACTACAO,
+            metricas=metricas,
+        )
 
-        for param in ["pressao_sistolica", "pressao_diastolica", "glicose", "oxigenio"]:
-            data[param] = np.random.normal(
-                base_params[param][0], base_params[param][1], num_points
-            ).astype(int)
+    return criar
 
-        data["dispositivo_estado"] = ["Ativo"] * num_points
 
-        df = pd.DataFrame(data)
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        df = detectar_anomalias(df)
+def acompanhar(chave):
+    get_ingestao().acompanhar(chave, fabrica_ingestor(chave))
 
-        atividades = processar_atividades(df)
-        df_atividades = pd.DataFrame(atividades)
-        return df, df_atividades
 
-    except Exception as e:
-        st.error(f"Erro na geração de dados: {str(e)}")
+def ler_retrato(chave):
+    """Cópia rasa do último retrato publicado pela ingestão para ``chave``.
+
+    A sessão guarda o estado e a versão lidos para compartilhar os derivados
+    (tabelas e gráficos) com as outras sessões que leram a mesma versão.
+    """
+    acompanhar(chave)
+    estado = get_estado(chave)
+    retrato = estado.aguardar(INGESTAO_ESPERA_INICIAL)
+    erro = get_ingestao().erros.get(chave)
+    if erro:
+        st.error(f"Erro ao buscar dados: {erro}")
+    if retrato is None:
+        st.session_state.retrato = None
         return pd.DataFrame(), pd.DataFrame()
+    st.session_state.retrato = (estado, retrato.versao)
+    return retrato.dados.copy(deep=False), retrato.atividades.copy(deep=False)
 
 
-def processar_atividades(df):
-    atividades = []
-    current_activity = None
-
-    for i in range(len(df)):
-        if df.atividade.iloc[i] == 1 and current_activity is None:
-            current_activity = {"start": df.timestamp.iloc[i]}
-        elif df.atividade.iloc[i] == 0 and current_activity is not None:
-            current_activity["end"] = df.timestamp.iloc[i]
-            duration = (
-                current_activity["end"] - current_activity["start"]
-            ).total_seconds() / 60
-            if duration > 0:
-                atividades.append(
-                    {
-                        "Tarefa": "Atividade",
-                        "Início": current_activity["start"],
-                        "Fim": current_activity["end"],
-                        "Duração (min)": duration,
-                    }
-                )
-            current_activity = None
-
-    if current_activity is not None:
-        current_activity["end"] = df.timestamp.iloc[-1]
-        duration = (
-            current_activity["end"] - current_activity["start"]
-        ).total_seconds() / 60
-        atividades.append(
-            {
-                "Tarefa": "Atividade",
-                "Início": current_activity["start"],
-                "Fim": current_activity["end"],
-                "Duração (min)": duration,
-            }
-        )
+def compartilhado(nome, funcao, *parametros):
+    """``funcao()`` calculada uma vez por versão dos dados entre as sessões."""
+    lido = st.session_state.get("retrato")
+    if lido is None:
+        return funcao()
+    estado, versao = lido
+    return estado.derivado(versao, (nome, *parametros), funcao)
+
+
+def limites_efetivos():
+    """Limites de todos os pacientes com os específicos do paciente selecionado."""
+    return get_enfermaria().limites_paciente(paciente)
+
+
+def processar_anomalias(df):
+    with etapa("processar_anomalias", len(df)):
+        return explicar_anomalias(df, limites_efetivos())
+
+
+def generate_random_data(start, end):
+    """Leituras simuladas a cada minuto para preencher períodos históricos."""
+    try:
+        rng = np.random.default_rng()
+        anomaly_ratio = 0.3
+        activity_transition_prob = 0.2
+
+        start_dt = datetime.combine(start[0], start[1])
+        end_dt = datetime.combine(end[0], end[1])
 
-    return atividades
+        if end_dt < start_dt:
+            st.error("Data final deve ser após a data inicial.")
+            return pd.DataFrame(), pd.DataFrame()
 
+        delta = end_dt - start_dt
+        total_seconds = delta.total_seconds()
+        num_points = max(int(total_seconds // 60), 1)
+        timestamps = pd.date_range(start_dt, periods=num_points, freq="min")
+
+        df = gerar_sinais(rng, timestamps, anomaly_ratio, activity_transition_prob)
+
+        atividades = processar_atividades(df)
+        df_atividades = pd.DataFrame(atividades)
+        return df, df_atividades
 
-def self_generate_activity(length, transition_prob):
-    activity = np.zeros(length)
-    current_state = 0
-    for i in range(length):
-        if np.random.rand() < transition_prob:
-            current_state = 1 - current_state
-        activity[i] = current_state
-    return activity.astype(int)
+    except Exception as e:
+        st.error(f"Erro na geração de dados: {str(e)}")
+        return pd.DataFrame(), pd.DataFrame()
 
 
 def fetch_data():
     try:
         if tempo_real:
-            if paciente not in st.session_state.dados_acumulados:
-                combined_df, combined_ativ = generate_random_data(real_time=True)
-            else:
-                old_df, old_ativ = st.session_state.dados_acumulados[paciente]
-                ultimo_ts = old_df["timestamp"].sort_values().iloc[-1]
-                df, df_atv = generate_random_data(real_time=True, start=ultimo_ts)
-                combined_df = pd.concat([old_df, df]).reset_index(drop=True)
-                combined_ativ = pd.concat([old_ativ, df_atv]).reset_index(drop=True)
-
-            combined_df = detectar_anomalias(combined_df)
-            st.session_state.dados_acumulados[paciente] = (combined_df, combined_ativ)
-            return combined_df, combined_ativ
+            return ler_retrato(paciente)
         else:
-            df_historico, df_ativ_historico = generate_random_data(
-                real_time=False,
-                start=(data_inicio, hora_inicio),
-                end=(data_fim, hora_fim),
-            )
-            return df_historico, df_ativ_historico
+            st.session_state.retrato = None
+            inicio = datetime.combine(data_inicio, hora_inicio)
+            fim = datetime.combine(data_fim, hora_fim)
+            if fim < inicio:
+                st.error("Data final deve ser após a data inicial.")
+                return pd.DataFrame(), pd.DataFrame()
+
+            agregados = get_agregados(paciente)
+            simulados = get_agregados_simulados(paciente)
+            with get_estado(paciente).lock:
+                with etapa("completar_historico"):
+                    completar_horas_faltantes(
+                        paciente, agregados, simulados, inicio, fim
+                    )
+                with etapa("consultar_agregados") as medicao:
+                    df_historico = agregados.consultar(
+                        inicio, fim, pontos=GRAFICO_LARGURA // 2, extras=[simulados]
+                    )
+                    medicao.linhas = len(df_historico)
+            return df_historico, processar_atividades(df_historico)
 
     except Exception as e:
         st.error(f"Erro ao buscar dados: {str(e)}")
         return pd.DataFrame(), pd.DataFrame()
 
 
-def get_api_data(method: str):
-    login_data = requests.post(
-        "https://api-maloca.ed-henrique.com/api/v2/login",
-        headers={
-            "Content-Type": "application/json",
-        },
-        json={
-            "username": "Gabriel",
-            "password": "1234",
-        },
-    ).json()
+def horas_faltantes(agregados, inicio, fim):
+    # As leituras têm fuso (esquema dos sinais); o período escolhido é local
+    fim = localizar(pd.Timestamp(fim))
+    horas = pd.date_range(localizar(pd.Timestamp(inicio).floor("h")), fim, freq="h")
+    return horas.difference(agregados.chaves("1h", horas[0], fim))
 
-    token = login_data["token"]
 
-    raw = requests.post(
-        f"https://api-maloca.ed-henrique.com/api/v2/fetch/{method}",
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {token}",
-        },
-        json={
-            "queries": {},
-        },
-    ).json()
+def completar_horas_faltantes(chave, agregados, simulados, inicio, fim):
+    """Agrega as horas do período ainda sem dados.
 
-    return raw
+    Primeiro com as leituras gravadas no armazém, nos agregados da ingestão;
+    o que ainda faltar é simulado e detectado em ``simulados``, da sessão,
+    para que leituras reais dessas horas chegando depois não se somem a
+    dados simulados (e sem gravar, por não serem leituras reais).
+    """
+    faltantes = horas_faltantes(agregados, inicio, fim).intersection(
+        horas_faltantes(simulados, inicio, fim)
+    )
+    if faltantes.empty:
+        return
+
+    gravados = get_armazem().ler(
+        nome_armazem(chave),
+        faltantes[0],
+        faltantes[-1] + pd.Timedelta(hours=1) - pd.Timedelta(1, "ns"),
+        colunas=COLUNAS_HISTORICO,
+    )
+    if not gravados.empty:
+        gravados = gravados[gravados["timestamp"].dt.floor("h").isin(faltantes)]
+        agregados.adicionar(gravados)
+        faltantes = faltantes.intersection(horas_faltantes(agregados, inicio, fim))
+        if faltantes.empty:
+            return
+
+    # Horas faltantes consecutivas são geradas num único bloco; os blocos são
+    # detectados em paralelo no pool de treino
+    quebras = np.flatnonzero(np.diff(faltantes.asi8) != pd.Timedelta(hours=1).value)
+    lotes = []
+    for bloco in np.split(faltantes, quebras + 1):
+        inicio_bloco = bloco[0].to_pydatetime()
+        fim_bloco = (bloco[-1] + pd.Timedelta(hours=1)).to_pydatetime()
+        df, _ = generate_random_data(
+            start=(inicio_bloco.date(), inicio_bloco.time()),
+            end=(fim_bloco.date(), fim_bloco.time()),
+        )
+        if not df.empty:
+            lotes.append(df)
+    for df in detectar_anomalias(lotes):
+        simulados.adicionar(df)
 
 
-def fetch_data_from_api():
-    try:
-        if tempo_real:
-            bpm_raw = get_api_data("heartRate")
-            bpm = []
-            for dados in [x["data"]["samples"] for x in bpm_raw]:
-                for dado in dados:
-                    bpm.append((dado["beatsPerMinute"], dado["time"]))
-            df_bpm = pd.DataFrame(bpm, columns=["batimento_cardiaco", "timestamp"])
-
-            # glicose_raw = get_api_data("bloodGlucose")
-            glicose = []
-            df_glicose = pd.DataFrame(glicose, columns=["timestamp", "glicose"])
-
-            oxigenio_raw = get_api_data("oxygenSaturation")
-            oxigenio = []
-            for dados in oxigenio_raw:
-                oxigenio.append((dados["data"]["percentage"], dados["start"]))
-            df_oxigenio = pd.DataFrame(oxigenio, columns=["oxigenio", "timestamp"])
-
-            pressao_raw = get_api_data("bloodPressure")
-            pressao = []
-            for dados in pressao_raw:
-                pressao.append(
-                    (
-                        dados["data"]["diastolic"]["inMillimetersOfMercury"],
-                        dados["data"]["systolic"]["inMillimetersOfMercury"],
-                        dados["start"],
-                    )
-                )
-            df_pressao = pd.DataFrame(
-                pressao,
-                columns=["pressao_sistolica", "pressao_diastolica", "timestamp"],
-            )
+@st.cache_resource
+def get_cliente_api():
+    from psm.hcgateway import ClienteHCGateway
 
-            # temperatura_raw = get_api_data("bodyTemperature")
-            temperatura = []
-            df_temperatura = pd.DataFrame(
-                temperatura, columns=["timestamp", "temperatura"]
-            )
+    return ClienteHCGateway(API_URL, API_USUARIO, API_SENHA)
 
-            exercicio_raw = get_api_data("exerciseSession")
-            exercicio = []
-            for dados in exercicio_raw:
-                exercicio.append(
-                    (
-                        "Atividade",
-                        dados["start"],
-                        dados["end"],
-                        (
-                            datetime.strptime(dados["end"], "%Y-%m-%dT%H:%M:%S.%f%z")
-                            - datetime.strptime(
-                                dados["start"], "%Y-%m-%dT%H:%M:%S.%f%z"
-                            )
-                        ).seconds
-                        / 60,
-                    )
-                )
 
-            combined_ativ = pd.DataFrame(
-                exercicio, columns=["Tarefa", "Início", "Fim", "Duração (min)"]
-            )
+def fetch_data_from_api():
+    if tempo_real:
+        return ler_retrato((paciente, "api"))
 
-            dfs = [df_bpm, df_glicose, df_oxigenio, df_pressao, df_temperatura]
-            combined_df = reduce(
-                lambda left, right: pd.merge(left, right, on="timestamp", how="outer"),
-                dfs,
-            )
-            
-            combined_df["timestamp"] = pd.to_datetime(combined_df["timestamp"], format="mixed")
-            combined_df.sort_values("timestamp", inplace=True)
-            combined_df["atividade"] = 0
-            for i in exercicio:
-                _, start, end, _ = i
-                combined_df.loc[
-                    (
-                        combined_df["timestamp"]
-                        >= pd.to_datetime(
-                            datetime.strptime(start, "%Y-%m-%dT%H:%M:%S.%f%z"),
-                        )
-                    )
-                    & (
-                        combined_df["timestamp"]
-                        <= pd.to_datetime(
-                            datetime.strptime(end, "%Y-%m-%dT%H:%M:%S.%f%z"),
-                        )
-                    ),
-                    "atividade",
-                ] = 1
-            combined_df["dispositivo_estado"] = "Ativo"
-            combined_df = detectar_anomalias(combined_df)
-            return combined_df, combined_ativ
-
-        return pd.DataFrame(), pd.DataFrame()
-    except Exception as e:
-        st.error(f"Erro ao buscar dados: {str(e)}")
-        return pd.DataFrame(), pd.DataFrame()
+    st.session_state.retrato = None
+    return pd.DataFrame(), pd.DataFrame()
 
 
 def check_alertas(df):
-    alertas = []
-    if df.empty:
-        return alertas
-    ultimo = df.iloc[-1]
-
-    for parametro, atributos in st.session_state.limites.items():
-        valor = ultimo[parametro]
-        if valor < atributos["min"]:
-            alertas.append(
-                f"{parametro.capitalize()} abaixo do limite: {valor:.2f} (Mín: {atributos['min']})"
-            )
-        elif valor > atributos["max"]:
-            alertas.append(
-                f"{parametro.capitalize()} acima do limite: {valor:.2f} (Máx: {atributos['max']})"
-            )
-
-    return alertas
+    with etapa("check_alertas", len(df)):
+        return verificar_alertas(df, limites_efetivos())
 
 
 with st.sidebar:
@@ -560,6 +595,10 @@ with st.sidebar:
                 if st.form_submit_button("✅ Adicionar"):
                     if novo_paciente.strip():
                         st.session_state.PACIENTES.append(novo_paciente.strip())
+                        if id_dispositivo.strip():
+                            st.session_state.DISPOSITIVOS[novo_paciente.strip()] = (
+                                id_dispositivo.strip()
+                            )
                         del st.session_state.adicionando_paciente
                         st.rerun()
                 if st.form_submit_button("❌ Cancelar"):
@@ -569,6 +608,7 @@ with st.sidebar:
     paciente = st.selectbox("👨 Paciente", st.session_state.PACIENTES)
     tempo_real = st.checkbox("⏱️ Monitoramento em Tempo Real", True)
     api = st.checkbox("🌐 Coletar dados da API", False)
+    visao_enfermaria = st.checkbox("🏥 Visão da Enfermaria", False)
 
     if not tempo_real:
         st.subheader("📅 Período Histórico")
@@ -587,299 +627,519 @@ def render_visao_geral(df):
         "🌡️ Temperatura": f"{df['temperatura'].iloc[-1]:.1f}°C"
         if not df.empty
         else "N/A",
-        "💓 Batimento": f"{df['batimento_cardiaco'].iloc[-1]} BPM"
+        "💓 Batimento": f"{df['batimento_cardiaco'].iloc[-1]:.0f} BPM"
+        if not df.empty
+        else "N/A",
+        "🩸 Pressão": f"{df['pressao_sistolica'].iloc[-1]:.0f}/{df['pressao_diastolica'].iloc[-1]:.0f} mmHg"
         if not df.empty
         else "N/A",
-        "🩸 Pressão": f"{df['pressao_sistolica'].iloc[-1]}/{df['pressao_diastolica'].iloc[-1]} mmHg"
+        "🩸 Glicose": f"{df['glicose'].iloc[-1]:.0f} mg/dL" if not df.empty else "N/A",
+        "💨 Oxigênio": f"{df['oxigenio'].iloc[-1]:.0f}% SpO2"
         if not df.empty
         else "N/A",
-        "🩸 Glicose": f"{df['glicose'].iloc[-1]} mg/dL" if not df.empty else "N/A",
-        "💨 Oxigênio": f"{df['oxigenio'].iloc[-1]}% SpO2" if not df.empty else "N/A",
     }
 
     for (nome, valor), col in zip(metricas.items(), cols):
         col.metric(nome, valor)
 
 
-def create_vital_chart(df, df_atividades):
-    fig = make_subplots(
-        rows=3,
-        cols=2,
-        subplot_titles=(
-            "Temperatura Corporal",
-            "Batimento Cardíaco",
-            "Oxigênio no Sangue",
-            "Pressão Arterial",
-            "Níveis de Glicose",
-            "Atividades Físicas",
-        ),
-        vertical_spacing=0.25,
-    )
-
-    if not df.empty:
-        fig.add_trace(
-            go.Scatter(
-                x=df["timestamp"],
-                y=df["temperatura"],
-                name="Temperatura",
-                line=dict(color=COLOR_PALETTE[0], width=2),
-            ),
-            row=1,
-            col=1,
+# Atualizados sem rerun do app inteiro enquanto o monitoramento é em tempo real
+ATUALIZACAO_FRAGMENTOS = ATUALIZACAO_INTERVALO if tempo_real else None
+
+
+@st.fragment(run_every=ATUALIZACAO_FRAGMENTOS)
+def render_desempenho():
+    metricas = st.session_state.metricas
+    if not metricas.habilitado:
+        return
+
+    ingestao = get_ingestao().metricas
+    with st.expander("⏱️ Desempenho"):
+        for titulo, resumo in (
+            ("Painel (esta sessão)", metricas.resumo()),
+            ("Ingestão (segundo plano)", ingestao.resumo()),
+        ):
+            st.caption(titulo)
+            if resumo.empty:
+                st.caption("Nenhuma medição ainda")
+                continue
+            st.dataframe(
+                resumo,
+                column_config={
+                    "p50 (ms)": st.column_config.NumberColumn(format="%.1f"),
+                    "p95 (ms)": st.column_config.NumberColumn(format="%.1f"),
+                    "Último (ms)": st.column_config.NumberColumn(format="%.1f"),
+                },
+                hide_index=True,
+                use_container_width=True,
+            )
+        cache = get_cache()
+        st.caption(
+            f"Cache compartilhado: {len(cache)} paciente(s), "
+            f"{cache.nbytes / 1024**2:.1f} MiB; "
+            f"ingestão acompanhando {len(get_ingestao().pacientes())}"
         )
-
-        fig.add_trace(
-            go.Scatter(
-                x=df["timestamp"],
-                y=df["batimento_cardiaco"],
-                name="BPM",
-                line=dict(color=COLOR_PALETTE[1], width=2),
-            ),
-            row=1,
-            col=2,
+        memoria = cache.memoria()
+        if not memoria.empty:
+            st.caption("Memória por paciente")
+            st.dataframe(
+                memoria,
+                column_config={
+                    "Memória (KiB)": st.column_config.NumberColumn(format="%.1f"),
+                    "Bytes/linha": st.column_config.NumberColumn(format="%.0f"),
+                },
+                hide_index=True,
+                use_container_width=True,
+            )
+        agendador = get_agendador_treinos()
+        st.caption(
+            f"Treinos de detectores: {agendador.pendentes} em andamento, "
+            f"{agendador.concluidos} concluídos ({agendador.processos} processo(s))"
         )
+        motor = get_motor_alertas()
+        st.caption(f"Alertas publicados: {len(get_fila_alertas())}")
+        if motor.erro:
+            st.warning(f"Erro ao publicar alertas: {motor.erro}")
+        for destino in motor.destinos:
+            if isinstance(destino, PublicadorMQTT):
+                st.caption(
+                    f"MQTT: {destino.enviados} enviados, {destino.pendentes} na fila, "
+                    f"{destino.descartados} descartados"
+                )
+                if destino.erro:
+                    st.warning(f"Broker MQTT indisponível: {destino.erro}")
 
-        fig.add_trace(
-            go.Scatter(
-                x=df["timestamp"],
-                y=df["oxigenio"],
-                name="SpO2",
-                line=dict(color=COLOR_PALETTE[2], width=2),
-            ),
-            row=2,
-            col=1,
+    try:
+        if METRICAS_PROMETHEUS:
+            metricas.exportar_prometheus(METRICAS_PROMETHEUS)
+        if METRICAS_PROMETHEUS_INGESTAO:
+            ingestao.exportar_prometheus(METRICAS_PROMETHEUS_INGESTAO)
+        if METRICAS_JSONL:
+            metricas.exportar_jsonl(METRICAS_JSONL)
+    except OSError as e:
+        st.warning(f"Erro ao exportar métricas: {str(e)}")
+
+
+def render_exportacao():
+    armazem = get_armazem()
+    nomes = {
+        nome_armazem(chave)
+        for p in st.session_state.PACIENTES
+        for chave in (p, (p, "api"))
+    }
+    disponiveis = [nome for nome in armazem.pacientes() if nome in nomes]
+
+    with st.expander("📥 Exportar Histórico"):
+        if not EXPORTACAO_URL:
+            st.caption(
+                "Exportação requer o serviço de telemetria com token "
+                "(python -m psm.telemetria servidor --token ...) e "
+                "EXPORTACAO_URL configurada"
+            )
+            return
+        if not disponiveis:
+            st.caption("Nenhum histórico gravado ainda")
+            return
+        with st.form("exportacao_form"):
+            pacientes = st.multiselect(
+                "Pacientes",
+                disponiveis,
+                default=[n for n in disponiveis if n == nome_armazem(paciente)],
+            )
+            hoje = datetime.now().date()
+            periodo = st.date_input(
+                "Período",
+                (hoje - timedelta(days=EXPORTACAO_DIAS_PADRAO), hoje),
+            )
+            colunas = st.multiselect(
+                "Colunas",
+                [c for c in COLUNAS_HISTORICO if c != "timestamp"],
+                default=["temperatura", "batimento_cardiaco"],
+            )
+            resolucao = st.selectbox("Resolução", ["Leituras", *RESOLUCOES])
+            formato = st.radio("Formato", list(FORMATOS), horizontal=True)
+            gerar = st.form_submit_button("📥 Exportar")
+
+        if not gerar or not pacientes or len(periodo) != 2:
+            return
+        inicio = datetime.combine(periodo[0], datetime.min.time())
+        fim = datetime.combine(periodo[1], datetime.max.time())
+        parametros = {
+            "paciente": pacientes,
+            "inicio": inicio.isoformat(),
+            "fim": fim.isoformat(),
+            "colunas": ",".join(colunas),
+            "formato": formato,
+        }
+        if resolucao != "Leituras":
+            parametros["resolucao"] = resolucao
+        # O navegador baixa direto do serviço com um link assinado
+        if EXPORTACAO_TOKEN:
+            parametros = assinar(
+                parametros, EXPORTACAO_TOKEN, validade=EXPORTACAO_VALIDADE_LINK
+            )
+        st.link_button(
+            "⬇️ Baixar", f"{EXPORTACAO_URL}?{urlencode(parametros, doseq=True)}"
         )
 
-        fig.add_trace(
-            go.Scatter(
-                x=df["timestamp"],
-                y=df["pressao_sistolica"],
-                name="Sistólica",
-                line=dict(color=COLOR_PALETTE[3], width=2),
-            ),
-            row=2,
-            col=2,
-        )
 
-        fig.add_trace(
-            go.Scatter(
-                x=df["timestamp"],
-                y=df["pressao_diastolica"],
-                name="Diastólica",
-                line=dict(color=COLOR_PALETTE[0], width=2),
-            ),
-            row=2,
-            col=2,
+ROTULOS_ENFERMARIA = {
+    "temperatura": "Temperatura (°C)",
+    "batimento_cardiaco": "Batimento (BPM)",
+    "pressao_sistolica": "Pressão Sistólica (mmHg)",
+    "pressao_diastolica": "Pressão Diastólica (mmHg)",
+    "glicose": "Glicose (mg/dL)",
+    "oxigenio": "Oxigênio (SpO2)",
+}
+CORES_ENFERMARIA = {1: "background-color: #f8d7da", -1: "background-color: #cfe2ff"}
+
+
+def grade_enfermaria(grade):
+    """Grade de triagem para exibição, com os vitais fora dos limites coloridos."""
+    vitais = list(ROTULOS_ENFERMARIA)
+    tabela = pd.DataFrame(
+        {
+            "Paciente": grade["chave"].map(nome_armazem),
+            "Alertas": grade["violacoes"],
+            "Gravidade": grade["gravidade"],
+            **{ROTULOS_ENFERMARIA[v]: grade[v] for v in vitais},
+            "Atualizado em": grade["atualizado_em"],
+        }
+    )
+    status = grade[[f"status_{v}" for v in vitais]].to_numpy()
+    cores = np.select(
+        [status == 1, status == -1], [CORES_ENFERMARIA[1], CORES_ENFERMARIA[-1]], ""
+    )
+
+    def colorir(_):
+        estilos = pd.DataFrame("", index=tabela.index, columns=tabela.columns)
+        estilos[[ROTULOS_ENFERMARIA[v] for v in vitais]] = cores
+        return estilos
+
+    return tabela.style.apply(colorir, axis=None)
+
+
+@st.fragment(run_every=ATUALIZACAO_FRAGMENTOS)
+def render_enfermaria():
+    try:
+        inicio_painel = time.perf_counter()
+        st.header("🏥 Visão da Enfermaria")
+
+        with etapa("avaliar_enfermaria") as medicao:
+            grade = get_enfermaria().avaliar()
+            medicao.linhas = len(grade)
+
+        if grade.empty:
+            st.warning("Nenhum paciente com leituras ainda")
+            return
+
+        cols = st.columns(3)
+        cols[0].metric("👥 Pacientes", len(grade))
+        cols[1].metric("🚨 Com alertas", int((grade["violacoes"] > 0).sum()))
+        cols[2].metric("⚠️ Parâmetros fora do limite", int(grade["violacoes"].sum()))
+
+        st.dataframe(
+            grade_enfermaria(grade),
+            column_config={
+                "Gravidade": st.column_config.ProgressColumn(
+                    format="%.2f",
+                    min_value=0.0,
+                    max_value=max(float(grade["gravidade"].max()), 1.0),
+                ),
+                **{
+                    rotulo: st.column_config.NumberColumn(format="%.1f")
+                    for rotulo in ROTULOS_ENFERMARIA.values()
+                },
+                "Atualizado em": st.column_config.DatetimeColumn(
+                    format="DD/MM HH:mm:ss"
+                ),
+            },
+            hide_index=True,
+            use_container_width=True,
+        )
+        st.caption(
+            "Ordenado por número de alertas e gravidade (distância fora da faixa). "
+            "Vermelho: acima do máximo; azul: abaixo do mínimo."
         )
 
-        fig.add_trace(
-            go.Scatter(
-                x=df["timestamp"],
-                y=df["glicose"],
-                name="Glicose",
-                line=dict(color=COLOR_PALETTE[2], width=2),
-            ),
-            row=3,
-            col=1,
+        st.session_state.metricas.registrar(
+            "painel_enfermaria", time.perf_counter() - inicio_painel, len(grade)
         )
+    except Exception as e:
+        st.error(f"Erro crítico: {str(e)}")
+
 
-    if not df_atividades.empty:
-        for idx, row in df_atividades.iterrows():
-            fig.add_trace(
-                go.Scatter(
-                    x=[row["Início"], row["Fim"]],
-                    y=[row["Tarefa"], row["Tarefa"]],
-                    mode="lines",
-                    line=dict(color=COLOR_PALETTE[1], width=20),
-                    hoverinfo="text",
-                    text=[
-                        f"Duração: {row['Duração (min)']:.1f} minutos<br>Início: {row['Início']}<br>Fim: {row['Fim']}"
+def render_alertas(alertas):
+    with st.container():
+        st.subheader("🚨 Alertas em Tempo Real")
+        if alertas:
+            for alerta in alertas:
+                st.error(alerta)
+        else:
+            st.success("Todos os parâmetros dentro da normalidade", icon="✅")
+
+
+def render_eventos_alerta(chave):
+    eventos = get_fila_alertas().recentes(chave, n=50)
+    with st.expander(f"🔔 Alertas publicados ({len(eventos)})"):
+        if not eventos:
+            st.caption("Nenhum alerta publicado para este paciente")
+            return
+        st.dataframe(
+            pd.DataFrame(
+                {
+                    "Data/Hora": [e.timestamp for e in eventos],
+                    "Evento": [
+                        "🚨 Disparado" if e.estado == "disparado" else "✅ Resolvido"
+                        for e in eventos
                     ],
-                    name="",
-                ),
-                row=3,
-                col=2,
-            )
-    else:
-        fig.add_annotation(
-            text="Nenhuma atividade física registrada",
-            xref="paper",
-            yref="paper",
-            x=0.5,
-            y=0.5,
-            showarrow=False,
-            row=3,
-            col=2,
+                    "Mensagem": [e.mensagem for e in eventos],
+                    "Latência (s)": [e.latencia for e in eventos],
+                }
+            ),
+            column_config={
+                "Latência (s)": st.column_config.NumberColumn(format="%.2f"),
+            },
+            hide_index=True,
+            use_container_width=True,
         )
 
-    fig.update_layout(height=600, template="plotly_white", showlegend=False)
-    return fig
 
+def render_config_deteccao(chave):
+    st.header("🧪 Detecção de Anomalias")
+    configuracao = get_configuracao_triagem()
+    modos = list(MODOS_DETECCAO)
 
-def create_anomaly_chart(df):
-    fig = go.Figure()
+    with st.form("deteccao_form"):
+        modo = st.radio(
+            "Modo",
+            modos,
+            index=modos.index(configuracao.modo),
+            format_func=MODOS_DETECCAO.get,
+            horizontal=True,
+        )
+        col1, col2 = st.columns(2)
+        limiar_z = col1.number_input(
+            "Limiar do z-score", min_value=0.5, value=float(configuracao.limiar_z)
+        )
+        limiar_ewma = col2.number_input(
+            "Limiar da EWMA (desvios)",
+            min_value=0.5,
+            value=float(configuracao.limiar_ewma),
+        )
+        cusum_h = col1.number_input(
+            "Limiar do CUSUM (h)", min_value=0.5, value=float(configuracao.cusum_h)
+        )
+        contexto = col2.number_input(
+            "Amostras de contexto", min_value=0, value=int(configuracao.contexto)
+        )
+        if st.form_submit_button("💾 Salvar Detecção"):
+            configuracao.atualizar(
+                modo=modo,
+                limiar_z=limiar_z,
+                limiar_ewma=limiar_ewma,
+                cusum_h=cusum_h,
+                contexto=int(contexto),
+            )
+            st.success("Detecção atualizada para todos os pacientes")
+
+    ingestor = get_estado(chave).componente("ingestor") if tempo_real else None
+    if ingestor is None:
+        st.caption("Taxas disponíveis no monitoramento em tempo real")
+        return
+    taxas = ingestor.detector.estatisticas()
+    if "amostras" not in taxas:
+        return
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Amostras avaliadas", f"{taxas['amostras']:,}")
+    col2.metric("Candidatas (camada 1)", f"{taxas['candidatas']:.1%}")
+    col3.metric("Pontuadas pelos modelos", f"{taxas['pontuadas']:,}")
+    col4.metric("Confirmadas (camada 2)", f"{taxas['confirmadas']:.1%}")
+    st.caption(
+        "Disparos por detector: "
+        + ", ".join(
+            f"{nome} {taxas[nome]:.1%}" for nome in ("zscore", "ewma", "cusum")
+        )
+        + f"; anomalias dos modelos fora das candidatas (modo completo): "
+        f"{taxas['perdidas']}"
+    )
 
-    if not df.empty and "Motivo" in df.columns:
-        # Convert timestamp to datetime if not already
-        df["Data/Hora"] = pd.to_datetime(df["Data/Hora"], dayfirst=True)
 
-        # Split and explode motives
-        df_exp = df.copy()
-        df_exp["Motivo"] = df_exp["Motivo"].str.split(", ")
-        df_exp = df_exp.explode("Motivo").reset_index(drop=True)
+@st.fragment(run_every=ATUALIZACAO_FRAGMENTOS)
+def render_painel():
+    try:
+        inicio_painel = time.perf_counter()
 
-        # Clean motives and handle empty values
-        df_exp["Motivo"] = (
-            df_exp["Motivo"].fillna("No Anomaly").replace("", "No Anomaly")
-        )
+        with etapa("fetch") as medicao:
+            if api:
+                df, df_atividades = fetch_data_from_api()
+            else:
+                df, df_atividades = fetch_data()
+            medicao.linhas = len(df)
 
-        # Filter out non-anomaly entries if needed
-        df_exp = df_exp[df_exp["Motivo"] != "No Anomaly"]
+        alertas = check_alertas(df)
 
-        # Create proper counts using EXPLODED dataframe
-        grouped = (
-            df_exp.groupby(["Data/Hora", "Motivo"])
-            .size()
-            .unstack(fill_value=0)
-            .reset_index()
-            .melt(id_vars="Data/Hora", value_name="count", var_name="motive")
-        )
+        if df.empty:
+            st.warning("Nenhum dado disponível para o período selecionado")
+        else:
+            render_visao_geral(df)
+            render_alertas(alertas)
+            if tempo_real:
+                render_eventos_alerta((paciente, "api") if api else paciente)
 
-        # Create color mapping
-        motives = grouped["motive"].unique()
-        color_map = {
-            m: COLOR_PALETTE[i % len(COLOR_PALETTE)] for i, m in enumerate(motives)
-        }
+            st.subheader("📈 Visualização de Dados")
+            tab1, tab2, tab3 = st.tabs(["Dados de Saúde", "Anomalias", "Configurações"])
 
-        # Add stacked bars
-        for motive in motives:
-            motive_df = grouped[grouped["motive"] == motive]
-            fig.add_trace(
-                go.Bar(
-                    x=motive_df["Data/Hora"],
-                    y=motive_df["count"],
-                    name=motive,
-                    marker_color=color_map[motive],
-                )
-            )
+            with tab1:
 
-        # Configure layout
-        fig.update_layout(
-            barmode="stack",
-            height=400,
-            template="plotly_white",
-            xaxis_title="Timestamp",
-            yaxis_title="Total Anomalies",
-            hovermode="x unified",
-            legend_title="Anomaly Motive",
-            xaxis=dict(type="date", tickformat="%Y-%m-%d %H:%M"),
-        )
+                def grafico_vitais():
+                    from psm.graficos import create_vital_chart
 
-    return fig
+                    with etapa("create_vital_chart", len(df)):
+                        return create_vital_chart(
+                            df,
+                            df_atividades,
+                            largura=GRAFICO_LARGURA,
+                            metodo=GRAFICO_REDUCAO,
+                        )
 
+                fig_vitais = compartilhado("grafico_vitais", grafico_vitais)
+                st.plotly_chart(fig_vitais, use_container_width=True)
 
-def render_alertas(alertas):
-    with st.container():
-        st.subheader("🚨 Alertas em Tempo Real")
-        if alertas:
-            for alerta in alertas:
-                st.error(alerta)
-        else:
-            st.success("Todos os parâmetros dentro da normalidade", icon="✅")
+            with tab2:
+                resolucao = df.attrs.get("resolucao", "1min")
+                if resolucao != "1min":
+                    from psm.graficos import create_anomaly_count_chart
 
+                    # Intervalos agregados: só as contagens de anomalias por intervalo
+                    st.plotly_chart(
+                        create_anomaly_count_chart(df), use_container_width=True
+                    )
+                    st.info(
+                        f"Período exibido em intervalos de {resolucao}. "
+                        "Reduza o período para ver as anomalias individuais."
+                    )
+                else:
 
-# Execução Principal
-try:
-    if "current_paciente" not in st.session_state:
-        st.session_state.current_paciente = paciente
+                    def anomalias():
+                        from psm.graficos import create_anomaly_chart
 
-    if st.session_state.current_paciente != paciente:
-        if paciente in st.session_state.dados_acumulados:
-            del st.session_state.dados_acumulados[paciente]
-        st.session_state.current_paciente = paciente
+                        df_anomalias = processar_anomalias(df)
+                        with etapa("create_anomaly_chart", len(df_anomalias)):
+                            return df_anomalias, create_anomaly_chart(df_anomalias)
 
-    if api:
-        df, df_atividades = fetch_data_from_api()
-    else:
-        df, df_atividades = fetch_data()
+                    df_anomalias, fig_anomalias = compartilhado(
+                        "anomalias",
+                        anomalias,
+                        json.dumps(limites_efetivos(), sort_keys=True),
+                    )
+                    st.plotly_chart(fig_anomalias, use_container_width=True)
 
-    alertas = check_alertas(df)
+                    if not df_anomalias.empty:
+                        df_anomalias = df_anomalias.sort_values(
+                            by=["Data/Hora"], ascending=False
+                        )
+                        st.subheader("📋 Detalhes das Anomalias Detectadas")
+                        st.dataframe(
+                            df_anomalias,
+                            column_config={
+                                "Data/Hora": "Data/Hora",
+                                "Batimento Cardíaco (BPM)": st.column_config.NumberColumn(
+                                    format="%d"
+                                ),
+                                "Temperatura (°C)": st.column_config.NumberColumn(
+                                    format="%.1f"
+                                ),
+                                "Pressão Sistólica (mmHg)": st.column_config.NumberColumn(
+                                    format="%.1f"
+                                ),
+                                "Pressão Diastólica (mmHg)": st.column_config.NumberColumn(
+                                    format="%.1f"
+                                ),
+                                "Glicose (mg/dL)": st.column_config.NumberColumn(
+                                    format="%.1f"
+                                ),
+                                "Oxigênio (SpO2)": st.column_config.NumberColumn(
+                                    format="%.1f"
+                                ),
+                                "Modelo Detectado": "Modelo",
+                                "Motivo": "Motivo",
+                            },
+                            hide_index=True,
+                            use_container_width=True,
+                        )
+                    else:
+                        st.info("Nenhuma anomalia detectada no período selecionado")
+
+            with tab3:
+                st.header("📊 Configurar Limites")
+                enfermaria = get_enfermaria()
+                especificos = enfermaria.tem_limites(paciente)
+
+                with st.form("limites_form"):
+                    escopo = st.radio(
+                        "Aplicar a",
+                        ["Todos os pacientes", f"Somente {paciente}"],
+                        index=1 if especificos else 0,
+                        horizontal=True,
+                    )
+                    novos_limites = {}
+                    for param, attrs in limites_efetivos().items():
+                        col1, col2 = st.columns(2)
+                        novo_min = col1.number_input(f"Mín {param}", value=attrs["min"])
+                        novo_max = col2.number_input(f"Máx {param}", value=attrs["max"])
+                        novos_limites[param] = {
+                            "min": novo_min,
+                            "max": novo_max,
+                            "msg_min": attrs["msg_min"],
+                            "msg_max": attrs["msg_max"],
+                        }
 
-    if df.empty:
-        st.warning("Nenhum dado disponível para o período selecionado")
-    else:
-        render_visao_geral(df)
-        render_alertas(alertas)
+                    if st.form_submit_button("💾 Salvar Limites"):
+                        if escopo == "Todos os pacientes":
+                            enfermaria.definir_padrao(novos_limites)
+                        else:
+                            enfermaria.definir_limites(
+                                paciente,
+                                {
+                                    param: {"min": attrs["min"], "max": attrs["max"]}
+                                    for param, attrs in novos_limites.items()
+                                },
+                            )
+                        st.success("Limites atualizados com sucesso!")
 
-        st.subheader("📈 Visualização de Dados")
-        tab1, tab2, tab3 = st.tabs(["Dados de Saúde", "Anomalias", "Configurações"])
+                if especificos:
+                    st.caption(
+                        f"{paciente} tem limites específicos, usados também na "
+                        "visão da enfermaria."
+                    )
+                    if st.button("↩️ Voltar aos limites de todos os pacientes"):
+                        enfermaria.remover_limites(paciente)
+                        st.rerun()
 
-        with tab1:
-            st.plotly_chart(
-                create_vital_chart(df, df_atividades), use_container_width=True
-            )
+                render_config_deteccao((paciente, "api") if api else paciente)
 
-        with tab2:
-            df_anomalias = processar_anomalias(df)
-            st.plotly_chart(
-                create_anomaly_chart(df_anomalias), use_container_width=True
-            )
+        st.session_state.metricas.registrar(
+            "painel", time.perf_counter() - inicio_painel, len(df)
+        )
+    except Exception as e:
+        st.error(f"Erro crítico: {str(e)}")
 
-            if not df_anomalias.empty:
-                df_anomalias = df_anomalias.sort_values(
-                    by=["Data/Hora"], ascending=False
-                )
-                st.subheader("📋 Detalhes das Anomalias Detectadas")
-                st.dataframe(
-                    df_anomalias,
-                    column_config={
-                        "Data/Hora": "Data/Hora",
-                        "Batimento Cardíaco (BPM)": st.column_config.NumberColumn(
-                            format="%d"
-                        ),
-                        "Temperatura (°C)": st.column_config.NumberColumn(
-                            format="%.1f"
-                        ),
-                        "Pressão Sistólica (mmHg)": st.column_config.NumberColumn(
-                            format="%.1f"
-                        ),
-                        "Pressão Diastólica (mmHg)": st.column_config.NumberColumn(
-                            format="%.1f"
-                        ),
-                        "Glicose (mg/dL)": st.column_config.NumberColumn(format="%.1f"),
-                        "Oxigênio (SpO2)": st.column_config.NumberColumn(format="%.1f"),
-                        "Modelo Detectado": "Modelo",
-                        "Motivo": "Motivo",
-                    },
-                    hide_index=True,
-                    use_container_width=True,
-                )
-            else:
-                st.info("Nenhuma anomalia detectada no período selecionado")
-
-        with tab3:
-            st.header("📊 Configurar Limites")
-
-            with st.form("limites_form"):
-                novos_limites = {}
-                for param, attrs in st.session_state.limites.items():
-                    col1, col2 = st.columns(2)
-                    novo_min = col1.number_input(f"Mín {param}", value=attrs["min"])
-                    novo_max = col2.number_input(f"Máx {param}", value=attrs["max"])
-                    novos_limites[param] = {
-                        "min": novo_min,
-                        "max": novo_max,
-                        "msg_min": attrs["msg_min"],
-                        "msg_max": attrs["msg_max"],
-                    }
-
-                if st.form_submit_button("💾 Salvar Limites"):
-                    st.session_state.limites = novos_limites
-                    st.success("Limites atualizados com sucesso!")
 
+# Execução Principal
+try:
+    # Todos os pacientes da lista seguem sendo ingeridos em segundo plano
     if tempo_real:
-        time.sleep(5)
-        st.rerun()
+        for p in st.session_state.PACIENTES:
+            acompanhar(p)
+
+    if visao_enfermaria:
+        render_enfermaria()
+    else:
+        render_painel()
+    with st.sidebar:
+        render_exportacao()
+        render_desempenho()
 
 except Exception as e:
     st.error(f"Erro crítico: {str(e)}")